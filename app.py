@@ -2,9 +2,15 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-from windows import SettingsWindow, FormattingWindow, ScriptsWindow, InstructionsWindow, InternetSourcesWindow, CustomPromptsWindow, AutomaticInternetSearchWindow
+from windows import SettingsWindow, FormattingWindow, ScriptsWindow, InstructionsWindow, InternetSourcesWindow, CustomPromptsWindow, AutomaticInternetSearchWindow, JobsWindow, TokenBudgetWindow
 from utils import FileHandler, APIHandler, DocumentHandler
 from config import load_default_prompts
+from jobs import JobExecutor
+from response_cache import get_cache
+from checkpoints import get_checkpoints
+from prompt_builder import PromptBuilder
+from token_budget import ContextPacker
+from retrieval import BM25Index
 
 class ClaudeApp(tk.Tk):
     def __init__(self):
@@ -15,6 +21,14 @@ class ClaudeApp(tk.Tk):
         self.file_handler = FileHandler()
         self.api_handler = APIHandler()
         self.doc_handler = DocumentHandler()
+        self.jobs = JobExecutor(self)
+        self.prompt_builder = PromptBuilder()
+        self.context_packer = ContextPacker()
+        self.last_pack = None
+        self.system_prompt_parts = ([], "")
+        self.retrieval_index = BM25Index()
+        self._index_refresh = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Initialize variables
         self.api_key = ""
@@ -32,6 +46,17 @@ class ClaudeApp(tk.Tk):
         self.margin_bottom = 2.0
         self.margin_left = 2.0
         self.margin_right = 2.0
+        self.stream_output = True
+        self.search_term_count = 2
+        self.max_concurrent_searches = 4
+        self.search_timeout = 120
+        self.use_response_cache = True
+        self.use_checkpoints = True
+        self.max_input_tokens = 190000
+        self.use_retrieval = False
+        self.retrieval_top_k = 40
+        self.generation_mode = "single"
+        self.max_parallel_sections = 4
         self.internet_sources = []
         self.scripts = []
         self.instructions = []
@@ -40,7 +65,10 @@ class ClaudeApp(tk.Tk):
         self.system_prompt = self.custom_prompts["default_system_prompt"]
 
         self.load_settings()
+        get_cache().enabled = self.use_response_cache
+        get_checkpoints().enabled = self.use_checkpoints
         self.create_widgets()
+        self.refresh_retrieval_index()
 
     def create_widgets(self):
         style = ttk.Style()
@@ -68,6 +96,7 @@ class ClaudeApp(tk.Tk):
 
         ttk.Button(top_buttons_frame, text="⚙ Settings", command=self.open_settings_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_buttons_frame, text="Save All Settings", command=self.save_all_settings).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_buttons_frame, text="Jobs", command=self.open_jobs_window).pack(side=tk.LEFT, padx=5)
         self.advanced_button = ttk.Button(top_buttons_frame, text="Advanced", command=self.toggle_advanced)
         self.advanced_button.pack(side=tk.RIGHT, padx=5)
 
@@ -114,6 +143,7 @@ class ClaudeApp(tk.Tk):
         ttk.Button(self.middle_buttons_frame, text="Manage Instructions", command=self.open_instructions_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(self.middle_buttons_frame, text="Manage Internet Sources", command=self.open_internet_sources_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(self.middle_buttons_frame, text="Automatic Internet Search", command=self.open_automatic_internet_search_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.middle_buttons_frame, text="Token Budget", command=self.open_token_budget_window).pack(side=tk.LEFT, padx=5)
 
     def create_output_text(self, parent):
         output_frame = ttk.Frame(parent)
@@ -164,6 +194,12 @@ class ClaudeApp(tk.Tk):
     def open_custom_prompts_window(self):
         CustomPromptsWindow(self)
 
+    def open_jobs_window(self):
+        JobsWindow(self)
+
+    def open_token_budget_window(self):
+        TokenBudgetWindow(self)
+
     def open_automatic_internet_search_window(self):
         if not self.perplexity_api_key:
             messagebox.showerror("Error", "Please enter your Perplexity API key in the settings.")
@@ -194,13 +230,42 @@ class ClaudeApp(tk.Tk):
     def save_all_settings(self):
         self.file_handler.save_all_settings(self)
 
+    def on_close(self):
+        self.jobs.shutdown()
+        self.destroy()
+
+    def corpus_changed(self):
+        # An upload adds its files one by one, so the index is refreshed once they have all arrived
+        if self._index_refresh is not None:
+            self.after_cancel(self._index_refresh)
+        self._index_refresh = self.after(500, self.refresh_retrieval_index)
+
+    def refresh_retrieval_index(self):
+        self._index_refresh = None
+        if not self.use_retrieval:
+            return
+        collections = self.file_handler.corpus_snapshot(self)
+        self.jobs.submit("Index corpus", lambda job: self.retrieval_index.sync(collections))
+
     def update_system_prompt(self):
-        self.system_prompt = self.system_prompt_text.get(1.0, tk.END).strip().format(
-            scripts=self.file_handler.format_scripts(self.scripts),
-            instructions=self.file_handler.format_instructions(self.instructions),
-            internet=self.file_handler.format_internet_sources(self.internet_sources),
-            internet_search=self.file_handler.format_internet_search_results(self.internet_search_results),
+        template = self.system_prompt_text.get(1.0, tk.END).strip()
+        collections = {
+            'instructions': self.instructions,
+            'scripts': self.scripts,
+            'internet_sources': self.internet_sources,
+            'internet_search_results': self.internet_search_results
+        }
+        if self.use_retrieval:
+            # The instructions describe the paper, so they are the query for the most relevant passages
+            query = "\n".join(content for _, content in self.instructions)
+            collections = self.retrieval_index.select(collections, query, self.retrieval_top_k)
+        self.context_packer.max_input_tokens = self.max_input_tokens
+        self.last_pack = self.context_packer.pack(template, collections)
+        self.system_prompt = self.prompt_builder.build(
+            template,
+            self.last_pack.collections,
             first_name=self.first_name,
             last_name=self.last_name,
             date=self.date
         )
+        self.system_prompt_parts = self.prompt_builder.last_parts
@@ -0,0 +1,409 @@
+# batch.py
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date as date_type
+from typing import Any, Dict, List, Optional, Tuple
+
+from checkpoints import get_checkpoints
+from config import load_default_prompts
+from internet_search import InternetSearch
+from jobs import JobCancelled
+from message_batches import BatchState, MessageBatchClient, result_message
+from prompt_builder import PromptBuilder
+from response_cache import get_cache
+from retrieval import BM25Index
+from token_budget import ContextPacker
+from utils import FileHandler, APIHandler, DocumentHandler
+
+# Same defaults as the desktop app; stored settings and per-job "settings" override them
+DEFAULT_SETTINGS = {
+    'api_key': "",
+    'perplexity_api_key': "",
+    'first_name': "",
+    'last_name': "",
+    'date': "",
+    'font_name': "Times New Roman",
+    'font_size_normal': 12,
+    'font_size_heading1': 16,
+    'font_size_heading2': 14,
+    'font_size_heading3': 12,
+    'line_spacing': "1.5 lines",
+    'margin_top': 2.0,
+    'margin_bottom': 2.0,
+    'margin_left': 2.0,
+    'margin_right': 2.0,
+    'search_term_count': 2,
+    'max_concurrent_searches': 4,
+    'search_timeout': 120,
+    'use_response_cache': True,
+    'use_checkpoints': True,
+    'max_input_tokens': 190000,
+    'use_retrieval': False,
+    'retrieval_top_k': 40,
+    'generation_mode': "single",
+    'max_parallel_sections': 4,
+}
+
+
+# Never written to the batch state file
+SECRET_SETTINGS = ('api_key', 'perplexity_api_key')
+
+
+class BatchSettings:
+    # Stands in for the app window wherever handlers read settings from `parent`
+    def __init__(self, values: Dict[str, Any]):
+        self.__dict__.update(values)
+
+
+class BatchJob:
+    # Headless counterpart of jobs.Job: progress goes to the log instead of the UI
+    def __init__(self, job_id: str, stop_event: threading.Event, log):
+        self.job_id = job_id
+        self.stop_event = stop_event
+        self.log = log
+
+    def check_cancelled(self):
+        if self.stop_event.is_set():
+            raise JobCancelled()
+
+    def report(self, message=None, data=None):
+        if message:
+            self.log(f"[{self.job_id}] {message}")
+
+
+class BatchRunner:
+    def __init__(self, workers: int = 2, store_path: str = 'scolarforge.db', log=None, backend: str = 'messages'):
+        self.workers = workers
+        # 'messages' calls the API per job; 'batches' sends all generations as one Message Batch
+        self.backend = backend
+        self.failed = 0
+        self._results = None
+        self.file_handler = FileHandler(store_path)
+        self.api_handler = APIHandler()
+        self.doc_handler = DocumentHandler()
+        self.stop_event = threading.Event()
+        self._write_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._log = log or self._print
+        self.base_settings = dict(DEFAULT_SETTINGS)
+        self.base_settings.update(self.file_handler.store.get_settings())
+        self.base_settings['api_key'] = self.base_settings['api_key'] or os.environ.get('ANTHROPIC_API_KEY', '')
+        self.base_settings['perplexity_api_key'] = self.base_settings['perplexity_api_key'] or os.environ.get('PERPLEXITY_API_KEY', '')
+        self.prompts = load_default_prompts()
+        self.prompts.update(self.file_handler.store.get_prompts())
+
+    def run(self, jobs_path: str, results_path: str) -> int:
+        specs = read_jobs(jobs_path)
+        base_dir = os.path.dirname(os.path.abspath(jobs_path))
+        self.failed = 0
+        start = time.perf_counter()
+        with open(results_path, 'a', encoding='utf-8') as results:
+            self._results = results
+            if self.backend == 'batches':
+                self.run_message_batch(specs, base_dir, BatchState(results_path + '.batch.json'))
+            else:
+                self.log(f"Running {len(specs)} job(s) with {self.workers} worker(s)")
+                self.run_pool(self.run_job, [(spec, base_dir) for spec in specs])
+        self.log(f"Finished {len(specs)} job(s) in {time.perf_counter() - start:.1f} s, {self.failed} failed")
+        return self.failed
+
+    def run_pool(self, func, arguments: List[tuple]) -> List[Any]:
+        # Runs func over the worker pool and returns whatever it returns, in completion order
+        returned = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(func, *args) for args in arguments]
+            try:
+                for future in as_completed(futures):
+                    returned.append(future.result())
+            except KeyboardInterrupt:
+                self.stop_event.set()
+                for future in futures:
+                    future.cancel()
+                self.log("Interrupted; waiting for running jobs to stop")
+                raise
+        return returned
+
+    def write_result(self, result: Dict[str, Any]):
+        # Results are appended as jobs finish, so an interrupted run keeps what was already produced
+        with self._write_lock:
+            if result['status'] != 'ok':
+                self.failed += 1
+            self._results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._results.flush()
+
+    def new_job(self, spec: Dict[str, Any]) -> Tuple[BatchJob, Dict[str, Any]]:
+        job_id = str(spec.get('id', spec.get('output', 'job')))
+        return BatchJob(job_id, self.stop_event, self.log), {'id': job_id, 'status': 'ok', 'timings': {}}
+
+    def run_job(self, spec: Dict[str, Any], base_dir: str):
+        job, result = self.new_job(spec)
+        start = time.perf_counter()
+        try:
+            prepared = self.prepare_job(job, spec, base_dir, result)
+            self.generate_job(job, prepared, result)
+        except Exception as e:
+            self.record_failure(job, result, e)
+        result['timings']['total_s'] = time.perf_counter() - start
+        self.write_result(result)
+
+    def prepare_job(self, job: BatchJob, spec: Dict[str, Any], base_dir: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # Extraction, sources, search and prompt rendering: everything up to the generation request
+        timings = result['timings']
+        settings = self.settings_for(spec)
+        output_path = self.resolve(base_dir, spec['output'])
+        result['output'] = output_path
+
+        with timed(timings, 'extract_s'):
+            instructions = self.read_documents(base_dir, spec.get('instructions', []))
+            scripts = self.read_documents(base_dir, spec.get('scripts', []))
+            if not instructions or not scripts:
+                raise ValueError("A job needs at least one instruction and one script file.")
+        job.check_cancelled()
+
+        with timed(timings, 'sources_s'):
+            internet_sources = [self.fetch_source(source, settings) for source in spec.get('sources', [])]
+        job.check_cancelled()
+
+        internet_search_results = []
+        if spec.get('search'):
+            with timed(timings, 'search_s'):
+                internet_search_results = self.search(job, settings, instructions, scripts)
+        job.check_cancelled()
+
+        with timed(timings, 'prompt_s'):
+            template = self.template_for(spec, base_dir)
+            collections = {
+                'instructions': instructions,
+                'scripts': scripts,
+                'internet_sources': internet_sources,
+                'internet_search_results': internet_search_results
+            }
+            system_prompt_parts, pack = self.render_prompt(template, collections, settings)
+            result['input_tokens_estimate'] = pack.total_tokens
+            result['trimmed'] = pack.trimmed
+            headers, data = self.api_handler.build_request(settings.api_key, system_prompt_parts)
+        return {'settings': settings, 'output': output_path, 'headers': headers, 'data': data}
+
+    def generate_job(self, job: BatchJob, prepared: Dict[str, Any], result: Dict[str, Any]):
+        settings = prepared['settings']
+        with timed(result['timings'], 'generate_s'):
+            # A paper that was generated before a crash or a failed export is not paid for again
+            checkpoints = get_checkpoints().begin_run()
+            inputs = [settings.generation_mode, settings.first_name, settings.last_name, settings.date, prepared['data']]
+            paper, result['usage'] = checkpoints.run('generate', inputs, self._generate, job, prepared)
+        self.export_job(job, paper, prepared['output'], settings, result)
+        checkpoints.clear()
+
+    def _generate(self, job: BatchJob, prepared: Dict[str, Any]):
+        settings = prepared['settings']
+        if settings.generation_mode == 'sectioned':
+            paper, stats = self.api_handler.generate_sectioned(
+                job, prepared['headers'], prepared['data'], settings.first_name, settings.last_name,
+                settings.date, settings.max_parallel_sections)
+        else:
+            paper, stats = self.api_handler.generate(job, prepared['headers'], prepared['data'])
+        return [paper, dict(usage_fields(stats.usage.__dict__), output_tokens=stats.output_tokens, from_cache=stats.from_cache)]
+
+    def export_job(self, job: BatchJob, paper: str, output_path: str, settings: 'BatchSettings', result: Dict[str, Any]):
+        with timed(result['timings'], 'export_s'):
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            self.doc_handler.export_docx(paper, output_path, settings)
+        job.report(f"Saved {output_path}")
+
+    def record_failure(self, job: BatchJob, result: Dict[str, Any], error: Exception):
+        if isinstance(error, JobCancelled):
+            result.update(status='cancelled')
+        else:
+            result.update(status='error', error=f"{type(error).__name__}: {error}")
+            job.report(f"Failed: {error}")
+
+    def run_message_batch(self, specs: List[Dict[str, Any]], base_dir: str, state_store: BatchState):
+        # Prompts are prepared on the worker pool, then all single-pass generations go out as one Message Batch
+        state = state_store.load()
+        if state is None:
+            self.log(f"Preparing {len(specs)} job(s) with {self.workers} worker(s)")
+            pending = [entry for entry in self.run_pool(self.prepare_batch_entry, [(i, spec, base_dir) for i, spec in enumerate(specs)]) if entry]
+            if not pending:
+                return
+            client = MessageBatchClient(self.base_settings['api_key'])
+            batch = client.submit([(entry['custom_id'], entry.pop('data')) for entry in pending])
+            state = {'batch_id': batch['id'], 'submitted_at': time.time(), 'jobs': {entry['custom_id']: entry for entry in pending}}
+            state_store.save(state)
+            self.log(f"Submitted batch {batch['id']} with {len(pending)} request(s)")
+        else:
+            self.log(f"Resuming batch {state['batch_id']} with {len(state['jobs'])} request(s)")
+
+        client = MessageBatchClient(self.base_settings['api_key'])
+        batch = client.wait(
+            state['batch_id'], stop_event=self.stop_event,
+            on_poll=lambda batch: self.log(f"Batch {batch['id']}: {batch.get('processing_status')} {batch.get('request_counts', {})}")
+        )
+        waited = time.time() - state['submitted_at']
+        seen = set()
+        for custom_id, batch_result in client.iter_results(batch):
+            entry = state['jobs'].get(custom_id)
+            if entry is None:
+                continue
+            seen.add(custom_id)
+            result = entry['result']
+            job = BatchJob(result['id'], self.stop_event, self.log)
+            result['batch_id'] = state['batch_id']
+            result['timings']['batch_s'] = waited
+            try:
+                paper, usage = result_message(batch_result)
+                get_cache().put(entry['cache_key'], paper)
+                result['usage'] = dict(usage_fields(usage), output_tokens=usage.get('output_tokens', 0), from_cache=False)
+                self.export_job(job, paper, result['output'], BatchSettings(entry['settings']), result)
+            except Exception as e:
+                self.record_failure(job, result, e)
+            self.write_result(result)
+        for custom_id in set(state['jobs']) - seen:
+            result = state['jobs'][custom_id]['result']
+            result.update(status='error', error="The batch returned no result for this job.", batch_id=state['batch_id'])
+            self.write_result(result)
+        state_store.clear()
+
+    def prepare_batch_entry(self, index: int, spec: Dict[str, Any], base_dir: str) -> Optional[Dict[str, Any]]:
+        # Returns the batch entry for a job, or None once the job has been finished some other way
+        job, result = self.new_job(spec)
+        start = time.perf_counter()
+        try:
+            prepared = self.prepare_job(job, spec, base_dir, result)
+            settings = prepared['settings']
+            cache_key = get_cache().request_key(self.api_handler.api_url, prepared['data'])
+            # Sectioned papers need the outline before their chapters, and cached responses need no request at all
+            if settings.generation_mode == 'sectioned' or get_cache().get(cache_key) is not None:
+                self.generate_job(job, prepared, result)
+            else:
+                result['timings']['total_s'] = time.perf_counter() - start
+                values = {key: value for key, value in settings.__dict__.items() if key not in SECRET_SETTINGS}
+                # custom_id only allows a short [A-Za-z0-9_-] string, so the job is tracked by its position
+                return {'custom_id': f"job-{index}", 'data': prepared['data'], 'cache_key': cache_key,
+                        'settings': values, 'result': result}
+        except Exception as e:
+            self.record_failure(job, result, e)
+        result['timings']['total_s'] = time.perf_counter() - start
+        self.write_result(result)
+        return None
+
+    def settings_for(self, spec: Dict[str, Any]) -> BatchSettings:
+        values = dict(self.base_settings)
+        values.update(spec.get('settings', {}))
+        for key in ('first_name', 'last_name', 'date'):
+            if key in spec:
+                values[key] = spec[key]
+        values['date'] = values['date'] or date_type.today().strftime("%Y-%m-%d")
+        if not values['api_key']:
+            raise ValueError("No API key: set it in the app settings or the ANTHROPIC_API_KEY environment variable.")
+        if not values['first_name'] or not values['last_name']:
+            raise ValueError("The job or the stored settings must give a first and last name.")
+        return BatchSettings(values)
+
+    def template_for(self, spec: Dict[str, Any], base_dir: str) -> str:
+        if 'prompt_file' in spec:
+            with open(self.resolve(base_dir, spec['prompt_file']), 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        name = spec.get('prompt', 'default_system_prompt')
+        if name not in self.prompts:
+            raise ValueError(f"Unknown prompt template '{name}'.")
+        return self.prompts[name]
+
+    def read_documents(self, base_dir: str, paths: List[str]) -> List[tuple]:
+        paths = [self.resolve(base_dir, path) for path in paths]
+        texts = self.file_handler.read_files_text(paths)
+        return [(os.path.basename(path), text) for path, text in zip(paths, texts)]
+
+    def fetch_source(self, source, settings: BatchSettings) -> Dict[str, str]:
+        if isinstance(source, str):
+            source = {'url': source}
+        return {
+            'url': source['url'],
+            'author': source.get('author', 'Unknown'),
+            'date': source.get('date', settings.date),
+            'content': self.file_handler.fetch_webpage_text(source['url'])
+        }
+
+    def search(self, job: BatchJob, settings: BatchSettings, instructions, scripts) -> List[Dict]:
+        internet_search = InternetSearch(
+            settings.api_key, settings.perplexity_api_key,
+            search_term_count=settings.search_term_count,
+            max_concurrent_searches=settings.max_concurrent_searches,
+            search_timeout=settings.search_timeout
+        )
+        results = internet_search.run_pipeline([content for _, content in instructions], [content for _, content in scripts], job.report)
+        if results is None:
+            raise ValueError("No valid search terms were generated.")
+        return results
+
+    def render_prompt(self, template: str, collections: Dict[str, List[Any]], settings: BatchSettings):
+        # Mirrors ClaudeApp.update_system_prompt with per-job builder state
+        if settings.use_retrieval:
+            query = "\n".join(content for _, content in collections['instructions'])
+            index = BM25Index()
+            index.sync(collections)
+            collections = index.select(collections, query, settings.retrieval_top_k)
+        pack = ContextPacker(settings.max_input_tokens).pack(template, collections)
+        if not pack.fits:
+            raise ValueError(f"The prompt does not fit the token budget even after trimming.\n{pack.summary()}")
+        builder = PromptBuilder()
+        builder.build(template, pack.collections, first_name=settings.first_name, last_name=settings.last_name, date=settings.date)
+        return builder.last_parts, pack
+
+    def resolve(self, base_dir: str, path: str) -> str:
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    def log(self, message: str):
+        with self._log_lock:
+            self._log(message)
+
+    def _print(self, message: str):
+        print(f"{time.strftime('%H:%M:%S')} {message}", file=sys.stderr, flush=True)
+
+
+@contextmanager
+def timed(timings: Dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def usage_fields(usage: Dict[str, Any]) -> Dict[str, int]:
+    return {key: usage.get(key) or 0 for key in ('input_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')}
+
+
+def read_jobs(jobs_path: str) -> List[Dict[str, Any]]:
+    specs = []
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                spec = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{jobs_path}:{line_number}: invalid JSON: {e}")
+            if 'output' not in spec:
+                raise ValueError(f"{jobs_path}:{line_number}: a job needs an 'output' path.")
+            specs.append(spec)
+    return specs
+
+
+def run_batch(jobs_path: str, results_path: str = None, workers: int = 2, store_path: str = 'scolarforge.db',
+              backend: str = 'messages') -> int:
+    results_path = results_path or os.path.splitext(jobs_path)[0] + '.results.jsonl'
+    runner = BatchRunner(workers, store_path, backend=backend)
+    get_cache().enabled = runner.base_settings['use_response_cache']
+    get_checkpoints().enabled = runner.base_settings['use_checkpoints']
+    try:
+        failed = runner.run(jobs_path, results_path)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failed else 0
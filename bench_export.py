@@ -0,0 +1,62 @@
+# bench_export.py
+# Times the Markdown -> DOCX export on synthetic papers of growing length; time per page should stay flat.
+# Usage: python bench_export.py [pages ...]
+
+import os
+import sys
+import tempfile
+import time
+
+from markdown_docx import tokenize
+from utils import DocumentHandler
+
+WORDS_PER_PAGE = 450
+
+
+class FormattingSettings:
+    font_name = "Times New Roman"
+    font_size_normal = 12
+    font_size_heading1 = 16
+    font_size_heading2 = 14
+    font_size_heading3 = 12
+    line_spacing = "1.5 lines"
+    margin_top = margin_bottom = margin_left = margin_right = 2.0
+
+
+def synthetic_paper(pages: int) -> str:
+    sentence = "The **results** of the *second* study (Miller, 2021) show a `p < 0.05` effect on learning outcomes. "
+    words_per_sentence = len(sentence.split())
+    parts = ["####TITLE PAGE####", "# A Synthetic Paper", "Jane Doe", "2024-01-01", "####END TITLE PAGE####", ""]
+    for page in range(pages):
+        parts.append(f"# Chapter {page + 1}" if page % 5 == 0 else f"## Section {page + 1}")
+        words = 0
+        while words < WORDS_PER_PAGE:
+            parts.append(sentence * 4)
+            words += words_per_sentence * 4
+        parts.extend(["", "1. First point with **bold *nested* text**", "2. Second point", "   - A detail", "- A bullet", ""])
+        if page % 4 == 0:
+            parts.append("| Measure | Group A | Group B |")
+            parts.append("|---------|---------|---------|")
+            parts.extend(f"| Row {row} | {row * 1.5:.1f} | {row * 2.5:.1f} |" for row in range(12))
+            parts.append("")
+    return "\n".join(parts)
+
+
+def main(page_counts):
+    handler = DocumentHandler()
+    settings = FormattingSettings()
+    print(f"{'pages':>6} {'blocks':>8} {'tokenize ms':>12} {'export ms':>10} {'ms/page':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in page_counts:
+            content = synthetic_paper(pages)
+            start = time.perf_counter()
+            blocks = sum(1 for _ in tokenize(content))
+            tokenized = time.perf_counter()
+            handler.export_docx(content, os.path.join(directory, f"paper-{pages}.docx"), settings)
+            exported = time.perf_counter()
+            print(f"{pages:>6} {blocks:>8} {(tokenized - start) * 1000:>12.1f} {(exported - tokenized) * 1000:>10.1f} "
+                  f"{(exported - tokenized) * 1000 / pages:>8.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [25, 50, 100, 200, 400])
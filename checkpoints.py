@@ -0,0 +1,120 @@
+# checkpoints.py
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Set
+
+
+class CheckpointStore:
+    # One JSON file per completed stage, named by the hash of the stage's inputs
+    def __init__(self, directory: str = 'checkpoints', max_age: float = 7 * 24 * 60 * 60, enabled: bool = True):
+        self.directory = directory
+        self.max_age = max_age
+        self.enabled = enabled
+        os.makedirs(directory, exist_ok=True)
+        self.prune()
+
+    @staticmethod
+    def key(stage: str, inputs: Any) -> str:
+        payload = json.dumps([stage, inputs], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def run(self, stage: str, inputs: Any, func: Callable, *args, **kwargs):
+        # Returns the stored output when this stage already ran on the same inputs; otherwise runs and stores it.
+        # Empty outputs are not stored, so a stage that produced nothing usable is retried next time.
+        if not self.enabled:
+            return func(*args, **kwargs)
+        return self._run_at(self.path(stage, inputs), stage, func, *args, **kwargs)
+
+    def begin_run(self) -> 'CheckpointRun':
+        return CheckpointRun(self)
+
+    def path(self, stage: str, inputs: Any) -> str:
+        return self._path(stage, self.key(stage, inputs))
+
+    def _run_at(self, path: str, stage: str, func: Callable, *args, **kwargs):
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)['output']
+            except (OSError, ValueError, KeyError):
+                # A checkpoint cut short by a crash is simply recomputed
+                pass
+        value = func(*args, **kwargs)
+        if value:
+            self._write(path, {'stage': stage, 'created_at': time.time(), 'output': value})
+        return value
+
+    def prune(self):
+        cutoff = time.time() - self.max_age
+        for path in glob.glob(os.path.join(self.directory, '*')):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, '*')):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, f"{stage}-{key[:32]}.json")
+
+    def _write(self, path: str, payload):
+        # Written to a temporary file first so a crash never leaves a half-written checkpoint under the real name
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+
+class CheckpointRun:
+    # The checkpoints of one pipeline run. They only exist so that run can resume after a failure: clear() drops
+    # them once it has completed, and a later run on the same inputs does the work again
+    def __init__(self, store: CheckpointStore):
+        self.store = store
+        self.paths: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def run(self, stage: str, inputs: Any, func: Callable, *args, **kwargs):
+        if not self.store.enabled:
+            return func(*args, **kwargs)
+        path = self.store.path(stage, inputs)
+        with self._lock:
+            self.paths.add(path)
+        return self.store._run_at(path, stage, func, *args, **kwargs)
+
+    def clear(self):
+        with self._lock:
+            paths, self.paths = self.paths, set()
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+_default_store: Optional[CheckpointStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_checkpoints() -> CheckpointStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore()
+        return _default_store
+
+
+def set_checkpoints(store: Optional[CheckpointStore]):
+    global _default_store
+    with _default_store_lock:
+        _default_store = store
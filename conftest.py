@@ -0,0 +1,3 @@
+# conftest.py
+
+# Keeps the top-level modules importable when the tests are run with plain `pytest`
@@ -0,0 +1,177 @@
+# dedup.py
+
+import re
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from retrieval import RETRIEVABLE_COLLECTIONS, document_key, document_text
+from token_budget import item_name
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+SHINGLE_WORDS = 5
+SIGNATURE_SIZE = 64
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard similarity almost always share a bucket, so lookups only compare
+# a handful of candidates instead of every indexed document
+BANDS = 16
+HASH_MASK = (1 << 64) - 1
+EMPTY_BIN = HASH_MASK
+TRACKING_PARAMETER = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref)$', re.IGNORECASE)
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_WORDS) -> Set[int]:
+    # Python's string hash is randomized per process, which is fine: signatures are never stored
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {hash(tuple(words)) & HASH_MASK}
+    return {hash(tuple(words[i:i + size])) & HASH_MASK for i in range(len(words) - size + 1)}
+
+
+def minhash(hashes: Set[int]) -> Tuple[int, ...]:
+    # One-permutation MinHash: each shingle hash is used once, its low bits pick a bin and the rest compete for
+    # that bin's minimum, so a signature costs one pass instead of one pass per permutation
+    signature = [EMPTY_BIN] * SIGNATURE_SIZE
+    for value in hashes:
+        bin_index = value % SIGNATURE_SIZE
+        value //= SIGNATURE_SIZE
+        if value < signature[bin_index]:
+            signature[bin_index] = value
+    # Empty bins (short texts) borrow the next filled bin's value, offset by the distance, so two texts still
+    # agree on a bin only when their shingles do
+    if EMPTY_BIN in signature:
+        original = list(signature)
+        for i in range(SIGNATURE_SIZE):
+            if original[i] == EMPTY_BIN:
+                distance = 1
+                while original[(i + distance) % SIGNATURE_SIZE] == EMPTY_BIN:
+                    distance += 1
+                signature[i] = -(original[(i + distance) % SIGNATURE_SIZE] * SIGNATURE_SIZE + distance)
+    return tuple(signature)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    # The share of matching signature values estimates the Jaccard similarity of the two shingle sets
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.8, bands: int = BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = SIGNATURE_SIZE // bands
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self.names: Dict[Hashable, str] = {}
+        self.buckets: List[Dict[Tuple[int, ...], Set[Hashable]]] = [{} for _ in range(bands)]
+        # find_duplicate is called from background jobs, possibly two at once
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, text: str, name: str = ''):
+        hashes = shingle_hashes(text)
+        if not hashes or key in self.signatures:
+            return
+        signature = minhash(hashes)
+        self.signatures[key] = signature
+        self.names[key] = name
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable):
+        signature = self.signatures.pop(key, None)
+        self.names.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self.buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band][band_key]
+
+    def query(self, text: str, exclude: Optional[Hashable] = None) -> List[Tuple[Hashable, float]]:
+        # Indexed documents at or above the threshold, most similar first
+        hashes = shingle_hashes(text)
+        if not hashes:
+            return []
+        signature = minhash(hashes)
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        candidates.discard(exclude)
+        matches = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+        return sorted([match for match in matches if match[1] >= self.threshold], key=lambda match: -match[1])
+
+    def sync(self, collections: Dict[str, List[Any]]):
+        # Indexes corpus items that are new and forgets deleted ones; unchanged ones cost nothing
+        current = set()
+        for collection in RETRIEVABLE_COLLECTIONS:
+            for item in collections.get(collection, []):
+                key = document_key(collection, item)
+                current.add(key)
+                if key not in self.signatures:
+                    self.add(key, document_text(collection, item), item_name(collection, item))
+        for key in [key for key in self.signatures if key not in current]:
+            self.remove(key)
+
+    def find_duplicate(self, collections: Dict[str, List[Any]], collection: str, item) -> Optional[Tuple[str, float]]:
+        # The name and similarity of the closest near-duplicate of item already in the corpus, if any
+        with self._lock:
+            self.sync(collections)
+            matches = self.query(document_text(collection, item), exclude=document_key(collection, item))
+            if not matches:
+                # The exact same text is excluded above; it is a duplicate too when it is already present
+                key = document_key(collection, item)
+                return (self.names[key], 1.0) if key in self.signatures else None
+            key, score = matches[0]
+            return self.names[key], score
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+
+
+def normalize_url(url: str) -> str:
+    # Scheme and host case, "www.", fragments, trailing slashes and tracking parameters do not make a new page
+    url = (url or '').strip()
+    if not url or url.lower() in ('unknown', 'unkown'):
+        return ''
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query) if not TRACKING_PARAMETER.match(key)])
+    return urlunsplit(('', host, parts.path.rstrip('/'), query, ''))
+
+
+def dedupe_search_results(results: List[Dict], threshold: float = 0.8) -> List[Dict]:
+    # Results for the same URL are merged into the first one; a result whose text nearly repeats an earlier
+    # one is dropped, since it would only add tokens to the prompt
+    merged: List[Dict] = []
+    by_url: Dict[str, Dict] = {}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        url = normalize_url(str(result.get('url', '')))
+        first = by_url.get(url) if url else None
+        if first is None:
+            result = dict(result)
+            merged.append(result)
+            if url:
+                by_url[url] = result
+            continue
+        content = str(result.get('content', ''))
+        if content and content not in str(first.get('content', '')):
+            first['content'] = f"{first.get('content', '')}\n\n{content}".strip()
+        terms = [term for term in str(first.get('search_term', '')).split('; ') if term]
+        if result.get('search_term') and result['search_term'] not in terms:
+            first['search_term'] = '; '.join(terms + [result['search_term']])
+
+    index = NearDuplicateIndex(threshold)
+    unique = []
+    for position, result in enumerate(merged):
+        text = document_text('internet_search_results', result)
+        if index.query(text):
+            continue
+        index.add(position, text)
+        unique.append(result)
+    return unique
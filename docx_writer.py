@@ -0,0 +1,117 @@
+# docx_writer.py
+
+import io
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from docx import Document
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml import parse_xml
+
+from markdown_docx import DocxRenderer, DocxStyles, resolve_styles
+
+DOCUMENT_PART = 'word/document.xml'
+NUMBERING_PART = 'word/numbering.xml'
+FLUSH_BYTES = 256 * 1024
+
+
+class DocxTemplate:
+    # An exported document with an empty body, split into the pieces every export reuses unchanged
+    def __init__(self, data: bytes):
+        document = Document(io.BytesIO(data))
+        self.styles: DocxStyles = resolve_styles(document)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.parts: List[Tuple[zipfile.ZipInfo, bytes]] = [
+                (info, archive.read(info)) for info in archive.infolist()
+                if info.filename not in (DOCUMENT_PART, NUMBERING_PART)
+            ]
+            document_xml = archive.read(DOCUMENT_PART)
+            if NUMBERING_PART not in archive.namelist():
+                raise ValueError("Template has no numbering part")
+            self.numbering_xml = archive.read(NUMBERING_PART)
+        # The body's own section properties come last, so the streamed blocks go right in front of them
+        split = document_xml.rindex(b'<w:sectPr')
+        self.head = document_xml[:split]
+        self.tail = document_xml[split:]
+
+    def write(self, content: str, path: str):
+        # Blocks are serialized as soon as they are rendered, so the document tree is never held in memory.
+        # The file is written under a temporary name and only replaces the target once complete.
+        numbering = parse_xml(self.numbering_xml)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for info, data in self.parts:
+                    archive.writestr(info, data)
+                with archive.open(DOCUMENT_PART, 'w') as stream:
+                    stream.write(self.head)
+                    writer = BodyWriter(stream)
+                    DocxRenderer(self.styles, writer.write, lambda: numbering).render(content)
+                    writer.flush()
+                    stream.write(self.tail)
+                # List numbering restarts add w:num entries while rendering, so this part is written last
+                archive.writestr(NUMBERING_PART, serialize_part_xml(numbering))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+
+class BodyWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write(self, xml: str):
+        self.pending.append(xml)
+        self.pending_bytes += len(xml)
+        if self.pending_bytes >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.stream.write(''.join(self.pending).encode('utf-8'))
+            self.pending = []
+            self.pending_bytes = 0
+
+
+class TemplateCache:
+    # Formatted empty documents, one per formatting configuration; building one means creating every custom
+    # style from scratch, which is the fixed cost of each export
+    def __init__(self, max_templates: int = 8):
+        self.max_templates = max_templates
+        self._templates: 'OrderedDict[Hashable, DocxTemplate]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, build: Callable[[], bytes]) -> DocxTemplate:
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = DocxTemplate(build())
+                self._templates[key] = template
+                while len(self._templates) > self.max_templates:
+                    self._templates.popitem(last=False)
+            else:
+                self._templates.move_to_end(key)
+            return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+_default_templates: Optional[TemplateCache] = None
+_default_templates_lock = threading.Lock()
+
+
+def get_templates() -> TemplateCache:
+    global _default_templates
+    with _default_templates_lock:
+        if _default_templates is None:
+            _default_templates = TemplateCache()
+        return _default_templates
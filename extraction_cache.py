@@ -0,0 +1,111 @@
+# extraction_cache.py
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, path: str = 'extraction_cache.sqlite', max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Extracted texts are stored once per text hash; any number of files can point at the same text
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS texts ("
+            "text_hash TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "file_hash TEXT NOT NULL, extractor TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "name TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (file_hash, extractor));"
+            "CREATE INDEX IF NOT EXISTS extractions_text ON extractions (text_hash);"
+        )
+        self._conn.commit()
+
+    def get(self, file_hash: str, extractor: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT t.text_hash, t.content FROM extractions e JOIN texts t ON t.text_hash = e.text_hash "
+                "WHERE e.file_hash = ? AND e.extractor = ?", (file_hash, extractor)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE texts SET accessed_at = ? WHERE text_hash = ?", (time.time(), row[0]))
+            self._conn.commit()
+            self.hits += 1
+            return row[1]
+
+    def put(self, file_hash: str, extractor: str, name: str, text: str):
+        text_hash = hash_text(text)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO texts (text_hash, content, size, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(text_hash) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (text_hash, text, len(text.encode('utf-8')), now)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (file_hash, extractor, text_hash, name, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", (file_hash, extractor, text_hash, name, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM texts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for text_hash, size in self._conn.execute("SELECT text_hash, size FROM texts ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM extractions WHERE text_hash = ?", (text_hash,))
+            self._conn.execute("DELETE FROM texts WHERE text_hash = ?", (text_hash,))
+            total -= size
+
+    def report(self) -> Dict[str, object]:
+        with self._lock:
+            texts, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM texts").fetchone()
+            rows = self._conn.execute(
+                "SELECT t.text_hash, t.size, GROUP_CONCAT(e.name, ', '), COUNT(e.file_hash) "
+                "FROM texts t LEFT JOIN extractions e ON e.text_hash = t.text_hash "
+                "GROUP BY t.text_hash ORDER BY t.accessed_at DESC"
+            ).fetchall()
+        entries: List[Dict[str, object]] = [
+            {"text_hash": text_hash, "size": size, "names": names or "", "files": files}
+            for text_hash, size, names, files in rows
+        ]
+        return {"hits": self.hits, "misses": self.misses, "texts": texts, "bytes": total, "entries": entries}
+
+    def summary(self) -> str:
+        report = self.report()
+        files = sum(entry["files"] for entry in report["entries"])
+        return (f"Extraction cache: {report['hits']:,} hits, {report['misses']:,} misses this session, "
+                f"{report['texts']:,} texts stored for {files:,} files ({report['bytes'] / 1e6:.1f} MB)")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM extractions")
+            self._conn.execute("DELETE FROM texts")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
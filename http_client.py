@@ -0,0 +1,164 @@
+# http_client.py
+
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+class HTTPClient:
+    # 529 is Anthropic's "overloaded" status
+    RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504, 529}
+    IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+    def __init__(self, connect_timeout: float = 10.0, read_timeout: float = 300.0, max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, pool_connections: int = 10,
+                 pool_maxsize: int = 20, transport: Optional[BaseAdapter] = None,
+                 base_urls: Optional[Dict[str, str]] = None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Maps a URL prefix to a replacement, e.g. {"https://api.anthropic.com": "http://127.0.0.1:8000"}
+        self.base_urls = dict(base_urls or {})
+        self.session = requests.Session()
+        # One adapter keeps a separate keep-alive pool per host
+        adapter = transport or HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, url: str, timeout=None, max_retries: Optional[int] = None,
+                deadline: Optional[float] = None, **kwargs) -> requests.Response:
+        # deadline, in seconds, bounds the whole call: every attempt's timeout is cut to the time that is left and
+        # no retry is started that could not finish before it
+        url = self._rewrite_url(url)
+        timeout = timeout if timeout is not None else (self.connect_timeout, self.read_timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        expires = time.monotonic() + deadline if deadline is not None else None
+
+        for attempt in range(max_retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=self._attempt_timeout(timeout, expires), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self._backoff_delay(attempt)
+                if attempt >= max_retries or not self._can_resend(method, e) or not self._has_time(expires, delay):
+                    raise
+                time.sleep(delay)
+                continue
+
+            if response.status_code in self.RETRY_STATUSES and attempt < max_retries:
+                delay = self._retry_delay(response, attempt)
+                if self._has_time(expires, delay):
+                    response.close()
+                    time.sleep(delay)
+                    continue
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def _attempt_timeout(timeout, expires: Optional[float]):
+        if expires is None:
+            return timeout
+        remaining = max(0.001, expires - time.monotonic())
+        if isinstance(timeout, tuple):
+            return tuple(min(value, remaining) if value is not None else remaining for value in timeout)
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    @staticmethod
+    def _has_time(expires: Optional[float], delay: float) -> bool:
+        return expires is None or time.monotonic() + delay < expires
+
+    def _can_resend(self, method: str, error: Exception) -> bool:
+        # A POST that timed out or lost its connection may already be running (and billed) on the server, so it is
+        # only sent again when the connection was never made
+        if method.upper() in self.IDEMPOTENT_METHODS or isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _rewrite_url(self, url: str) -> str:
+        for prefix, replacement in self.base_urls.items():
+            if url.startswith(prefix):
+                return replacement + url[len(prefix):]
+        return url
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter: a random delay up to the exponential ceiling
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = self._parse_retry_after(response.headers.get('retry-after'))
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return self._backoff_delay(attempt)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
+
+
+def set_client(client: Optional[HTTPClient]):
+    # Replaces the shared client, e.g. with one pointed at a local stub server; None restores the default
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
+
+def iter_sse_events(response):
+    event_type = None
+    data_lines = []
+    for raw_line in response.iter_lines(decode_unicode=False):
+        line = raw_line.decode('utf-8') if isinstance(raw_line, bytes) else raw_line
+        if not line:
+            if data_lines:
+                yield event_type, json.loads("\n".join(data_lines))
+            event_type = None
+            data_lines = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            event_type = value
+        elif field == 'data':
+            data_lines.append(value)
+    if data_lines:
+        yield event_type, json.loads("\n".join(data_lines))
@@ -1,91 +1,150 @@
 # internet_search.py
 
 import json
-import os
 from datetime import datetime
-from typing import List, Dict
-import requests
-import re
-import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_client import get_client, iter_sse_events
+from response_cache import get_cache
+from prompt_cache import CacheUsage, beta_header, cached_content_blocks
+from checkpoints import CheckpointRun, get_checkpoints
+from dedup import dedupe_search_results
+from search_results import ResultParseError, normalize_result, parse_json_values, parse_sonar_response, result_items
+from json_stream import JSONStreamExtractor
+
+
+def is_search_term(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get('search_term'), str) and bool(value['search_term'].strip())
+
 
 class InternetSearch:
-    def __init__(self, claude_api_key: str, perplexity_api_key: str):
+    def __init__(self, claude_api_key: str, perplexity_api_key: str, search_term_count: int = 2,
+                 max_concurrent_searches: int = 4, search_timeout: float = 120.0):
         self.claude_api_key = claude_api_key
         self.perplexity_api_key = perplexity_api_key
-        self.json_file = 'internet_search_results.json'
+        self.search_term_count = search_term_count
+        self.max_concurrent_searches = max_concurrent_searches
+        self.search_timeout = search_timeout
+        self.failed_search_terms = []
+        self.sonar_cache_ttl = 24 * 60 * 60
+        self.cache_usage = CacheUsage()
+
+    def generate_search_terms(self, instructions: List[str], scripts: List[str],
+                              on_term: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        corpus, claude_prompt = self._create_claude_prompt(instructions, scripts)
+        # Terms are picked out of the response while it streams, so on_term can start searching for one while the
+        # model is still writing the next; fences, text around the list and a cut-off last term are tolerated
+        extractor = JSONStreamExtractor(accept=is_search_term)
+        search_terms: List[Dict] = []
+
+        def add_terms(terms: List[Dict]):
+            for term in terms:
+                search_terms.append(term)
+                if on_term:
+                    on_term(term)
 
-    def generate_search_terms(self, instructions: List[str], scripts: List[str]) -> List[Dict]:
-        claude_prompt = self._create_claude_prompt(instructions, scripts)
-        search_terms_raw = self._call_claude_api(claude_prompt)
+        search_terms_raw = self._call_claude_api(claude_prompt, cached_prefix=corpus,
+                                                 on_text=lambda text: add_terms(extractor.feed(text)))
+        add_terms(extractor.finish())
         
         # Save the raw response to a JSON file
         with open('searchterms.json', 'w', encoding='utf-8') as f:
             json.dump({"raw_response": search_terms_raw}, f, ensure_ascii=False, indent=2)
         
-        # Try to extract JSON from the response
-        json_match = re.search(r'\[.*\]', search_terms_raw, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-        else:
-            json_str = search_terms_raw  # If no JSON-like structure found, use the whole response
-        
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON: {e}")
+        if not search_terms:
+            print("No search terms found in the response")
             print(f"Raw content: {search_terms_raw}")
-            return []  # Return an empty list if parsing fails
+        return search_terms
+
+    def run_pipeline(self, instructions: List[str], scripts: List[str], report: Optional[Callable[[str], None]] = None) -> Optional[List[Dict]]:
+        # Term generation -> Sonar searches -> merge; every stage is checkpointed, so a re-run after a failure
+        # resumes after the last stage that completed instead of paying for its API calls again
+        report = report or (lambda message: None)
+        report("Generating search terms...")
+        # Each term is searched as soon as it has been generated instead of after the whole list
+        searches = SonarSearches(self, get_checkpoints().begin_run())
 
-    def perform_internet_search(self, search_terms: List[Dict]) -> List[Dict]:
-        perplexity_results = []
+        def on_term(term):
+            if searches.submit(term):
+                report(f"Generating search terms... ({len(searches.terms)} already searching)")
+
+        try:
+            search_terms = searches.checkpoints.run(
+                'search_terms', [instructions, scripts, self.search_term_count],
+                self.generate_search_terms, instructions, scripts, on_term
+            )
+            if not search_terms:
+                searches.cancel()
+                return None
+            report("Performing internet search...")
+
+            def progress(done, total):
+                report(f"Performing internet search... ({done}/{total} terms)")
+
+            # After a checkpoint hit no term was streamed; perform_internet_search submits them all
+            return self.perform_internet_search(search_terms, progress, searches)
+        except BaseException:
+            searches.cancel()
+            raise
+
+    def perform_internet_search(self, search_terms: List[Dict], progress_callback: Optional[Callable[[int, int], None]] = None,
+                                searches: Optional['SonarSearches'] = None) -> List[Dict]:
+        # searches may already be running some of the terms; the others are started here
+        searches = searches or SonarSearches(self, get_checkpoints().begin_run())
         for term in search_terms:
-            sonar_prompt = self._create_sonar_prompt(term)
-            result = self._call_sonar_api(sonar_prompt)
-            perplexity_results.append(result)
+            searches.submit(term)
+        perplexity_results = searches.wait(progress_callback)
 
-        # Process Perplexity results using Claude
-        final_results = self._process_perplexity_results(perplexity_results)
+        # Merged locally; Claude is only asked about responses that hold no parseable result
+        final_results = searches.checkpoints.run('merge', perplexity_results, self._process_perplexity_results, perplexity_results)
 
-        # Save the final results
-        self._save_data(final_results)
+        # Several terms often find the same page; repeated URLs are merged and near-identical texts dropped
+        if isinstance(final_results, list):
+            final_results = dedupe_search_results(final_results)
+
+        # The caller stores the results in the project database. internet_search_results.json is not written:
+        # it is only read to migrate older projects, and a fresh copy would be re-imported as stale data
+        # The run completed, so nothing is left to resume; the same inputs are searched afresh next time
+        searches.checkpoints.clear()
 
         return final_results
 
-    def _process_perplexity_results(self, perplexity_results: List[str]) -> List[Dict]:
-        # Create temporary files for Perplexity results
-        temp_files = []
-        for i, result in enumerate(perplexity_results):
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as temp:
-                json.dump(result, temp)
-                temp_files.append(temp.name)
+    def _search_term(self, term: Dict, checkpoints: CheckpointRun) -> str:
+        # Each term is its own checkpoint, so the searches that succeeded survive a failure of the others
+        prompt = self._create_sonar_prompt(term)
+        return checkpoints.run('sonar', prompt, self._call_sonar_api, prompt)
 
-        # Create Claude prompt to process Perplexity results
-        claude_prompt = self._create_claude_processing_prompt(temp_files)
-        
-        # Call Claude API to process results
-        processed_results = self._call_claude_api(claude_prompt)
+    def _process_perplexity_results(self, perplexity_results: List[Tuple[str, str]]) -> List[Dict]:
+        date_retrieved = datetime.now().strftime('%Y-%m-%d')
+        merged: List[Dict] = []
+        unparsed: List[Tuple[str, str]] = []
+        for search_term, response in perplexity_results:
+            try:
+                merged.extend(parse_sonar_response(response, search_term, date_retrieved))
+            except ResultParseError:
+                unparsed.append((search_term, response))
 
-        # Clean up temporary files
-        for temp_file in temp_files:
-            os.unlink(temp_file)
+        if unparsed:
+            print(f"{len(unparsed)} Sonar response(s) could not be parsed locally; asking Claude to convert them")
+            processed = self._call_claude_api(self._create_claude_processing_prompt(unparsed))
+            try:
+                for value in parse_json_values(processed):
+                    for item in result_items(value):
+                        result = normalize_result(item, '', date_retrieved)
+                        if result is not None:
+                            merged.append(result)
+            except ResultParseError as e:
+                print(f"Failed to parse processed results: {e}")
+                print(f"Raw content: {processed}")
+        return merged
+
+    def _create_claude_processing_prompt(self, responses: List[Tuple[str, str]]) -> str:
+        prompt = "You will write one clean JSON based on the following search responses:\n\n"
+        for i, (search_term, response) in enumerate(responses):
+            prompt += f"Response {i+1} (search term: {search_term}):\n{response}\n\n"
 
-        # Parse the processed results
-        try:
-            return json.loads(processed_results)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse processed results: {e}")
-            print(f"Raw content: {processed_results}")
-            return []
-
-    def _create_claude_processing_prompt(self, temp_files: List[str]) -> str:
-        prompt = "You will write one clean JSON based on the following text files:\n\n"
-        for i, temp_file in enumerate(temp_files):
-            with open(temp_file, 'r') as f:
-                content = f.read()
-            prompt += f"File {i+1}:\n{content}\n\n"
-        
         prompt += """
-        Combine the information from these files into a single JSON array. Each item in the array should have the following structure:
+        Combine the information from these responses into a single JSON array. Each item in the array should have the following structure:
         {
             "title": "Name of finding",
             "author": "Name of the author or website",
@@ -100,16 +159,18 @@ class InternetSearch:
         """
         return prompt
 
-    def _create_claude_prompt(self, instructions: List[str], scripts: List[str]) -> str:
-        return f"""
-        Based on the following instructions and scripts, create a list of 2 possible search terms for internet research.
-        Format the output as a JSON list of dictionaries, each containing 'search_term' and 'goal' keys. Do not include any explanatory text before or after the JSON. I REPEAT DO NOT WRITE ANYTHING ELSE THAN THE OUTPUT. 
-
+    def _create_claude_prompt(self, instructions: List[str], scripts: List[str]) -> Tuple[str, str]:
+        # The corpus comes first so it can be cached; the task, which varies with the settings, follows it
+        corpus = f"""
         Instructions:
         {' '.join(instructions)}
 
         Scripts:
         {' '.join(scripts)}
+        """
+        return corpus, f"""
+        Based on the instructions and scripts above, create a list of {self.search_term_count} possible search terms for internet research.
+        Format the output as a JSON list of dictionaries, each containing 'search_term' and 'goal' keys. Do not include any explanatory text before or after the JSON. I REPEAT DO NOT WRITE ANYTHING ELSE THAN THE OUTPUT. 
 
         Output format example:
         [
@@ -124,7 +185,7 @@ class InternetSearch:
         You are an AI assistant helping to find sources for a scientific paper.
         Search the internet for information on the following topic:
         Search term: {term['search_term']}
-        Goal: {term['goal']}
+        Goal: {term.get('goal', '')}
 
         Format your findings as JSON with the following structure:
         {{
@@ -139,28 +200,72 @@ class InternetSearch:
         Ensure to include a valid URL for each source. If you don't know the url, just write "unkown". 
         """
 
-    def _call_claude_api(self, prompt: str) -> str:
+    def _call_claude_api(self, prompt: str, cached_prefix: Optional[str] = None,
+                         on_text: Optional[Callable[[str], None]] = None) -> str:
+        # With on_text the response is streamed and every text delta is passed on as it arrives
         api_url = "https://api.anthropic.com/v1/messages"
         headers = {
             "x-api-key": self.claude_api_key,
             "anthropic-version": "2023-06-01",
             "content-type": "application/json",
-            "anthropic-beta": "max-tokens-3-5-sonnet-2024-07-15"
+            "anthropic-beta": beta_header("max-tokens-3-5-sonnet-2024-07-15")
         }
+        content = cached_content_blocks([cached_prefix], prompt) if cached_prefix else prompt
         data = {
             "model": "claude-3-5-sonnet-20240620",
             "max_tokens": 8192,
-            "messages": [{"role": "user", "content": prompt}]
+            "messages": [{"role": "user", "content": content}]
         }
 
-        response = requests.post(api_url, headers=headers, json=data)
+        cache = get_cache()
+        cache_key = cache.request_key(api_url, data)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_text:
+                on_text(cached)
+            return cached
+
+        if on_text:
+            text = self._stream_claude_api(api_url, headers, data, on_text)
+            cache.put(cache_key, text)
+            return text
+
+        response = get_client().post(api_url, headers=headers, json=data)
         
         if response.status_code == 200:
             result = response.json()
-            return result['content'][0]['text']
+            text = result['content'][0]['text']
+            self.cache_usage.add_request(result.get('usage'))
+            cache.put(cache_key, text)
+            return text
         else:
             raise Exception(f"Claude API Error: {response.status_code} - {response.text}")
 
+    def _stream_claude_api(self, api_url: str, headers: Dict, data: Dict, on_text: Callable[[str], None]) -> str:
+        response = get_client().post(api_url, headers=headers, json=dict(data, stream=True), stream=True)
+        if response.status_code != 200:
+            raise Exception(f"Claude API Error: {response.status_code} - {response.text}")
+        chunks = []
+        usage: Dict = {}
+        try:
+            for event_type, event in iter_sse_events(response):
+                event_type = event.get('type', event_type)
+                if event_type == 'message_start':
+                    usage.update(event.get('message', {}).get('usage') or {})
+                elif event_type == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+                    chunks.append(event['delta']['text'])
+                    on_text(event['delta']['text'])
+                elif event_type == 'message_delta':
+                    usage['output_tokens'] = event.get('usage', {}).get('output_tokens', usage.get('output_tokens', 0))
+                elif event_type == 'error':
+                    raise Exception(f"Claude API Error: {event['error'].get('type')} - {event['error'].get('message')}")
+                elif event_type == 'message_stop':
+                    break
+        finally:
+            response.close()
+        self.cache_usage.add_request(usage)
+        return "".join(chunks)
+
     def _call_sonar_api(self, prompt: str) -> Dict:
         headers = {
             "Authorization": f"Bearer {self.perplexity_api_key}",
@@ -175,14 +280,71 @@ class InternetSearch:
             "return_citations": True,
             "stream": False
         }
-        response = requests.post("https://api.perplexity.ai/chat/completions", headers=headers, json=data)
+        api_url = "https://api.perplexity.ai/chat/completions"
+        cache = get_cache()
+        cache_key = cache.request_key(api_url, data)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # search_timeout is the budget for the whole term, retries and backoff included
+        response = get_client().post(api_url, headers=headers, json=data, deadline=self.search_timeout)
         
         if response.status_code == 200:
             result = response.json()
-            return result['choices'][0]['message']['content']
+            content = result['choices'][0]['message']['content']
+            # Web results age, so Sonar responses expire much sooner than Claude ones
+            cache.put(cache_key, content, ttl=self.sonar_cache_ttl)
+            return content
         else:
             raise Exception(f"Sonar API Error: {response.status_code} - {response.text}")
 
-    def _save_data(self, data):
-        with open(self.json_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+class SonarSearches:
+    # Sonar searches started one term at a time, possibly while more terms are still being generated; wait()
+    # returns (search term, response) pairs in the order the terms were submitted
+    def __init__(self, search: InternetSearch, checkpoints: CheckpointRun):
+        self.search = search
+        self.checkpoints = checkpoints
+        self.pool = ThreadPoolExecutor(max_workers=max(1, search.max_concurrent_searches))
+        self.terms: List[Dict] = []
+        self.futures = []
+        self.seen = set()
+
+    def submit(self, term: Dict) -> bool:
+        # A term that was already submitted is not searched twice; False when nothing was started
+        if not is_search_term(term) or term['search_term'].strip() in self.seen:
+            return False
+        key = term['search_term'].strip()
+        self.seen.add(key)
+        self.terms.append(term)
+        self.futures.append(self.pool.submit(self.search._search_term, term, self.checkpoints))
+        return True
+
+    def wait(self, progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Tuple[str, str]]:
+        results: List[Optional[Tuple[str, str]]] = [None] * len(self.futures)
+        self.search.failed_search_terms = []
+        if progress_callback:
+            progress_callback(0, len(self.futures))
+        try:
+            indexes = {future: i for i, future in enumerate(self.futures)}
+            for done, future in enumerate(as_completed(indexes), 1):
+                i = indexes[future]
+                term = self.terms[i].get('search_term', '')
+                try:
+                    results[i] = (term, future.result())
+                except Exception as e:
+                    print(f"Search for '{term}' failed: {e}")
+                    self.search.failed_search_terms.append((term, str(e)))
+                if progress_callback:
+                    progress_callback(done, len(self.futures))
+        finally:
+            self.cancel()
+
+        successful = [result for result in results if result is not None]
+        if self.futures and not successful:
+            raise Exception(f"All {len(self.futures)} searches failed: {self.search.failed_search_terms[0][1]}")
+        return successful
+
+    def cancel(self):
+        # Searches that have not started are dropped; running ones finish in the background
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+# jobs.py
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    DONE = "Done"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+
+    def __init__(self, executor, job_id, name, on_success=None, on_error=None, on_progress=None):
+        self.executor = executor
+        self.job_id = job_id
+        self.name = name
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.status = Job.QUEUED
+        self.message = ""
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, message=None, data=None):
+        # Called from the worker thread; the UI thread picks it up on the next poll
+        self.check_cancelled()
+        self.executor._events.put(("progress", self, (message, data)))
+
+
+class JobExecutor:
+    def __init__(self, root, max_workers=4, poll_interval=50):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.jobs = []
+        self._events = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._ids = itertools.count(1)
+        self._listeners = []
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, name, func, *args, on_success=None, on_error=None, on_progress=None, **kwargs):
+        job = Job(self, next(self._ids), name, on_success, on_error, on_progress)
+        self.jobs.append(job)
+        self._pool.submit(self._run, job, func, args, kwargs)
+        self._notify()
+        return job
+
+    def cancel_all(self):
+        for job in self.jobs:
+            if not job.finished:
+                job.cancel()
+
+    def clear_finished(self):
+        self.jobs = [job for job in self.jobs if not job.finished]
+        self._notify()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancelled:
+            self._events.put(("cancelled", job, None))
+            return
+        self._events.put(("started", job, time.time()))
+        try:
+            result = func(job, *args, **kwargs)
+        except JobCancelled:
+            self._events.put(("cancelled", job, None))
+        except Exception as e:
+            self._events.put(("failed", job, e))
+        else:
+            if job.cancelled:
+                self._events.put(("cancelled", job, None))
+            else:
+                self._events.put(("done", job, result))
+
+    def _poll(self):
+        changed = False
+        try:
+            while True:
+                kind, job, payload = self._events.get_nowait()
+                changed = True
+                self._handle_event(kind, job, payload)
+        except queue.Empty:
+            pass
+        if changed:
+            self._notify()
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def _handle_event(self, kind, job, payload):
+        if kind == "started":
+            job.status = Job.RUNNING
+            job.started_at = payload
+        elif kind == "progress":
+            message, data = payload
+            if message is not None:
+                job.message = message
+            if job.on_progress and not job.cancelled:
+                job.on_progress(job, message, data)
+        elif kind == "done":
+            job.status = Job.DONE
+            job.finished_at = time.time()
+            job.message = "Completed."
+            if job.on_success:
+                job.on_success(payload)
+        elif kind == "failed":
+            job.status = Job.FAILED
+            job.finished_at = time.time()
+            job.error = payload
+            job.message = str(payload)
+            if job.on_error:
+                job.on_error(payload)
+        elif kind == "cancelled":
+            job.status = Job.CANCELLED
+            job.finished_at = time.time()
+            job.message = "Cancelled."
+            if job.on_error:
+                job.on_error(JobCancelled())
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            callback()
@@ -0,0 +1,168 @@
+# json_stream.py
+
+import json
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+# Only these characters change the scanner's state; everything between them is skipped in one step
+STRUCTURAL = re.compile(r'["{}\[\],]')
+STRING_SPECIAL = re.compile(r'["\\]')
+TRAILING_COMMA = re.compile(r'("(?:\\.|[^"\\])*")|,(\s*[}\]])')
+CLOSERS = {'{': '}', '[': ']'}
+# Returned by loads_lenient for text that is not JSON, since null is a valid value
+NOT_JSON = object()
+
+
+class JSONStreamExtractor:
+    # Finds balanced top-level JSON objects and arrays in model output, one pass over the text however it is
+    # split into deltas. Prose, code fences and quotes outside a value are skipped. With unwrap_arrays, the
+    # elements of a top-level array are emitted one by one as soon as each is complete, so a caller can act on
+    # the first items while the rest are still being generated. accept filters what is emitted.
+    def __init__(self, unwrap_arrays: bool = True, accept: Optional[Callable[[Any], bool]] = None):
+        self.unwrap_arrays = unwrap_arrays
+        self.accept = accept
+        self.buffer = ''
+        self.position = 0
+        self.stack: List[str] = []
+        self.in_string = False
+        # Start of the value being collected: the top-level value, or the current array element when unwrapping
+        self.value_start: Optional[int] = None
+        self.in_array = False
+        # Commas inside the current value with the open brackets at that point, for repairing a truncated tail
+        self.commas: List[Tuple[int, Tuple[str, ...]]] = []
+
+    def feed(self, text: str) -> List[Any]:
+        self.buffer += text
+        values: List[Any] = []
+        buffer = self.buffer
+        position = self.position
+        while True:
+            if self.in_string:
+                match = STRING_SPECIAL.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                    break
+                if match.group() == '\\':
+                    if match.end() >= len(buffer):
+                        # The escaped character has not arrived yet
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                    continue
+                self.in_string = False
+                position = match.end()
+                continue
+
+            match = STRUCTURAL.search(buffer, position)
+            if match is None:
+                position = len(buffer)
+                break
+            char = match.group()
+            index = match.start()
+            position = match.end()
+            depth = len(self.stack)
+
+            if depth == 0:
+                # Outside any value only an opening bracket matters; quotes here belong to prose
+                if char in CLOSERS:
+                    self.stack.append(char)
+                    self.in_array = self.unwrap_arrays and char == '['
+                    self.value_start = position if self.in_array else index
+                    self.commas = []
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in CLOSERS:
+                if self.in_array and depth == 1 and self.value_start is None:
+                    self.value_start = index
+                self.stack.append(char)
+            elif char == ',':
+                if self.in_array and depth == 1:
+                    self._emit_element(buffer, index, values)
+                    self.value_start = position
+                    self.commas = []
+                elif self.value_start is not None:
+                    self.commas.append((index, tuple(self.stack)))
+            else:
+                self.stack.pop()
+                if not self.stack:
+                    if self.in_array:
+                        self._emit_element(buffer, index, values)
+                    else:
+                        self._emit(buffer[self.value_start:position], values)
+                    self.value_start = None
+                    self.commas = []
+                elif self.in_array and len(self.stack) == 1:
+                    # A nested element is complete; it is emitted now rather than at the next comma
+                    self._emit(buffer[self.value_start:position], values)
+                    self.value_start = None
+                    self.commas = []
+        self.position = position
+        self._compact()
+        return values
+
+    def finish(self) -> List[Any]:
+        # A value cut off mid-stream is closed as far as it can be: an open string is ended, and the text is
+        # cut back to the last comma until what remains parses. Whatever cannot be repaired is dropped.
+        values: List[Any] = []
+        if self.stack and self.value_start is not None:
+            skip = 1 if self.in_array else 0
+            tail = self.buffer[self.value_start:]
+            candidates = [tail + ('"' if self.in_string else '') + closing(self.stack[skip:])]
+            candidates.extend(self.buffer[self.value_start:index] + closing(stack[skip:])
+                              for index, stack in reversed(self.commas))
+            for candidate in candidates:
+                value = loads_lenient(candidate)
+                if value is not NOT_JSON:
+                    self._accept(value, values)
+                    break
+        self.__init__(self.unwrap_arrays, self.accept)
+        return values
+
+    def _emit_element(self, buffer: str, end: int, values: List[Any]):
+        # Scalars in an array end at the next comma or the closing bracket; nested elements were emitted already
+        if self.value_start is not None and buffer[self.value_start:end].strip():
+            self._emit(buffer[self.value_start:end], values)
+
+    def _emit(self, text: str, values: List[Any]):
+        value = loads_lenient(text)
+        if value is not NOT_JSON:
+            self._accept(value, values)
+
+    def _accept(self, value: Any, values: List[Any]):
+        if self.accept is None or self.accept(value):
+            values.append(value)
+
+    def _compact(self):
+        # Text before the value being collected is no longer needed
+        keep = self.value_start if self.value_start is not None else self.position
+        if keep > 0:
+            self.buffer = self.buffer[keep:]
+            self.position -= keep
+            if self.value_start is not None:
+                self.value_start -= keep
+            self.commas = [(index - keep, stack) for index, stack in self.commas]
+
+
+def closing(stack) -> str:
+    return ''.join(CLOSERS[char] for char in reversed(stack))
+
+
+def loads_lenient(text: str) -> Any:
+    # json.loads, retried without trailing commas; NOT_JSON when the text is not JSON
+    text = text.strip()
+    if not text:
+        return NOT_JSON
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA.sub(lambda match: match.group(1) or match.group(2), text))
+    except json.JSONDecodeError:
+        return NOT_JSON
+
+
+def extract_json_values(text: str, unwrap_arrays: bool = True, accept: Optional[Callable[[Any], bool]] = None) -> List[Any]:
+    extractor = JSONStreamExtractor(unwrap_arrays, accept)
+    return extractor.feed(text) + extractor.finish()
@@ -1,6 +1,24 @@
-import tkinter as tk
-from app import ClaudeApp
+import argparse
+import sys
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="University Paper Generator")
+    parser.add_argument("--batch", metavar="JOBS_JSONL", help="run the jobs in a JSONL file without opening the window")
+    parser.add_argument("--results", metavar="RESULTS_JSONL", help="where batch results are appended (default: <jobs>.results.jsonl)")
+    parser.add_argument("--workers", type=int, default=2, help="number of batch jobs processed at once")
+    parser.add_argument("--backend", choices=["messages", "batches"], default="messages",
+                        help="'batches' submits all generations as one Message Batch (cheaper, slower, resumable)")
+    parser.add_argument("--store", default="scolarforge.db", help="project database that provides settings and prompts")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        from batch import run_batch
+        return run_batch(args.batch, args.results, args.workers, args.store, args.backend)
+
+    from app import ClaudeApp
     app = ClaudeApp()
     app.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
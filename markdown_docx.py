@@ -0,0 +1,335 @@
+# markdown_docx.py
+
+import re
+from xml.sax.saxutils import escape, quoteattr
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Emu
+
+TITLE_PAGE_START = '####TITLE PAGE####'
+TITLE_PAGE_END = '####END TITLE PAGE####'
+
+HEADING_PATTERN = re.compile(r'(#{1,3}) +(.*)')
+ORDERED_PATTERN = re.compile(r'( *)(\d+)[.)] +(.*)')
+BULLET_PATTERN = re.compile(r'( *)[-*+] +(.*)')
+# Inline code is matched first so its contents are never read as emphasis; emphasis may nest the other kind
+INLINE_PATTERN = re.compile(
+    r'`([^`]+)`'
+    r'|\*\*\*(?!\s)(.+?)(?<!\s)\*\*\*'
+    r'|\*\*(?!\s)((?:\*(?!\*)(?:[^*]|\*\*[^*]+\*\*)+?\*|[^*])+?)(?<!\s)\*\*'
+    r'|\*(?!\s)((?:\*\*(?!\s).+?(?<!\s)\*\*|[^*])+?)(?<!\s)\*'
+)
+CELL_SEPARATOR = re.compile(r'(?<!\\)\|')
+SEPARATOR_CELL = re.compile(r':?-+:?')
+CODE_FONT = 'Courier New'
+CODE_FONT_XML = f'<w:rFonts w:ascii="{CODE_FONT}" w:hAnsi="{CODE_FONT}"/>'
+# Control characters other than tab and newlines are not allowed in XML at all
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+LIST_INDENT = 2
+MAX_LIST_LEVEL = 3
+
+
+class Block(NamedTuple):
+    kind: str
+    text: str = ''
+    level: int = 0
+    lines: Optional[List[str]] = None
+    number: int = 0
+
+
+class Span(NamedTuple):
+    text: str
+    bold: bool = False
+    italic: bool = False
+    code: bool = False
+
+
+def tokenize(content: str) -> Iterator[Block]:
+    # One pass over the lines; each line is classified by its first character before any pattern runs
+    lines = content.strip().split('\n')
+    i = 0
+    count = len(lines)
+    while i < count:
+        raw = lines[i].rstrip()
+        line = raw.strip()
+        i += 1
+        if not line:
+            continue
+        first = line[0]
+        if line == TITLE_PAGE_START:
+            # Empty lines are kept: they are the spacing of the title page
+            title_lines = []
+            while i < count and lines[i].strip() != TITLE_PAGE_END:
+                title_lines.append(lines[i].strip())
+                i += 1
+            i += 1
+            yield Block('title_page', lines=title_lines)
+        elif first == '#':
+            match = HEADING_PATTERN.fullmatch(line)
+            if match:
+                yield Block('heading', match.group(2).strip(), len(match.group(1)))
+            else:
+                yield Block('paragraph', line)
+        elif first == '|' and line.endswith('|'):
+            table_lines = [line]
+            while i < count:
+                next_line = lines[i].strip()
+                if not (next_line.startswith('|') and next_line.endswith('|')):
+                    break
+                table_lines.append(next_line)
+                i += 1
+            yield Block('table', lines=table_lines)
+        elif first.isdigit() and (match := ORDERED_PATTERN.fullmatch(raw)):
+            yield Block('ordered', match.group(3), list_level(match.group(1)), number=int(match.group(2)))
+        elif first in '-*+' and (match := BULLET_PATTERN.fullmatch(raw)):
+            yield Block('bullet', match.group(2), list_level(match.group(1)))
+        else:
+            yield Block('paragraph', line)
+
+
+def parse_table(lines: List[str]) -> List[List[str]]:
+    # Empty cells are kept, so every cell stays in its column; the |---| separator row is dropped
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('|'):
+            line = line[1:]
+        if line.endswith('|') and not line.endswith('\\|'):
+            line = line[:-1]
+        cells = [cell.strip().replace('\\|', '|') for cell in CELL_SEPARATOR.split(line)]
+        rows.append(cells)
+    if len(rows) > 1 and all(SEPARATOR_CELL.fullmatch(cell) for cell in rows[1]):
+        rows.pop(1)
+    return rows
+
+
+def list_level(indent: str) -> int:
+    return min(len(indent) // LIST_INDENT, MAX_LIST_LEVEL - 1)
+
+
+def parse_inline(text: str, bold: bool = False, italic: bool = False) -> List[Span]:
+    if '*' not in text and '`' not in text:
+        return [Span(text, bold, italic)]
+    spans = []
+    position = 0
+    for match in INLINE_PATTERN.finditer(text):
+        if match.start() > position:
+            spans.append(Span(text[position:match.start()], bold, italic))
+        code, strong_em, strong, em = match.groups()
+        if code is not None:
+            spans.append(Span(code, bold, italic, True))
+        elif strong_em is not None:
+            spans.extend(parse_inline(strong_em, True, True))
+        elif strong is not None:
+            spans.extend(parse_inline(strong, True, italic))
+        else:
+            spans.extend(parse_inline(em, bold, True))
+        position = match.end()
+    if position < len(text):
+        spans.append(Span(text[position:], bold, italic))
+    return spans
+
+
+class DocxStyles(NamedTuple):
+    style_ids: Dict
+    style_num_ids: Dict
+    table_style_id: Optional[str]
+    block_width: int
+
+
+STYLE_NAMES = {
+    'title': 'TitleStyle',
+    'normal': 'Normal',
+    1: 'Heading1Custom',
+    2: 'Heading2Custom',
+    3: 'Heading3Custom',
+    ('bullet', 0): 'List Bullet',
+    ('bullet', 1): 'List Bullet 2',
+    ('bullet', 2): 'List Bullet 3',
+    ('ordered', 0): 'List Number',
+    ('ordered', 1): 'List Number 2',
+    ('ordered', 2): 'List Number 3',
+}
+
+
+def resolve_styles(document) -> DocxStyles:
+    # Paragraph styles are resolved to style ids once per document (or template) instead of going through
+    # python-docx's per-call style lookup
+    styles = {key: document.styles[name] for key, name in STYLE_NAMES.items()}
+    default_style = document.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+    return DocxStyles(
+        # The default style is implied by the absence of w:pStyle, as python-docx does it
+        style_ids={key: (None if style == default_style else style.style_id) for key, style in styles.items()},
+        style_num_ids={key: style_num_id(style) for key, style in styles.items()},
+        table_style_id=document.styles['Table Grid'].style_id,
+        block_width=document._block_width,
+    )
+
+
+def style_num_id(style) -> Optional[int]:
+    p_pr = style.element.pPr
+    if p_pr is None or p_pr.numPr is None or p_pr.numPr.numId is None:
+        return None
+    return p_pr.numPr.numId.val
+
+
+class DocxRenderer:
+    # Every block is written as WordprocessingML text and handed to insert once complete, so the same renderer
+    # can stream into a file or fill a python-docx body; no element objects are built per paragraph or run
+    def __init__(self, styles: DocxStyles, insert: Callable, numbering: Callable):
+        self.styles = styles
+        self.style_ids = styles.style_ids
+        self._insert = insert
+        self._get_numbering = numbering
+        self._numbering = None
+        self._list_num_ids = {}
+        # Last number written at each list level
+        self._list_numbers = {}
+
+    @classmethod
+    def for_document(cls, document) -> 'DocxRenderer':
+        body = document.element.body
+        # New blocks go straight in front of the section properties, which is O(1) per block
+        sect_pr = body.sectPr
+        add = sect_pr.addprevious if sect_pr is not None else body.append
+
+        def insert(xml: str):
+            add(parse_xml(f'<w:body {nsdecls("w")}>{xml}</w:body>')[0])
+        return cls(resolve_styles(document), insert, lambda: document.part.numbering_part.element)
+
+    def render(self, content: str):
+        previous_kind = None
+        previous_level = 0
+        for block in tokenize(content):
+            kind = block.kind
+            if kind == 'paragraph':
+                self.add_paragraph(block.text, 'normal')
+            elif kind == 'heading':
+                self.add_paragraph(block.text, block.level)
+            elif kind == 'bullet':
+                self.add_paragraph(block.text, ('bullet', block.level))
+            elif kind == 'ordered':
+                in_list = previous_kind in ('ordered', 'bullet') and previous_level >= block.level
+                num_id = self.ordered_num_id(block.level, block.number, in_list)
+                self.add_paragraph(block.text, ('ordered', block.level), num_id=num_id)
+            elif kind == 'table':
+                self.add_table(block.lines)
+            elif kind == 'title_page':
+                self.add_title_page(block.lines)
+            if kind in ('ordered', 'bullet'):
+                # Deeper sub-lists belong to the previous item and restart under this one
+                self._list_numbers = {level: number for level, number in self._list_numbers.items() if level <= block.level}
+            previous_kind = kind
+            previous_level = block.level
+
+    def paragraph_xml(self, style_key=None, num_id: Optional[int] = None, center: bool = False,
+                      content: str = '') -> str:
+        # Children follow the schema order of w:pPr: pStyle, numPr, jc
+        properties = ''
+        style_id = self.style_ids[style_key] if style_key is not None else None
+        if style_id:
+            properties += f'<w:pStyle w:val={quoteattr(style_id)}/>'
+        if num_id is not None:
+            properties += f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>'
+        if center:
+            properties += '<w:jc w:val="center"/>'
+        if properties:
+            return f'<w:p><w:pPr>{properties}</w:pPr>{content}</w:p>'
+        return f'<w:p>{content}</w:p>'
+
+    def add_paragraph(self, text: str, style_key, num_id: Optional[int] = None, center: bool = False):
+        self._insert(self.paragraph_xml(style_key, num_id, center, runs_xml(text)))
+
+    def add_title_page(self, lines: List[str]):
+        for line in lines:
+            if line.startswith('#'):
+                self.add_paragraph(line.lstrip('#').strip(), 'title', center=True)
+            else:
+                self.add_paragraph(line, 'normal', center=True)
+        self._insert(self.paragraph_xml(content='<w:r><w:br w:type="page"/></w:r>'))
+
+    def add_table(self, lines: List[str]):
+        # The whole table is written in one pass, the same markup python-docx's add_table produces; filling it
+        # through cell(row, col) instead would rescan the table XML for every cell
+        rows = parse_table(lines)
+        if not rows:
+            return
+        cols = max(len(row) for row in rows)
+        col_width = Emu(self.styles.block_width // cols).twips
+        style = self.styles.table_style_id
+        parts = ['<w:tbl><w:tblPr>']
+        if style:
+            parts.append(f'<w:tblStyle w:val={quoteattr(style)}/>')
+        parts.append('<w:tblW w:type="auto" w:w="0"/><w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" '
+                     'w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr><w:tblGrid>')
+        parts.append(f'<w:gridCol w:w="{col_width}"/>' * cols)
+        parts.append('</w:tblGrid>')
+        cell_start = f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{col_width}"/></w:tcPr><w:p><w:pPr><w:jc w:val="left"/></w:pPr>'
+        for row in rows:
+            parts.append('<w:tr>')
+            for col in range(cols):
+                # Ragged rows are padded with empty cells
+                parts.append(cell_start)
+                if col < len(row):
+                    parts.append(runs_xml(row[col]))
+                parts.append('</w:p></w:tc>')
+            parts.append('</w:tr>')
+        parts.append('</w:tbl>')
+        self._insert(''.join(parts))
+
+    def ordered_num_id(self, level: int, number: int, in_list: bool) -> Optional[int]:
+        # Items of one list continue its numbering, and so does an item after a paragraph when its number follows
+        # on. Any other item starts a new list at the number the author wrote.
+        last = self._list_numbers.get(level)
+        if last is not None and (in_list or number == last + 1):
+            self._list_numbers[level] = last + 1
+            return self.list_num_id(level)
+        self._list_numbers[level] = number
+        return self.list_num_id(level, start=number)
+
+    def list_num_id(self, level: int, start: Optional[int] = None) -> Optional[int]:
+        # start begins a new list numbered from it; without it the current list at this level goes on
+        style_num_id = self.styles.style_num_ids[('ordered', level)]
+        if style_num_id is None:
+            return None
+        if start is not None or level not in self._list_num_ids:
+            numbering = self._numbering_element()
+            abstract_num_id = numbering.num_having_numId(style_num_id).abstractNumId.val
+            num = numbering.add_num(abstract_num_id)
+            num.add_lvlOverride(ilvl=0).add_startOverride(1 if start is None else start)
+            # Deeper sub-lists belong to the previous item and restart under the next one
+            self._list_num_ids = {key: value for key, value in self._list_num_ids.items() if key < level}
+            self._list_num_ids[level] = num.numId
+        return self._list_num_ids[level]
+
+    def _numbering_element(self):
+        if self._numbering is None:
+            self._numbering = self._get_numbering()
+        return self._numbering
+
+
+def runs_xml(text: str) -> str:
+    return ''.join(run_xml(span) for span in parse_inline(text) if span.text)
+
+
+def run_xml(span: Span) -> str:
+    properties = ''
+    if span.code:
+        properties += CODE_FONT_XML
+    if span.bold:
+        properties += '<w:b/>'
+    if span.italic:
+        properties += '<w:i/>'
+    parts = [f'<w:r><w:rPr>{properties}</w:rPr>' if properties else '<w:r>']
+    # Tabs are their own element in OOXML; everything else is literal text
+    for i, piece in enumerate(INVALID_XML_CHARS.sub('', span.text).split('\t')):
+        if i:
+            parts.append('<w:tab/>')
+        if piece:
+            space = ' xml:space="preserve"' if piece[0].isspace() or piece[-1].isspace() else ''
+            parts.append(f'<w:t{space}>{escape(piece)}</w:t>')
+    parts.append('</w:r>')
+    return ''.join(parts)
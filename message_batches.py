@@ -0,0 +1,121 @@
+# message_batches.py
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from http_client import get_client
+from prompt_cache import beta_header
+
+# The API accepts up to 100,000 requests per batch
+MAX_BATCH_REQUESTS = 100000
+
+
+class BatchError(Exception):
+    pass
+
+
+class MessageBatchClient:
+    api_url = "https://api.anthropic.com/v1/messages/batches"
+
+    def __init__(self, api_key: str, poll_interval: float = 10.0, max_poll_interval: float = 300.0, poll_backoff: float = 1.5):
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff = poll_backoff
+
+    def headers(self) -> Dict[str, str]:
+        # The batched params are built by APIHandler.build_request, so they need the same betas as a direct call
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+            "anthropic-beta": beta_header("max-tokens-3-5-sonnet-2024-07-15", "message-batches-2024-09-24")
+        }
+
+    def submit(self, requests: List[Tuple[str, Dict]]) -> Dict:
+        # requests: (custom_id, Messages API params) pairs
+        if not requests:
+            raise BatchError("A batch needs at least one request.")
+        if len(requests) > MAX_BATCH_REQUESTS:
+            raise BatchError(f"A batch can hold at most {MAX_BATCH_REQUESTS} requests.")
+        body = {"requests": [{"custom_id": custom_id, "params": params} for custom_id, params in requests]}
+        response = get_client().post(self.api_url, headers=self.headers(), json=body)
+        return self._json(response)
+
+    def retrieve(self, batch_id: str) -> Dict:
+        return self._json(get_client().get(f"{self.api_url}/{batch_id}", headers=self.headers()))
+
+    def cancel(self, batch_id: str) -> Dict:
+        return self._json(get_client().post(f"{self.api_url}/{batch_id}/cancel", headers=self.headers()))
+
+    def wait(self, batch_id: str, on_poll: Optional[Callable[[Dict], None]] = None,
+             stop_event: Optional[threading.Event] = None) -> Dict:
+        # Polls until processing has ended, backing off because large batches take minutes to hours
+        interval = self.poll_interval
+        while True:
+            batch = self.retrieve(batch_id)
+            if on_poll:
+                on_poll(batch)
+            if batch.get('processing_status') == 'ended':
+                return batch
+            if stop_event is not None:
+                if stop_event.wait(interval):
+                    raise BatchError(f"Stopped while waiting for batch {batch_id}.")
+            else:
+                time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * self.poll_backoff)
+
+    def iter_results(self, batch: Dict) -> Iterator[Tuple[str, Dict]]:
+        # The results file is JSONL; it is streamed so thousands of long papers are never held in memory at once
+        results_url = batch.get('results_url') or f"{self.api_url}/{batch['id']}/results"
+        response = get_client().get(results_url, headers=self.headers(), stream=True)
+        if response.status_code != 200:
+            raise BatchError(f"Batch results error: {response.status_code} - {response.text}")
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    entry = json.loads(line)
+                    yield entry['custom_id'], entry['result']
+        finally:
+            response.close()
+
+    def _json(self, response) -> Dict:
+        if response.status_code != 200:
+            raise BatchError(f"Message Batches API error: {response.status_code} - {response.text}")
+        return response.json()
+
+
+def result_message(result: Dict) -> Tuple[str, Dict]:
+    # Returns (text, usage) of a succeeded result; anything else becomes an error for that one job
+    if result.get('type') != 'succeeded':
+        error = result.get('error', {})
+        detail = error.get('error', error).get('message', '') if isinstance(error, dict) else str(error)
+        raise BatchError(f"Batch request {result.get('type', 'failed')}: {detail}".strip().rstrip(':'))
+    message = result['message']
+    text = "".join(block.get('text', '') for block in message.get('content', []) if block.get('type') == 'text')
+    return text.strip(), message.get('usage', {})
+
+
+class BatchState:
+    # Remembers a submitted batch on disk so a restarted run polls it instead of submitting and paying again
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state: Dict):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
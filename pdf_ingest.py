@@ -0,0 +1,140 @@
+# pdf_ingest.py
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+# Bump when page extraction changes so cached extractions are not reused
+EXTRACTOR_VERSION = 1
+
+
+# The document this thread read last; consecutive chunks of one file reuse it instead of parsing the PDF again.
+# Worker processes keep theirs between tasks; upload jobs in the app's threads each have their own.
+_documents = threading.local()
+
+
+def _reader_for(file_path: str) -> PyPDF2.PdfReader:
+    document = getattr(_documents, 'current', None)
+    if document is None or document[0] != file_path:
+        _close_document()
+        f = open(file_path, 'rb')
+        try:
+            _documents.current = (file_path, f, PyPDF2.PdfReader(f))
+        except Exception:
+            f.close()
+            raise
+    return _documents.current[2]
+
+
+def _close_document():
+    document = getattr(_documents, 'current', None)
+    if document is not None:
+        document[1].close()
+        _documents.current = None
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[str]:
+    # Runs in a worker process; only page text crosses the process boundary
+    reader = _reader_for(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+class PDFIngestor:
+    extractor_id = f"pypdf2-{PyPDF2.__version__}/{EXTRACTOR_VERSION}"
+
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: int = 16,
+                 max_pending_tasks: Optional[int] = None, min_pages_for_pool: int = 48):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.pages_per_task = pages_per_task
+        # Bounds how many page chunks are extracted but not yet consumed
+        self.max_pending_tasks = max_pending_tasks or self.max_workers * 2
+        self.min_pages_for_pool = min_pages_for_pool
+
+    def count_pages(self, file_path: str) -> int:
+        return len(_reader_for(file_path).pages)
+
+    def iter_files(self, file_paths: List[str], progress_callback: Optional[Callable[[int, int], None]] = None
+                   ) -> Iterator[Tuple[int, List[str], Optional[Exception]]]:
+        # Yields (file index, page texts, error) for each file in order, as soon as its last page is extracted, so
+        # only one file's pages are held besides the chunks in flight. A file that cannot be read yields its error
+        # (and no pages) without stopping the others.
+        tasks = []
+        errors = {}
+        try:
+            for file_index, file_path in enumerate(file_paths):
+                try:
+                    page_count = self.count_pages(file_path)
+                except Exception as e:
+                    errors[file_index] = e
+                    continue
+                for start in range(0, page_count, self.pages_per_task):
+                    tasks.append((file_index, file_path, start, min(start + self.pages_per_task, page_count)))
+        finally:
+            _close_document()
+        total_pages = sum(stop - start for _, _, start, stop in tasks)
+
+        if total_pages < self.min_pages_for_pool or self.max_workers == 1:
+            chunks = self._iter_sequential(tasks, total_pages, progress_callback)
+        else:
+            chunks = self._iter_parallel(tasks, total_pages, progress_callback)
+
+        current = 0
+        pages: List[str] = []
+        for file_index, result in chunks:
+            while current < file_index:
+                yield current, pages, errors.get(current)
+                current += 1
+                pages = []
+            if isinstance(result, Exception):
+                errors.setdefault(file_index, result)
+            if file_index in errors:
+                pages = []
+            else:
+                pages.extend(result)
+        while current < len(file_paths):
+            yield current, pages, errors.get(current)
+            current += 1
+            pages = []
+
+    def _iter_sequential(self, tasks, total_pages, progress_callback):
+        # Yields (file index, page texts or the exception that stopped the chunk) in task order
+        done = 0
+        try:
+            for file_index, file_path, start, stop in tasks:
+                try:
+                    yield file_index, _extract_pages(file_path, start, stop)
+                except Exception as e:
+                    yield file_index, e
+                done += stop - start
+                if progress_callback:
+                    progress_callback(done, total_pages)
+        finally:
+            _close_document()
+
+    def _iter_parallel(self, tasks, total_pages, progress_callback):
+        # Spawned workers avoid forking a process that already runs Tk and worker threads
+        pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        pending = deque()
+        next_task = 0
+        done = 0
+        try:
+            while pending or next_task < len(tasks):
+                while next_task < len(tasks) and len(pending) < self.max_pending_tasks:
+                    file_index, file_path, start, stop = tasks[next_task]
+                    pending.append((file_index, stop - start, pool.submit(_extract_pages, file_path, start, stop)))
+                    next_task += 1
+                file_index, page_count, future = pending.popleft()
+                try:
+                    yield file_index, future.result()
+                except Exception as e:
+                    yield file_index, e
+                done += page_count
+                if progress_callback:
+                    progress_callback(done, total_pages)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,348 @@
+# project_store.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS documents_kind_position ON documents (kind, position);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    author TEXT NOT NULL,
+    date TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS search_results (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    size INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    name TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Legacy files written by earlier versions, migrated once into the store
+LEGACY_SETTINGS_FILE = 'claude_app_settings.json'
+LEGACY_COLLECTION_FILES = {
+    'scripts': 'script_texts.json',
+    'instructions': 'instruction_texts.json',
+    'internet_sources': 'internet_sources.json',
+    'internet_search_results': 'internet_search_results.json',
+}
+MIGRATED_KEY = '_migrated_from_json'
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class LazyDocument:
+    # Behaves like the (name, content) tuples used for scripts and instructions, but only
+    # reads the content from the store when it is actually accessed. Unpacking it reads the
+    # content too, so code that only needs the name uses .name or [0]
+    __slots__ = ('store', 'collection', 'row_id', 'name', 'size', 'content_hash')
+
+    def __init__(self, store, collection, row_id, name, size, content_hash):
+        self.store = store
+        self.collection = collection
+        self.row_id = row_id
+        self.name = name
+        self.size = size
+        self.content_hash = content_hash
+
+    @property
+    def content(self) -> str:
+        return self.store.get_body(self.collection, self.row_id)
+
+    def __getitem__(self, index):
+        if index in (0, -2):
+            return self.name
+        if index in (1, -1):
+            return self.content
+        if isinstance(index, int):
+            raise IndexError("LazyDocument index out of range")
+        return (self.name, self.content)[index]
+
+    def __iter__(self):
+        yield self.name
+        yield self.content
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return f"LazyDocument({self.name!r}, {self.size} chars)"
+
+
+class LazyRecord(Mapping):
+    # Dict-like view of an internet source or search result whose 'content' is read on demand
+    def __init__(self, store, collection, row_id, metadata, size, content_hash):
+        self.store = store
+        self.collection = collection
+        self.row_id = row_id
+        self.metadata = metadata
+        self.size = size
+        self.content_hash = content_hash
+
+    def __getitem__(self, key):
+        if key == 'content':
+            return self.store.get_body(self.collection, self.row_id)
+        return self.metadata[key]
+
+    def __iter__(self):
+        yield from self.metadata
+        yield 'content'
+
+    def __len__(self):
+        return len(self.metadata) + 1
+
+    def __repr__(self):
+        return f"LazyRecord({self.metadata!r}, {self.size} chars)"
+
+
+class ProjectStore:
+    COLLECTIONS = ('scripts', 'instructions', 'internet_sources', 'internet_search_results')
+
+    def __init__(self, path: str = 'scolarforge.db'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        self._conn.commit()
+        # Row ids in display order, so list indexes from the UI map to rows without a scan
+        self._ids: Dict[str, List[int]] = {name: [] for name in self.COLLECTIONS}
+
+    # Collections
+
+    def load_collection(self, collection: str) -> List[Any]:
+        # Only metadata is read here; bodies stay on disk until a prompt or viewer needs them
+        with self._lock:
+            table, where, params = self._table(collection)
+            columns = self._metadata_columns(collection)
+            rows = self._conn.execute(
+                f"SELECT id, size, content_hash, {', '.join(columns)} FROM {table}{where} ORDER BY position", params
+            ).fetchall()
+        self._ids[collection] = [row[0] for row in rows]
+        return [self._to_item(collection, row) for row in rows]
+
+    def get_body(self, collection: str, row_id: int) -> str:
+        table, _, _ = self._table(collection)
+        with self._lock:
+            row = self._conn.execute(f"SELECT content FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"{collection} item {row_id} no longer exists")
+        return row[0]
+
+    def append(self, collection: str, item: Any) -> int:
+        with self._lock, self._conn:
+            row_id = self._insert(collection, item, self._next_position(collection))
+        self._ids[collection].append(row_id)
+        return row_id
+
+    def swap(self, collection: str, i: int, j: int):
+        ids = self._ids[collection]
+        table, _, _ = self._table(collection)
+        with self._lock, self._conn:
+            positions = dict(self._conn.execute(
+                f"SELECT id, position FROM {table} WHERE id IN (?, ?)", (ids[i], ids[j])
+            ).fetchall())
+            self._conn.execute(f"UPDATE {table} SET position = ? WHERE id = ?", (positions[ids[j]], ids[i]))
+            self._conn.execute(f"UPDATE {table} SET position = ? WHERE id = ?", (positions[ids[i]], ids[j]))
+        ids[i], ids[j] = ids[j], ids[i]
+
+    def delete(self, collection: str, index: int):
+        table, _, _ = self._table(collection)
+        row_id = self._ids[collection].pop(index)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+
+    def replace(self, collection: str, items: List[Any]):
+        table, where, params = self._table(collection)
+        with self._lock:
+            # Materialize lazy items before their rows are deleted
+            values = [self._materialize(collection, item) for item in items]
+            with self._conn:
+                self._conn.execute(f"DELETE FROM {table}{where}", params)
+                ids = [self._insert(collection, value, position) for position, value in enumerate(values)]
+            # Lazy items held by the caller keep working against the re-inserted rows
+            for item, row_id in zip(items, ids):
+                if isinstance(item, (LazyDocument, LazyRecord)) and item.store is self:
+                    item.row_id = row_id
+        self._ids[collection] = ids
+
+    # Settings and prompts
+
+    def get_settings(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM settings").fetchall()
+        return {key: json.loads(value) for key, value in rows if not key.startswith('_')}
+
+    def set_settings(self, settings: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in settings.items()]
+            )
+
+    def get_prompts(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, content FROM prompts ORDER BY rowid").fetchall())
+
+    def set_prompts(self, prompts: Dict[str, str]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM prompts")
+            self._conn.executemany("INSERT INTO prompts (name, content) VALUES (?, ?)", list(prompts.items()))
+
+    # Migration
+
+    def migrate_from_json(self, directory: str = '.') -> bool:
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM settings WHERE key = ?", (MIGRATED_KEY,)).fetchone():
+                return False
+
+            settings = self._read_json(os.path.join(directory, LEGACY_SETTINGS_FILE)) or {}
+            collections = {}
+            for collection, filename in LEGACY_COLLECTION_FILES.items():
+                data = self._read_json(os.path.join(directory, filename))
+                collections[collection] = data if data is not None else settings.get(collection, [])
+                settings.pop(collection, None)
+            custom_prompts = settings.pop('custom_prompts', None)
+
+            for collection, items in collections.items():
+                self.replace(collection, items)
+            if custom_prompts:
+                self.set_prompts(custom_prompts)
+            settings[MIGRATED_KEY] = True
+            self.set_settings(settings)
+            return True
+
+    def _upgrade_schema(self):
+        # Databases created before size/hash tracking get the new columns filled in once
+        for table in ('documents', 'sources', 'search_results'):
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            missing = [column for column in ('content', 'size', 'content_hash') if column not in columns]
+            if not missing:
+                continue
+            for column in missing:
+                default = "0" if column == 'size' else "''"
+                kind = "INTEGER" if column == 'size' else "TEXT"
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind} NOT NULL DEFAULT {default}")
+            if table == 'search_results':
+                for row_id, data in self._conn.execute("SELECT id, data FROM search_results").fetchall():
+                    metadata = json.loads(data)
+                    content = str(metadata.pop('content', ''))
+                    self._conn.execute(
+                        "UPDATE search_results SET data = ?, content = ?, size = ?, content_hash = ? WHERE id = ?",
+                        (json.dumps(metadata, ensure_ascii=False), content, len(content), _content_hash(content), row_id)
+                    )
+            else:
+                for row_id, content in self._conn.execute(f"SELECT id, content FROM {table}").fetchall():
+                    self._conn.execute(
+                        f"UPDATE {table} SET size = ?, content_hash = ? WHERE id = ?",
+                        (len(content), _content_hash(content), row_id)
+                    )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Helpers
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Any]:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _table(self, collection: str):
+        if collection == 'scripts':
+            return 'documents', ' WHERE kind = ?', ('script',)
+        if collection == 'instructions':
+            return 'documents', ' WHERE kind = ?', ('instruction',)
+        if collection == 'internet_sources':
+            return 'sources', '', ()
+        if collection == 'internet_search_results':
+            return 'search_results', '', ()
+        raise ValueError(f"Unknown collection: {collection}")
+
+    def _metadata_columns(self, collection: str) -> List[str]:
+        if collection in ('scripts', 'instructions'):
+            return ['name']
+        if collection == 'internet_sources':
+            return ['url', 'author', 'date']
+        return ['data']
+
+    def _to_item(self, collection: str, row):
+        row_id, size, content_hash, *values = row
+        if collection in ('scripts', 'instructions'):
+            return LazyDocument(self, collection, row_id, values[0], size, content_hash)
+        if collection == 'internet_sources':
+            metadata = dict(zip(self._metadata_columns(collection), values))
+        else:
+            metadata = json.loads(values[0])
+        return LazyRecord(self, collection, row_id, metadata, size, content_hash)
+
+    def _materialize(self, collection: str, item: Any):
+        if collection in ('scripts', 'instructions'):
+            name, content = item
+            return name, content
+        return dict(item)
+
+    def _next_position(self, collection: str) -> int:
+        table, where, params = self._table(collection)
+        row = self._conn.execute(f"SELECT COALESCE(MAX(position), -1) FROM {table}{where}", params).fetchone()
+        return row[0] + 1
+
+    def _insert(self, collection: str, item: Any, position: int) -> int:
+        if collection in ('scripts', 'instructions'):
+            name, content = item
+            cursor = self._conn.execute(
+                "INSERT INTO documents (kind, position, name, content, size, content_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                (collection[:-1], position, name, content, len(content), _content_hash(content))
+            )
+        elif collection == 'internet_sources':
+            content = item['content']
+            cursor = self._conn.execute(
+                "INSERT INTO sources (position, url, author, date, content, size, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (position, item['url'], item['author'], item['date'], content, len(content), _content_hash(content))
+            )
+        else:
+            metadata = {key: value for key, value in item.items() if key != 'content'}
+            content = str(item.get('content', ''))
+            cursor = self._conn.execute(
+                "INSERT INTO search_results (position, data, content, size, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (position, json.dumps(metadata, ensure_ascii=False), content, len(content), _content_hash(content))
+            )
+        return cursor.lastrowid
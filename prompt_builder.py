@@ -0,0 +1,173 @@
+# prompt_builder.py
+
+import time
+from collections import OrderedDict
+from string import Formatter
+from typing import Any, Callable, Dict, List, Tuple
+
+from project_store import LazyDocument, LazyRecord
+
+SEGMENT_SEPARATOR = "\n\n"
+# Characters of formatted segments kept between builds. Past it the least recently used ones are dropped and their
+# bodies read again on the next build, so a large store-backed corpus is not held in memory twice.
+MAX_CACHED_SEGMENT_CHARS = 8_000_000
+
+
+def format_script_segment(i: int, script) -> str:
+    name, content = script
+    return f"Script {i+1} ({name}):\n{content}\n!!!this is the next document!!!"
+
+
+def format_instruction_segment(i: int, instruction) -> str:
+    name, content = instruction
+    return f"Instruction {i+1} ({name}):\n{content}\n!!!this is the next document!!!"
+
+
+def format_internet_source_segment(i: int, source) -> str:
+    return f"Internet Source {i+1} (URL: {source['url']}, Author: {source['author']}, Date: {source['date']}):\n{source['content']}\n!!!this is the next document!!!"
+
+
+def format_internet_search_result_segment(i: int, result) -> str:
+    # Stored results always have a content key, so an empty one gets the placeholder too
+    return f"Internet Search Result {i+1} (Title: {result.get('title', 'Unknown')}, URL: {result.get('url', 'unknown')}, Author: {result.get('author', 'Unknown')}, Date Retrieved: {result.get('date_retrieved', 'N/A')}):\n{result.get('content') or 'No content available'}\n!!!this is the next document!!!"
+
+
+# Template field -> (collection attribute, segment formatter)
+CORPUS_FIELDS: Dict[str, Tuple[str, Callable[[int, Any], str]]] = {
+    'scripts': ('scripts', format_script_segment),
+    'instructions': ('instructions', format_instruction_segment),
+    'internet': ('internet_sources', format_internet_source_segment),
+    'internet_search': ('internet_search_results', format_internet_search_result_segment),
+}
+
+
+class PromptBuilder:
+    def __init__(self, max_cached_chars: int = MAX_CACHED_SEGMENT_CHARS):
+        # (collection, position, identity) -> (item, formatted segment), least recently used first
+        self._segments: 'OrderedDict[Any, Tuple[Any, str]]' = OrderedDict()
+        self._cached_chars = 0
+        self.max_cached_chars = max_cached_chars
+        self._templates: Dict[str, List[Tuple[str, Any, Any, Any]]] = {}
+        self._formatter = Formatter()
+        self.last_timings: Dict[str, float] = {}
+        self.last_parts: Tuple[List[str], str] = ([], "")
+
+    def build(self, template: str, collections: Dict[str, List[Any]], **fields) -> str:
+        start = time.perf_counter()
+        reused = rebuilt = 0
+        segments = {}
+        for field, (collection, format_segment) in CORPUS_FIELDS.items():
+            parts, field_reused = self.segments(collection, collections.get(collection, []), format_segment)
+            segments[field] = parts
+            reused += field_reused
+            rebuilt += len(parts) - field_reused
+        segments_done = time.perf_counter()
+
+        stable_parts, variable_part = self._assemble(template, segments, fields)
+        # Kept so API requests can mark the corpus prefix for prompt caching
+        self.last_parts = (stable_parts, variable_part)
+        prompt = "".join(stable_parts) + variable_part
+        end = time.perf_counter()
+        self.last_timings = {
+            'segments_ms': (segments_done - start) * 1000,
+            'assemble_ms': (end - segments_done) * 1000,
+            'total_ms': (end - start) * 1000,
+            'reused_segments': reused,
+            'rebuilt_segments': rebuilt,
+            'cached_chars': self._cached_chars,
+        }
+        return prompt
+
+    def segments(self, collection: str, items: List[Any], format_segment: Callable[[int, Any], str]) -> Tuple[List[str], int]:
+        keys = set()
+        parts = []
+        reused = 0
+        for i, item in enumerate(items):
+            key = (collection, i, self._identity(item))
+            keys.add(key)
+            cached = self._segments.get(key)
+            # Plain tuples and dicts are keyed by object identity, so the cached object must still be the same one
+            if cached is not None and (isinstance(item, (LazyDocument, LazyRecord)) or cached[0] is item):
+                segment = cached[1]
+                self._segments.move_to_end(key)
+                reused += 1
+            else:
+                segment = format_segment(i, item)
+                self._put(key, item, segment)
+            parts.append(segment)
+        # Only segments of the current corpus are kept
+        for key in [key for key in self._segments if key[0] == collection and key not in keys]:
+            self._drop(key)
+        while self._cached_chars > self.max_cached_chars:
+            self._drop(next(iter(self._segments)))
+        return parts, reused
+
+    def timings_summary(self) -> str:
+        timings = self.last_timings
+        if not timings:
+            return "Prompt: not built yet"
+        return (f"Prompt built in {timings['total_ms']:.1f} ms ({timings['segments_ms']:.1f} ms segments, "
+                f"{timings['assemble_ms']:.1f} ms assembly); {timings['reused_segments']:,} segments reused, "
+                f"{timings['rebuilt_segments']:,} rebuilt")
+
+    def clear(self):
+        self._segments.clear()
+        self._cached_chars = 0
+
+    def _put(self, key, item, segment: str):
+        self._drop(key)
+        self._segments[key] = (item, segment)
+        self._cached_chars += len(segment)
+
+    def _drop(self, key):
+        cached = self._segments.pop(key, None)
+        if cached is not None:
+            self._cached_chars -= len(cached[1])
+
+    def _identity(self, item):
+        if isinstance(item, LazyDocument):
+            return ('doc', item.name, item.content_hash)
+        if isinstance(item, LazyRecord):
+            return ('record', tuple(sorted((k, repr(v)) for k, v in item.metadata.items())), item.content_hash)
+        return ('object', id(item))
+
+    def _parse_template(self, template: str):
+        parsed = self._templates.get(template)
+        if parsed is None:
+            parsed = list(self._formatter.parse(template))
+            self._templates = {template: parsed}
+        return parsed
+
+    def _assemble(self, template: str, segments: Dict[str, List[str]], fields: Dict[str, Any]) -> Tuple[List[str], str]:
+        # Equivalent to template.format(...), but corpus segments are spliced straight into a single join.
+        # The result is cut after each corpus field: everything up to the last one is the stable prefix.
+        stable_parts = []
+        pieces = []
+        for literal, field_name, format_spec, conversion in self._parse_template(template):
+            if literal:
+                pieces.append(literal)
+            if field_name is None:
+                continue
+            if field_name in segments and not format_spec and not conversion:
+                parts = segments[field_name]
+                for j, part in enumerate(parts):
+                    if j:
+                        pieces.append(SEGMENT_SEPARATOR)
+                    pieces.append(part)
+                stable_parts.append("".join(pieces))
+                pieces = []
+                continue
+            if field_name in segments:
+                value = SEGMENT_SEPARATOR.join(segments[field_name])
+            elif field_name == '' or field_name.isdigit():
+                raise IndexError("Replacement index out of range for positional args tuple")
+            else:
+                value, _ = self._formatter.get_field(field_name, (), fields)
+            if format_spec and '{' in format_spec:
+                format_spec = self._formatter.vformat(format_spec, (), fields)
+            value = self._formatter.convert_field(value, conversion)
+            pieces.append(self._formatter.format_field(value, format_spec or ''))
+            if field_name in segments:
+                stable_parts.append("".join(pieces))
+                pieces = []
+        return stable_parts, "".join(pieces)
@@ -0,0 +1,82 @@
+# prompt_cache.py
+
+from typing import Dict, List, Optional
+
+CACHE_CONTROL = {"type": "ephemeral"}
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+# The API allows at most four breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+# Prefixes shorter than ~1024 tokens are never cached, so a breakpoint there would only use up the allowance
+MIN_CACHEABLE_CHARS = 3600
+
+
+def beta_header(*features: str) -> str:
+    return ",".join(list(features) + [PROMPT_CACHING_BETA])
+
+
+def cached_content_blocks(stable_parts: List[str], variable_part: str = "") -> List[Dict]:
+    # Large stable parts end with a breakpoint, so editing a later part still reuses the cache up to the earlier
+    # ones; the end of the whole stable prefix is always a breakpoint once it is long enough to be cached
+    stable_parts = [part for part in stable_parts if part]
+    blocks = []
+    prefix_chars = 0
+    unmarked_chars = 0
+    for i, part in enumerate(stable_parts):
+        prefix_chars += len(part)
+        unmarked_chars += len(part)
+        block = {"type": "text", "text": part}
+        is_last = i == len(stable_parts) - 1
+        if prefix_chars >= MIN_CACHEABLE_CHARS and (unmarked_chars >= MIN_CACHEABLE_CHARS or is_last):
+            block["cache_control"] = CACHE_CONTROL
+            unmarked_chars = 0
+        blocks.append(block)
+    marked = [block for block in blocks if "cache_control" in block]
+    for block in marked[:-MAX_CACHE_BREAKPOINTS]:
+        del block["cache_control"]
+    if variable_part or not blocks:
+        blocks.append({"type": "text", "text": variable_part})
+    return blocks
+
+
+class CacheUsage:
+    def __init__(self):
+        self.input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.output_tokens = 0
+        self.requests = 0
+
+    def update(self, usage: Optional[Dict]):
+        if not usage:
+            return
+        self.input_tokens += usage.get('input_tokens') or 0
+        self.cache_creation_input_tokens += usage.get('cache_creation_input_tokens') or 0
+        self.cache_read_input_tokens += usage.get('cache_read_input_tokens') or 0
+        self.output_tokens += usage.get('output_tokens') or 0
+
+    def merge(self, other: 'CacheUsage'):
+        self.input_tokens += other.input_tokens
+        self.cache_creation_input_tokens += other.cache_creation_input_tokens
+        self.cache_read_input_tokens += other.cache_read_input_tokens
+        self.output_tokens += other.output_tokens
+        self.requests += other.requests
+
+    def add_request(self, usage: Optional[Dict]):
+        self.requests += 1
+        self.update(usage)
+
+    @property
+    def total_input_tokens(self) -> int:
+        return self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.total_input_tokens
+        return self.cache_read_input_tokens / total if total else 0.0
+
+    def summary(self) -> str:
+        if not self.cache_creation_input_tokens and not self.cache_read_input_tokens:
+            return ""
+        return (f"Prompt cache: {self.cache_read_input_tokens:,} tokens read, "
+                f"{self.cache_creation_input_tokens:,} written, {self.input_tokens:,} uncached "
+                f"({self.hit_ratio:.0%} of input from cache)")
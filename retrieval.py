@@ -0,0 +1,286 @@
+# retrieval.py
+
+import hashlib
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from project_store import LazyDocument, LazyRecord
+
+try:
+    import numpy as np
+except ImportError:  # NumPy only speeds up scoring; the pure-Python path gives the same ranking
+    np = None
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "you your we our i he she they them his her their which who what when where how not no can all any "
+    "also into than then there these those such may should would could been being do does did".split()
+)
+PASSAGE_GAP = "\n[...]\n"
+# Removed passages leave gaps in the passage list; once they make up this share of it the index is renumbered
+MAX_REMOVED_SHARE = 0.25
+# Collections that are searched; instructions form the query and are always sent in full
+RETRIEVABLE_COLLECTIONS = ('scripts', 'internet_sources', 'internet_search_results')
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_chars: int = 1200) -> List[str]:
+    chunks = []
+    current = []
+    current_length = 0
+    for paragraph in PARAGRAPH_PATTERN.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Paragraphs longer than a chunk are split on whitespace
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(' ', 0, chunk_chars)
+            cut = cut if cut > chunk_chars // 2 else chunk_chars
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_length = [], 0
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current_length + len(paragraph) > chunk_chars and current:
+            chunks.append("\n\n".join(current))
+            current, current_length = [], 0
+        current.append(paragraph)
+        current_length += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class Passage:
+    __slots__ = ('doc_key', 'collection', 'chunk_index', 'text')
+
+    def __init__(self, doc_key, collection: str, chunk_index: int, text: str):
+        self.doc_key = doc_key
+        self.collection = collection
+        self.chunk_index = chunk_index
+        self.text = text
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75, chunk_chars: int = 1200):
+        self.k1 = k1
+        self.b = b
+        self.chunk_chars = chunk_chars
+        self.passages: List[Optional[Passage]] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_passages: Dict[Any, List[int]] = {}
+        self.total_length = 0
+        self.live_passages = 0
+        self._arrays: Dict[str, Tuple[Any, Any]] = {}
+        self._length_array = None
+        # sync() runs in a background job while select() builds prompts on the UI thread; the lock only covers
+        # updates to the index, never reading or tokenizing a document
+        self._lock = threading.RLock()
+
+    # Incremental maintenance
+
+    def add_document(self, doc_key, collection: str, text: str):
+        with self._lock:
+            self._add_chunks(doc_key, collection, self._tokenize_chunks(text))
+
+    def _tokenize_chunks(self, text: str) -> List[Tuple[str, Counter]]:
+        return [(chunk, Counter(tokenize(chunk))) for chunk in chunk_text(text, self.chunk_chars)]
+
+    def _add_chunks(self, doc_key, collection: str, chunks: List[Tuple[str, Counter]]):
+        if doc_key in self.doc_passages:
+            return
+        passage_ids = []
+        for chunk_index, (chunk, terms) in enumerate(chunks):
+            passage_id = len(self.passages)
+            self.passages.append(Passage(doc_key, collection, chunk_index, chunk))
+            length = sum(terms.values())
+            self.lengths.append(length)
+            self.total_length += length
+            self.live_passages += 1
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[passage_id] = tf
+                self._arrays.pop(term, None)
+            passage_ids.append(passage_id)
+        self.doc_passages[doc_key] = passage_ids
+        self._length_array = None
+
+    def remove_document(self, doc_key):
+        with self._lock:
+            self._remove_document(doc_key)
+
+    def _remove_document(self, doc_key):
+        for passage_id in self.doc_passages.pop(doc_key, []):
+            passage = self.passages[passage_id]
+            for term in set(tokenize(passage.text)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(passage_id, None)
+                    if not postings:
+                        del self.postings[term]
+                    self._arrays.pop(term, None)
+            self.total_length -= self.lengths[passage_id]
+            self.lengths[passage_id] = 0
+            self.passages[passage_id] = None
+            self.live_passages -= 1
+        self._length_array = None
+        if len(self.passages) - self.live_passages > len(self.passages) * MAX_REMOVED_SHARE:
+            self._compact()
+
+    def _compact(self):
+        # Renumbers the live passages so removed ones stop taking space in the lists, postings and score arrays
+        new_ids = {}
+        passages = []
+        lengths = []
+        for passage_id, passage in enumerate(self.passages):
+            if passage is not None:
+                new_ids[passage_id] = len(passages)
+                passages.append(passage)
+                lengths.append(self.lengths[passage_id])
+        self.passages = passages
+        self.lengths = lengths
+        self.postings = {term: {new_ids[passage_id]: tf for passage_id, tf in postings.items()}
+                         for term, postings in self.postings.items()}
+        self.doc_passages = {doc_key: [new_ids[passage_id] for passage_id in passage_ids]
+                             for doc_key, passage_ids in self.doc_passages.items()}
+        self._arrays = {}
+        self._length_array = None
+
+    def sync(self, collections: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        # Indexes documents that are new and forgets ones that were deleted; unchanged ones cost nothing. New
+        # bodies are read and tokenized before the lock is taken.
+        keys = document_keys(collections)
+        with self._lock:
+            indexed = set(self.doc_passages)
+        added = {}
+        for collection in RETRIEVABLE_COLLECTIONS:
+            for item, doc_key in zip(collections.get(collection, []), keys[collection]):
+                if doc_key not in indexed and doc_key not in added:
+                    added[doc_key] = (collection, self._tokenize_chunks(document_text(collection, item)))
+        current = {doc_key for collection_keys in keys.values() for doc_key in collection_keys}
+        with self._lock:
+            for doc_key, (collection, chunks) in added.items():
+                self._add_chunks(doc_key, collection, chunks)
+            for doc_key in [doc_key for doc_key in self.doc_passages if doc_key not in current]:
+                self._remove_document(doc_key)
+        return keys
+
+    # Scoring
+
+    def search(self, query: str, k: int = 40, doc_keys: Optional[set] = None) -> List[Tuple[float, Passage]]:
+        # doc_keys limits the results to those documents, e.g. the ones still in the corpus
+        with self._lock:
+            return self._search(query, k, doc_keys)
+
+    def _search(self, query: str, k: int, doc_keys: Optional[set]) -> List[Tuple[float, Passage]]:
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or not self.live_passages:
+            return []
+        average_length = self.total_length / self.live_passages or 1.0
+        excluded = []
+        if doc_keys is not None:
+            excluded = [passage_id for doc_key, passage_ids in self.doc_passages.items() if doc_key not in doc_keys
+                        for passage_id in passage_ids]
+        if np is not None:
+            scores = self._score_numpy(terms, average_length)
+            scores[excluded] = 0.0
+            # Only the top k are ordered; the rest of the array is just partitioned off
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self.passages[i]) for i in top if scores[i] > 0]
+        scores = self._score_python(terms, average_length)
+        for passage_id in excluded:
+            scores.pop(passage_id, None)
+        top = heapq.nlargest(k, scores.items(), key=lambda pair: pair[1])
+        return [(score, self.passages[passage_id]) for passage_id, score in top]
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings[term])
+        return math.log(1 + (self.live_passages - df + 0.5) / (df + 0.5))
+
+    def _score_python(self, terms: List[str], average_length: float) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term in terms:
+            idf = self._idf(term)
+            for passage_id, tf in self.postings[term].items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[passage_id] / average_length)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def _score_numpy(self, terms: List[str], average_length: float):
+        if self._length_array is None:
+            self._length_array = np.asarray(self.lengths, dtype=np.float64)
+        norms = self.k1 * (1 - self.b + self.b * self._length_array / average_length)
+        scores = np.zeros(len(self.passages), dtype=np.float64)
+        for term in terms:
+            arrays = self._arrays.get(term)
+            if arrays is None:
+                postings = self.postings[term]
+                arrays = (np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                          np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+                self._arrays[term] = arrays
+            ids, tfs = arrays
+            scores[ids] += self._idf(term) * tfs * (self.k1 + 1) / (tfs + norms[ids])
+        return scores
+
+    # Prompt selection
+
+    def select(self, collections: Dict[str, List[Any]], query: str, k: int = 40) -> Dict[str, List[Any]]:
+        # Returns the collections reduced to their top-k passages, keeping document and passage order. Only the
+        # index from the last sync() is searched; documents added since then are kept whole until it has them.
+        keys = document_keys(collections)
+        with self._lock:
+            indexed = {doc_key for collection_keys in keys.values() for doc_key in collection_keys
+                       if doc_key in self.doc_passages}
+            chosen: Dict[Any, List[Passage]] = {}
+            for _, passage in self._search(query, k, indexed):
+                chosen.setdefault(passage.doc_key, []).append(passage)
+
+        selected = dict(collections)
+        for collection in RETRIEVABLE_COLLECTIONS:
+            items = []
+            for item, doc_key in zip(collections.get(collection, []), keys[collection]):
+                if doc_key not in indexed:
+                    items.append(item)
+                    continue
+                passages = chosen.get(doc_key)
+                if not passages:
+                    continue
+                text = PASSAGE_GAP.join(passage.text for passage in sorted(passages, key=lambda p: p.chunk_index))
+                if collection == 'scripts':
+                    items.append((item[0], text))
+                else:
+                    items.append(dict(item, content=text))
+            selected[collection] = items
+        return selected
+
+
+def document_keys(collections: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    return {collection: [document_key(collection, item) for item in collections.get(collection, [])]
+            for collection in RETRIEVABLE_COLLECTIONS}
+
+
+def document_text(collection: str, item) -> str:
+    if collection == 'scripts':
+        return item[1]
+    if collection == 'internet_search_results':
+        return f"{item.get('title', '')}\n\n{item.get('content', '')}"
+    return str(item.get('content', ''))
+
+
+def document_key(collection: str, item):
+    # Store-backed items carry a content hash, so unchanged documents are recognised without reading them
+    if isinstance(item, (LazyDocument, LazyRecord)):
+        extra = item.get('title', '') if isinstance(item, LazyRecord) else ''
+        return (collection, item.content_hash, extra)
+    text = document_text(collection, item)
+    return (collection, hashlib.sha1(text.encode('utf-8')).hexdigest(), item.get('title', '') if isinstance(item, dict) else '')
@@ -0,0 +1,71 @@
+# search_results.py
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from json_stream import extract_json_values
+
+RESULT_FIELDS = ('title', 'author', 'date_retrieved', 'url', 'content', 'search_term')
+UNKNOWN = 'unknown'
+
+
+class ResultParseError(Exception):
+    pass
+
+
+def parse_json_values(text: str) -> List[Any]:
+    # Every top-level JSON object or array in a model response, in order, found in one pass; fences, prose and
+    # trailing commas around or inside them are tolerated and a cut-off last value is closed where possible
+    values = extract_json_values(text, unwrap_arrays=False)
+    if not values:
+        raise ResultParseError("No JSON object or array found")
+    return values
+
+
+def result_items(value: Any) -> List[Any]:
+    # A response may hold one source, a list of sources, or an object wrapping the list (e.g. {"sources": [...]})
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        if 'content' not in value:
+            lists = [item for item in value.values() if isinstance(item, list) and item and all(isinstance(entry, dict) for entry in item)]
+            if len(lists) == 1:
+                return lists[0]
+        return [value]
+    return []
+
+
+def normalize_result(item: Any, search_term: str, date_retrieved: str) -> Optional[Dict[str, str]]:
+    # Coerces one item to the result schema; items without any content are rejected
+    if not isinstance(item, dict):
+        return None
+    content = item.get('content')
+    if isinstance(content, (list, dict)):
+        content = json.dumps(content, ensure_ascii=False)
+    content = str(content or '').strip()
+    if not content:
+        return None
+    result = {}
+    for field in RESULT_FIELDS:
+        value = item.get(field)
+        result[field] = str(value).strip() if value not in (None, '') else ''
+    result['content'] = content
+    result['url'] = result['url'] if result['url'] and result['url'].lower() != 'unkown' else UNKNOWN
+    result['title'] = result['title'] or UNKNOWN
+    result['author'] = result['author'] or UNKNOWN
+    result['date_retrieved'] = result['date_retrieved'] or date_retrieved
+    # The term that was actually searched, whatever the model echoed back
+    result['search_term'] = search_term or result['search_term']
+    return result
+
+
+def parse_sonar_response(text: str, search_term: str, date_retrieved: Optional[str] = None) -> List[Dict[str, str]]:
+    # Raises ResultParseError when the response holds no usable result at all
+    date_retrieved = date_retrieved or datetime.now().strftime('%Y-%m-%d')
+    items = [item for value in parse_json_values(text) for item in result_items(value)]
+    results = [normalize_result(item, search_term, date_retrieved) for item in items]
+    results = [result for result in results if result is not None]
+    if not results:
+        raise ResultParseError("JSON holds no result with content")
+    return results
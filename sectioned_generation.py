@@ -0,0 +1,156 @@
+# sectioned_generation.py
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+
+from json_stream import extract_json_values
+
+# The template above asks for the whole paper in one response; its other rules still apply to every part
+PART_PREAMBLE = (
+    "The paper is too long for one response, so it is written in several calls, and this call writes only the part "
+    "described below. Follow every rule in the instructions above on style, formatting, citations and which sources "
+    "to use. Ignore only what they say about writing the whole paper in this response: its length, the title page, "
+    "the table of contents and the bibliography, unless this part is the bibliography.\n\n"
+)
+OUTLINE_INSTRUCTION = PART_PREAMBLE + (
+    "Before writing anything, plan the paper. Output ONLY a JSON object, with no text before or after it, of the form:\n"
+    '{"title": "Title of the paper", '
+    '"chapters": [{"heading": "Chapter heading", "summary": "What the chapter covers and which sources it uses", '
+    '"subsections": ["Subsection heading", "..."]}], '
+    '"bibliography": "Which sources the bibliography lists and in what citation style"}\n'
+    "List the chapters in reading order, including the introduction and conclusion but not the title page or the bibliography."
+)
+SECTION_INSTRUCTION = PART_PREAMBLE + (
+    "The paper is being written one chapter at a time from this outline:\n\n{outline}\n\n"
+    "Write ONLY chapter {number} of {count}, \"{heading}\", in full. It should cover: {summary}\n"
+    "Start with the line '# {heading}' and use '##' and '###' for its subsections. "
+    "Do not write a title page, other chapters or a bibliography."
+)
+BIBLIOGRAPHY_INSTRUCTION = PART_PREAMBLE + (
+    "The paper is being written one chapter at a time from this outline:\n\n{outline}\n\n"
+    "Write ONLY the bibliography for the whole paper: {plan}\n"
+    "Start with the line '# Bibliography'."
+)
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*)$')
+TITLE_PAGE_PATTERN = re.compile(r'####TITLE PAGE####.*?####END TITLE PAGE####\s*', re.DOTALL)
+FENCE_PATTERN = re.compile(r'^```[a-zA-Z]*\n(.*?)\n```$', re.DOTALL)
+# The document export understands three heading levels
+MAX_HEADING_LEVEL = 3
+
+
+class OutlineError(Exception):
+    pass
+
+
+def parse_outline(text: str) -> Dict:
+    # The first object with chapters wins, so an example object in text around the outline is skipped
+    objects = extract_json_values(text, unwrap_arrays=False, accept=lambda value: isinstance(value, dict))
+    if not objects:
+        if '{' in text:
+            raise OutlineError("The outline could not be parsed.")
+        raise OutlineError("The outline response did not contain a JSON object.")
+    outline = next((value for value in objects if 'chapters' in value), objects[0])
+    chapters = [chapter for chapter in outline.get('chapters', []) if isinstance(chapter, dict) and chapter.get('heading')]
+    if not chapters:
+        raise OutlineError("The outline does not list any chapters.")
+    outline['chapters'] = chapters
+    return outline
+
+
+def format_outline(outline: Dict) -> str:
+    lines = [f"Title: {outline.get('title', '')}"]
+    for number, chapter in enumerate(outline['chapters'], 1):
+        lines.append(f"{number}. {chapter['heading']}")
+        lines.extend(f"   - {subsection}" for subsection in chapter.get('subsections', []))
+    return "\n".join(lines)
+
+
+def normalize_section(text: str) -> str:
+    # Sections come back with their own fences, title pages and heading depths; each is reduced to one chapter
+    text = text.strip()
+    fenced = FENCE_PATTERN.match(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    text = TITLE_PAGE_PATTERN.sub('', text)
+    lines = text.split('\n')
+    levels = [len(match.group(1)) for match in (HEADING_PATTERN.match(line.strip()) for line in lines) if match]
+    # The shallowest heading becomes the chapter heading; everything below shifts up by the same amount
+    offset = min(levels) - 1 if levels else 0
+    normalized = []
+    for line in lines:
+        match = HEADING_PATTERN.match(line.strip())
+        if match:
+            level = min(max(len(match.group(1)) - offset, 1), MAX_HEADING_LEVEL)
+            line = f"{'#' * level} {match.group(2).strip()}"
+        normalized.append(line)
+    return "\n".join(normalized).strip()
+
+
+def title_page(outline: Dict, first_name: str, last_name: str, date: str) -> str:
+    return "\n".join([
+        "####TITLE PAGE####",
+        f"# {outline.get('title', '').strip() or 'Untitled'}",
+        f"{first_name} {last_name}",
+        date,
+        "####END TITLE PAGE####",
+    ])
+
+
+def merge_sections(outline: Dict, sections: List[str], first_name: str, last_name: str, date: str) -> str:
+    return "\n\n".join([title_page(outline, first_name, last_name, date)] + [normalize_section(section) for section in sections])
+
+
+class SectionedGenerator:
+    # request(job, content_blocks) -> (text, stats) performs one Messages API call. content_blocks is the whole
+    # rendered template; each call appends its own task after it.
+    def __init__(self, request: Callable, max_parallel_sections: int = 4):
+        self.request = request
+        self.max_parallel_sections = max_parallel_sections
+
+    def generate(self, job, content_blocks: List[Dict], first_name: str, last_name: str, date: str) -> Tuple[str, List]:
+        job.report("Planning the outline", None)
+        outline_text, outline_stats = self.request(job, content_blocks + [text_block(OUTLINE_INSTRUCTION)])
+        outline = parse_outline(outline_text)
+        outline_summary = format_outline(outline)
+
+        prompts = [
+            SECTION_INSTRUCTION.format(outline=outline_summary, number=number, count=len(outline['chapters']),
+                                       heading=chapter['heading'], summary=chapter.get('summary', ''))
+            for number, chapter in enumerate(outline['chapters'], 1)
+        ]
+        prompts.append(BIBLIOGRAPHY_INSTRUCTION.format(outline=outline_summary, plan=outline.get('bibliography', 'all cited sources')))
+
+        # The corpus blocks are identical for every section, so after the outline call they are read from the prompt cache
+        done = [0]
+        lock = threading.Lock()
+
+        def write_section(prompt):
+            job.check_cancelled()
+            result = self.request(job, content_blocks + [text_block(prompt)])
+            with lock:
+                done[0] += 1
+                job.report(f"Written {done[0]} of {len(prompts)} sections", None)
+            return result
+
+        job.report(f"Writing {len(prompts)} sections", None)
+        start = time.perf_counter()
+        results = [None] * len(prompts)
+        pool = ThreadPoolExecutor(max_workers=self.max_parallel_sections)
+        try:
+            futures = {pool.submit(write_section, prompt): i for i, prompt in enumerate(prompts)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        finally:
+            # The first failure is raised at once; sections that have not started yet are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+        job.report(f"Sections written in {time.perf_counter() - start:.1f} s", None)
+
+        paper = merge_sections(outline, [text for text, _ in results], first_name, last_name, date)
+        return paper, [outline_stats] + [stats for _, stats in results]
+
+
+def text_block(text: str) -> Dict:
+    return {"type": "text", "text": text}
@@ -0,0 +1,15 @@
+# conftest.py
+
+import pytest
+
+from http_client import HTTPClient, set_client
+from stubs import StubTransport
+
+
+@pytest.fixture
+def stub_transport():
+    transport = StubTransport()
+    client = HTTPClient(transport=transport, backoff_base=0.01, backoff_max=0.05)
+    set_client(client)
+    yield transport
+    set_client(None)
@@ -0,0 +1,44 @@
+# stubs.py
+
+import io
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+
+
+class StubTransport(BaseAdapter):
+    # Answers requests from a list of handlers, one per request, and records what was sent. A handler returns
+    # (status, body, headers) or raises, e.g. requests.ConnectTimeout.
+    def __init__(self, handlers=None):
+        super().__init__()
+        self.handlers = list(handlers or [])
+        self.sent = []
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.sent.append((request, timeout))
+        if not self.handlers:
+            raise AssertionError(f"Unexpected request: {request.method} {request.url}")
+        status, body, headers = self.handlers.pop(0)(request)
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        response.raw = io.BytesIO(body.encode('utf-8') if isinstance(body, str) else body)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def reply(status=200, body='', headers=None):
+    return lambda request: (status, body, headers)
+
+
+def fail(error):
+    def handler(request):
+        raise error
+    return handler
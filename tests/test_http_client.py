@@ -0,0 +1,99 @@
+# test_http_client.py
+
+import time
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from http_client import HTTPClient
+from stubs import StubTransport, fail, reply
+
+URL = "https://api.example.com/v1/messages"
+
+
+def client_for(handlers, **kwargs):
+    transport = StubTransport(handlers)
+    kwargs.setdefault('backoff_base', 0.01)
+    kwargs.setdefault('backoff_max', 0.05)
+    return HTTPClient(transport=transport, **kwargs), transport
+
+
+def test_retry_after_is_honoured_on_429():
+    client, transport = client_for([reply(429, headers={'retry-after': '0.2'}), reply(200, 'ok')], backoff_max=1.0)
+    start = time.monotonic()
+    response = client.post(URL, json={})
+    assert response.status_code == 200
+    assert len(transport.sent) == 2
+    assert time.monotonic() - start >= 0.2
+
+
+def test_retry_after_is_capped_by_backoff_max():
+    client, transport = client_for([reply(529, headers={'retry-after': '30'}), reply(200)], backoff_max=0.05)
+    start = time.monotonic()
+    assert client.post(URL).status_code == 200
+    assert time.monotonic() - start < 1
+
+
+def test_last_retryable_status_is_returned():
+    client, transport = client_for([reply(503)] * 3, max_retries=2)
+    assert client.get(URL).status_code == 503
+    assert len(transport.sent) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 409])
+def test_other_statuses_are_not_retried(status):
+    client, transport = client_for([reply(status)])
+    assert client.post(URL).status_code == status
+    assert len(transport.sent) == 1
+
+
+def test_connect_timeout_on_post_is_resent():
+    client, transport = client_for([fail(requests.ConnectTimeout("connect")), reply(200)])
+    assert client.post(URL, json={}).status_code == 200
+    assert len(transport.sent) == 2
+
+
+def test_refused_connection_on_post_is_resent():
+    # requests wraps the urllib3 error the way it does for a refused connection
+    refused = requests.ConnectionError(MaxRetryError(None, URL, NewConnectionError(None, "refused")))
+    client, transport = client_for([fail(refused), reply(200)])
+    assert client.post(URL).status_code == 200
+    assert len(transport.sent) == 2
+
+
+@pytest.mark.parametrize("error", [requests.ReadTimeout("read"), requests.ConnectionError("reset by peer")])
+def test_post_that_may_have_reached_the_server_is_not_resent(error):
+    client, transport = client_for([fail(error), reply(200)])
+    with pytest.raises(type(error)):
+        client.post(URL, json={})
+    assert len(transport.sent) == 1
+
+
+def test_read_timeout_on_get_is_retried():
+    client, transport = client_for([fail(requests.ReadTimeout("read")), reply(200)])
+    assert client.get(URL).status_code == 200
+    assert len(transport.sent) == 2
+
+
+def test_deadline_stops_retries():
+    client, transport = client_for([reply(503, headers={'retry-after': '0.3'})] * 10, backoff_max=1.0)
+    start = time.monotonic()
+    response = client.post(URL, deadline=0.5)
+    assert response.status_code == 503
+    # Only one wait fits in the deadline; the next attempt would have ended after it
+    assert len(transport.sent) == 2
+    assert time.monotonic() - start < 0.5
+
+
+def test_deadline_cuts_attempt_timeouts():
+    client, transport = client_for([reply(200)], connect_timeout=10, read_timeout=300)
+    client.post(URL, deadline=2.0)
+    _, timeout = transport.sent[0]
+    assert all(0 < value <= 2.0 for value in timeout)
+
+
+def test_urls_are_rewritten_to_the_stub():
+    client, transport = client_for([reply(200)], base_urls={"https://api.example.com": "http://127.0.0.1:9"})
+    client.get(URL)
+    assert transport.sent[0][0].url == "http://127.0.0.1:9/v1/messages"
@@ -0,0 +1,94 @@
+# test_json_stream.py
+
+import pytest
+
+from json_stream import JSONStreamExtractor, extract_json_values, loads_lenient, NOT_JSON
+
+
+def feed_in_chunks(text, size, **kwargs):
+    extractor = JSONStreamExtractor(**kwargs)
+    values = []
+    for start in range(0, len(text), size):
+        values.extend(extractor.feed(text[start:start + size]))
+    return values + extractor.finish()
+
+
+OBJECTS = '[{"title": "A \\"quoted\\" [word], {braces}", "path": "C:\\\\dir\\\\"}, {"title": "B\\u00e9"}]'
+EXPECTED = [{"title": 'A "quoted" [word], {braces}', "path": "C:\\dir\\"}, {"title": "B\u00e9"}]
+
+
+@pytest.mark.parametrize("size", range(1, 12))
+def test_chunk_boundaries_inside_strings_and_escapes(size):
+    assert feed_in_chunks(OBJECTS, size) == EXPECTED
+
+
+def test_chunk_split_right_after_backslash():
+    extractor = JSONStreamExtractor()
+    assert extractor.feed('{"a": "x\\') == []
+    assert extractor.feed('"y"}') == [{"a": 'x"y'}]
+
+
+def test_fenced_json():
+    text = 'Here is the outline:\n```json\n[{"title": "Intro"}, {"title": "Method"}]\n```\nDone.'
+    assert extract_json_values(text) == [{"title": "Intro"}, {"title": "Method"}]
+
+
+def test_prose_with_quotes_and_brackets_around_json():
+    text = 'He said "see {below}" then: {"terms": ["a", "b"]} and "more" text'
+    # The braces inside the prose are a value too; only parseable ones are emitted
+    assert extract_json_values(text, unwrap_arrays=False) == [{"terms": ["a", "b"]}]
+
+
+def test_arrays_kept_whole_without_unwrap():
+    assert extract_json_values('x [1, 2, 3] y', unwrap_arrays=False) == [[1, 2, 3]]
+
+
+def test_scalar_elements_are_unwrapped():
+    assert extract_json_values('["one", 2, null, true]') == ["one", 2, None, True]
+
+
+def test_trailing_commas():
+    assert extract_json_values('[{"a": 1, "b": [1, 2,],}, {"c": "x,]"},]') == [{"a": 1, "b": [1, 2]}, {"c": "x,]"}]
+
+
+def test_elements_emitted_before_array_closes():
+    extractor = JSONStreamExtractor()
+    assert extractor.feed('[{"title": "Intro"}, {"title": "Me') == [{"title": "Intro"}]
+    assert extractor.feed('thod"}]') == [{"title": "Method"}]
+
+
+def test_truncated_tail_inside_string():
+    extractor = JSONStreamExtractor()
+    values = extractor.feed('[{"title": "Intro"}, {"title": "Meth')
+    assert values + extractor.finish() == [{"title": "Intro"}, {"title": "Meth"}]
+
+
+def test_truncated_tail_cut_back_to_last_comma():
+    extractor = JSONStreamExtractor(unwrap_arrays=False)
+    extractor.feed('{"terms": ["a", "b"], "count": ')
+    assert extractor.finish() == [{"terms": ["a", "b"]}]
+
+
+def test_unrepairable_tail_is_dropped():
+    extractor = JSONStreamExtractor(unwrap_arrays=False)
+    extractor.feed('{"a": tru')
+    assert extractor.finish() == []
+
+
+def test_finish_resets_state():
+    extractor = JSONStreamExtractor()
+    extractor.feed('[{"a": ')
+    extractor.finish()
+    assert extractor.feed('{"b": 1}') == [{"b": 1}]
+
+
+def test_accept_filters_values():
+    accept = lambda value: isinstance(value, dict) and 'title' in value
+    assert extract_json_values('[{"title": "A"}, {"other": 1}, "x"]', accept=accept) == [{"title": "A"}]
+
+
+def test_loads_lenient():
+    assert loads_lenient('null') is None
+    assert loads_lenient('not json') is NOT_JSON
+    assert loads_lenient('  ') is NOT_JSON
+    assert loads_lenient('{"a": "b,}",}') == {"a": "b,}"}
@@ -0,0 +1,67 @@
+# test_markdown_docx.py
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from markdown_docx import DocxRenderer, tokenize
+from utils import DocumentHandler
+
+
+class FormattingSettings:
+    font_name = "Times New Roman"
+    font_size_normal = 12
+    font_size_heading1 = 16
+    font_size_heading2 = 14
+    font_size_heading3 = 12
+    line_spacing = "1.5 lines"
+    margin_top = margin_bottom = margin_left = margin_right = 2.0
+
+
+def render(content):
+    document = Document()
+    DocumentHandler().set_document_properties(document, FormattingSettings())
+    DocxRenderer.for_document(document).render(content)
+    return document
+
+
+def list_items(document):
+    # (text, numId, start of that numId) for each numbered paragraph
+    numbering = document.part.numbering_part.element
+    starts = {}
+    for num in numbering.num_lst:
+        override = num.find(qn('w:lvlOverride'))
+        start = override.find(qn('w:startOverride')) if override is not None else None
+        starts[num.numId] = int(start.get(qn('w:val'))) if start is not None else None
+    items = []
+    for paragraph in document.paragraphs:
+        num_pr = paragraph._p.pPr.numPr if paragraph._p.pPr is not None else None
+        if num_pr is not None:
+            num_id = num_pr.numId.val
+            items.append((paragraph.text, num_id, starts[num_id]))
+    return items
+
+
+def test_paragraph_between_items_continues_numbering():
+    items = list_items(render("1. One\n\nAn explanation.\n\n2. Two\n3. Three"))
+    assert len({num_id for _, num_id, _ in items}) == 1
+    assert items[0][2] == 1
+
+
+def test_author_start_numbers_are_kept():
+    items = list_items(render("Intro\n\n4. Four\n5. Five\n\nBreak\n\n1. Again"))
+    assert [start for _, _, start in items] == [4, 4, 1]
+    assert items[0][1] == items[1][1] != items[2][1]
+
+
+def test_sub_lists_restart_under_each_item():
+    items = list_items(render("1. A\n  1. a\n  2. b\n2. B\n  1. c"))
+    sub_ids = [num_id for text, num_id, _ in items if text in ('a', 'b', 'c')]
+    assert sub_ids[0] == sub_ids[1] != sub_ids[2]
+    assert items[0][1] == items[3][1]
+
+
+def test_title_page_keeps_empty_lines():
+    block, = list(tokenize("####TITLE PAGE####\n# Title\n\n\nJane Doe\n####END TITLE PAGE####"))
+    assert block.lines == ["# Title", "", "", "Jane Doe"]
+    document = render("####TITLE PAGE####\n# Title\n\n\nJane Doe\n####END TITLE PAGE####\nBody")
+    assert [paragraph.text for paragraph in document.paragraphs][:4] == ["Title", "", "", "Jane Doe"]
@@ -0,0 +1,71 @@
+# test_message_batches.py
+
+import json
+import threading
+
+import pytest
+
+from message_batches import BatchError, BatchState, MessageBatchClient, result_message
+from stubs import reply
+from utils import APIHandler
+
+BATCH_URL = MessageBatchClient.api_url
+
+
+def betas(headers):
+    return set(headers['anthropic-beta'].split(','))
+
+
+def test_submit_interrupted_poll_resume_and_results(stub_transport, tmp_path):
+    headers, params = APIHandler().build_request("key", (["Corpus " * 1000], "Write the paper."))
+    results = "\n".join(json.dumps(entry) for entry in [
+        {'custom_id': 'job-0', 'result': {'type': 'succeeded', 'message': {
+            'content': [{'type': 'text', 'text': ' The paper '}], 'usage': {'output_tokens': 3}}}},
+        {'custom_id': 'job-1', 'result': {'type': 'errored', 'error': {'error': {'message': 'overloaded'}}}},
+    ])
+    stub_transport.handlers = [
+        reply(body={'id': 'batch-1', 'processing_status': 'in_progress'}),
+        reply(body={'id': 'batch-1', 'processing_status': 'in_progress'}),
+        reply(body={'id': 'batch-1', 'processing_status': 'ended', 'results_url': f"{BATCH_URL}/batch-1/results"}),
+        reply(body=results),
+    ]
+    state_store = BatchState(str(tmp_path / "batch_state.json"))
+
+    client = MessageBatchClient("key", poll_interval=0.01)
+    batch = client.submit([('job-0', params), ('job-1', params)])
+    state_store.save({'batch_id': batch['id']})
+
+    stop_event = threading.Event()
+    with pytest.raises(BatchError):
+        client.wait(batch['id'], on_poll=lambda batch: stop_event.set(), stop_event=stop_event)
+
+    # A restarted run polls the saved batch instead of submitting again
+    resumed = MessageBatchClient("key", poll_interval=0.01)
+    batch = resumed.wait(state_store.load()['batch_id'])
+    entries = dict(resumed.iter_results(batch))
+    assert result_message(entries['job-0']) == ("The paper", {'output_tokens': 3})
+    with pytest.raises(BatchError, match="overloaded"):
+        result_message(entries['job-1'])
+
+    requests_sent = [request for request, _ in stub_transport.sent]
+    assert [(request.method, request.url) for request in requests_sent] == [
+        ('POST', BATCH_URL), ('GET', f"{BATCH_URL}/batch-1"), ('GET', f"{BATCH_URL}/batch-1"),
+        ('GET', f"{BATCH_URL}/batch-1/results"),
+    ]
+    body = json.loads(requests_sent[0].body)
+    assert body['requests'][0] == {'custom_id': 'job-0', 'params': params}
+    for request in requests_sent:
+        assert request.headers['x-api-key'] == "key"
+        # The params ask for 8192 tokens and carry cache breakpoints, so the direct-call betas must be sent too
+        assert betas(request.headers) >= betas(headers) | {"message-batches-2024-09-24"}
+
+
+def test_api_errors_raise(stub_transport):
+    stub_transport.handlers = [reply(400, {'error': {'message': 'bad'}})]
+    with pytest.raises(BatchError, match="400"):
+        MessageBatchClient("key").retrieve("batch-1")
+
+
+def test_empty_batch_is_rejected():
+    with pytest.raises(BatchError):
+        MessageBatchClient("key").submit([])
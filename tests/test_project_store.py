@@ -0,0 +1,100 @@
+# test_project_store.py
+
+import json
+
+import pytest
+
+from project_store import LazyDocument, LazyRecord, ProjectStore
+
+SCRIPTS = [["a.pdf", "First script"], ["b.txt", "Second script é"]]
+INSTRUCTIONS = [["task.txt", "Write a paper"]]
+SOURCES = [{'url': 'https://example.com', 'author': 'Doe', 'date': '2024', 'content': 'Source body'}]
+RESULTS = [{'title': 'T', 'url': 'https://example.org', 'author': 'X', 'date_retrieved': '2024-01-01',
+            'content': 'Result body', 'search_term': 'term'}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProjectStore(str(tmp_path / "project.db"))
+    yield store
+    store.close()
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+
+def test_migration_round_trip(tmp_path, store):
+    write_json(tmp_path / "claude_app_settings.json", {
+        'api_key': 'key', 'font_size_normal': 11, 'instructions': INSTRUCTIONS,
+        'custom_prompts': {'default_system_prompt': 'Prompt {scripts}'},
+    })
+    write_json(tmp_path / "script_texts.json", SCRIPTS)
+    write_json(tmp_path / "internet_sources.json", SOURCES)
+    write_json(tmp_path / "internet_search_results.json", RESULTS)
+
+    assert store.migrate_from_json(str(tmp_path))
+    assert [tuple(item) for item in store.load_collection('scripts')] == [tuple(item) for item in SCRIPTS]
+    # Collections kept inside the settings file by older versions are migrated too
+    assert [tuple(item) for item in store.load_collection('instructions')] == [tuple(item) for item in INSTRUCTIONS]
+    assert [dict(item) for item in store.load_collection('internet_sources')] == SOURCES
+    assert [dict(item) for item in store.load_collection('internet_search_results')] == RESULTS
+    assert store.get_settings() == {'api_key': 'key', 'font_size_normal': 11}
+    assert store.get_prompts() == {'default_system_prompt': 'Prompt {scripts}'}
+
+
+def test_migration_runs_once(tmp_path, store):
+    write_json(tmp_path / "script_texts.json", SCRIPTS)
+    assert store.migrate_from_json(str(tmp_path))
+    store.append('scripts', ("c.txt", "Added later"))
+    write_json(tmp_path / "script_texts.json", [["stale.txt", "Stale"]])
+    assert not store.migrate_from_json(str(tmp_path))
+    assert [item.name for item in store.load_collection('scripts')] == ["a.pdf", "b.txt", "c.txt"]
+
+
+def test_migration_without_legacy_files(tmp_path, store):
+    assert store.migrate_from_json(str(tmp_path))
+    assert all(store.load_collection(collection) == [] for collection in ProjectStore.COLLECTIONS)
+
+
+def test_bodies_load_on_access(store, monkeypatch):
+    store.replace('scripts', SCRIPTS)
+    store.replace('internet_search_results', RESULTS)
+    reads = []
+    get_body = store.get_body
+    monkeypatch.setattr(store, 'get_body', lambda *args: reads.append(args) or get_body(*args))
+
+    document, _ = store.load_collection('scripts')
+    record, = store.load_collection('internet_search_results')
+    assert isinstance(document, LazyDocument) and isinstance(record, LazyRecord)
+    assert (document.name, document.size, record['title'], record.size) == ("a.pdf", 12, 'T', 11)
+    assert reads == []
+
+    assert document[1] == "First script"
+    assert record['content'] == "Result body"
+    assert len(reads) == 2
+
+
+def test_reorder_and_delete_keep_positions(store):
+    store.replace('scripts', SCRIPTS + [["c.txt", "Third"]])
+    store.load_collection('scripts')
+    store.swap('scripts', 0, 2)
+    store.delete('scripts', 1)
+    assert [tuple(item) for item in store.load_collection('scripts')] == [("c.txt", "Third"), ("a.pdf", "First script")]
+
+
+def test_replace_keeps_lazy_items_valid(store):
+    store.replace('scripts', SCRIPTS)
+    items = store.load_collection('scripts')
+    store.replace('scripts', list(reversed(items)))
+    assert [item.content for item in items] == ["First script", "Second script é"]
+    assert [item.name for item in store.load_collection('scripts')] == ["b.txt", "a.pdf"]
+
+
+def test_document_name_access_does_not_read_body(store, monkeypatch):
+    store.replace('scripts', SCRIPTS)
+    document = store.load_collection('scripts')[0]
+    monkeypatch.setattr(store, 'get_body', lambda *args: pytest.fail("body was read"))
+    assert (document.name, document[0], document[-2], len(document)) == ("a.pdf",) * 3 + (2,)
+    with pytest.raises(IndexError):
+        document[2]
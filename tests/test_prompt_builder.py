@@ -0,0 +1,105 @@
+# test_prompt_builder.py
+
+import pytest
+
+from prompt_builder import CORPUS_FIELDS, SEGMENT_SEPARATOR, PromptBuilder
+from project_store import ProjectStore
+
+COLLECTIONS = {
+    'scripts': [("a.pdf", "Script {text} with braces"), ("b.txt", "Second script")],
+    'instructions': [("task.txt", "Write about {topic}")],
+    'internet_sources': [{'url': 'https://example.com', 'author': 'Doe', 'date': '2024', 'content': 'Source body'}],
+    'internet_search_results': [{'title': 'T', 'url': 'https://example.org', 'author': 'X',
+                                 'date_retrieved': '2024-01-01', 'content': 'Result body'}],
+}
+FIELDS = {'first_name': 'Ada', 'last_name': 'Lovelace', 'date': '01.01.2024', 'width': 12}
+
+TEMPLATES = [
+    "{instructions}\n\n{scripts}\n\n{internet}\n\n{internet_search}\n\nBy {first_name} {last_name}, {date}",
+    "Name first: {first_name}\n{scripts}{scripts}\n{{literal braces}}",
+    "{last_name!r:>{width}} {first_name:.2} {scripts!s}",
+    "No corpus at all, {first_name}",
+    "{internet_search:.10}|{instructions}",
+    "",
+]
+
+
+def legacy_format(template, collections, fields):
+    # What the prompt was before segments were cached: one str.format over the joined collections
+    values = {field: SEGMENT_SEPARATOR.join(format_segment(i, item) for i, item in enumerate(collections[collection]))
+              for field, (collection, format_segment) in CORPUS_FIELDS.items()}
+    return template.format(**values, **fields)
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_build_matches_str_format(template):
+    builder = PromptBuilder()
+    assert builder.build(template, COLLECTIONS, **FIELDS) == legacy_format(template, COLLECTIONS, FIELDS)
+    # A second build reuses every segment and must give the same text
+    assert builder.build(template, COLLECTIONS, **FIELDS) == legacy_format(template, COLLECTIONS, FIELDS)
+    assert builder.last_timings['rebuilt_segments'] == 0
+
+
+def test_stable_parts_end_after_last_corpus_field():
+    builder = PromptBuilder()
+    prompt = builder.build(TEMPLATES[0], COLLECTIONS, **FIELDS)
+    stable_parts, variable_part = builder.last_parts
+    assert "".join(stable_parts) + variable_part == prompt
+    assert len(stable_parts) == 4
+    assert variable_part == "\n\nBy Ada Lovelace, 01.01.2024"
+
+
+@pytest.mark.parametrize("template, error", [("{}", IndexError), ("{0}", IndexError), ("{missing}", KeyError),
+                                             ("{first_name", ValueError)])
+def test_errors_match_str_format(template, error):
+    with pytest.raises(error):
+        legacy_format(template, COLLECTIONS, FIELDS)
+    with pytest.raises(error):
+        PromptBuilder().build(template, COLLECTIONS, **FIELDS)
+
+
+def test_changed_items_are_reformatted():
+    builder = PromptBuilder()
+    collections = dict(COLLECTIONS, scripts=list(COLLECTIONS['scripts']))
+    builder.build("{scripts}", collections)
+    collections['scripts'][1] = ("b.txt", "Edited script")
+    prompt = builder.build("{scripts}", collections)
+    assert "Edited script" in prompt
+    assert builder.last_timings['rebuilt_segments'] == 1
+
+
+def test_lazy_documents_match_tuples(tmp_path):
+    store = ProjectStore(str(tmp_path / "project.db"))
+    for collection in COLLECTIONS:
+        store.replace(collection, COLLECTIONS[collection])
+    lazy = {collection: store.load_collection(collection) for collection in COLLECTIONS}
+    assert PromptBuilder().build(TEMPLATES[0], lazy, **FIELDS) == legacy_format(TEMPLATES[0], COLLECTIONS, FIELDS)
+    store.close()
+
+
+def test_search_result_without_content_gets_placeholder(tmp_path):
+    store = ProjectStore(str(tmp_path / "project.db"))
+    store.replace('internet_search_results', [{'title': 'T', 'url': 'https://example.org'}])
+    results = store.load_collection('internet_search_results')
+    prompt = PromptBuilder().build("{internet_search}", {'internet_search_results': results})
+    assert prompt.endswith("):\nNo content available\n!!!this is the next document!!!")
+    store.close()
+
+
+def test_segment_cache_is_bounded():
+    builder = PromptBuilder(max_cached_chars=200)
+    collections = {'scripts': [(f"s{i}.txt", "x" * 100) for i in range(5)]}
+    prompt = builder.build("{scripts}", collections)
+    assert builder.last_timings['cached_chars'] <= 200
+    # Segments that were dropped are formatted again and give the same prompt
+    assert builder.build("{scripts}", collections) == prompt
+    assert builder.last_timings['cached_chars'] <= 200
+
+
+def test_timings_summary():
+    builder = PromptBuilder()
+    assert builder.timings_summary() == "Prompt: not built yet"
+    builder.build("{scripts}", COLLECTIONS)
+    builder.build("{scripts}", COLLECTIONS)
+    reused = sum(len(items) for items in COLLECTIONS.values())
+    assert f"{reused} segments reused, 0 rebuilt" in builder.timings_summary()
@@ -0,0 +1,107 @@
+# test_prompt_cache.py
+
+import json
+
+import pytest
+
+from prompt_cache import (CACHE_CONTROL, MAX_CACHE_BREAKPOINTS, MIN_CACHEABLE_CHARS, CacheUsage, beta_header,
+                          cached_content_blocks)
+from response_cache import ResponseCache, set_cache
+from stubs import reply
+from utils import APIHandler
+
+LARGE = "x" * MIN_CACHEABLE_CHARS
+SMALL = "y" * 100
+
+
+def breakpoints(blocks):
+    return [i for i, block in enumerate(blocks) if block.get("cache_control") == CACHE_CONTROL]
+
+
+def test_short_prefix_gets_no_breakpoint():
+    blocks = cached_content_blocks([SMALL, SMALL], "task")
+    assert breakpoints(blocks) == []
+    assert [block["text"] for block in blocks] == [SMALL, SMALL, "task"]
+
+
+def test_breakpoints_follow_cacheable_runs_of_small_parts():
+    per_run = MIN_CACHEABLE_CHARS // len(SMALL)
+    blocks = cached_content_blocks([SMALL] * (per_run + 2), "task")
+    # A breakpoint once enough unmarked text has built up, and one at the end; the variable part never gets one
+    assert breakpoints(blocks) == [per_run - 1, per_run + 1]
+    assert "cache_control" not in blocks[-1]
+
+
+def test_large_parts_get_their_own_breakpoints():
+    blocks = cached_content_blocks([LARGE, SMALL, LARGE, SMALL], "task")
+    assert breakpoints(blocks) == [0, 2, 3]
+
+
+def test_at_most_four_breakpoints_and_the_last_is_kept():
+    parts = [LARGE] * (MAX_CACHE_BREAKPOINTS + 3) + [SMALL]
+    blocks = cached_content_blocks(parts, "task")
+    assert len(breakpoints(blocks)) == MAX_CACHE_BREAKPOINTS
+    assert breakpoints(blocks)[-1] == len(parts) - 1
+
+
+def test_empty_parts_are_dropped_and_empty_prompt_keeps_one_block():
+    assert cached_content_blocks(["", LARGE, ""], "") == [{"type": "text", "text": LARGE, "cache_control": CACHE_CONTROL}]
+    assert cached_content_blocks([], "") == [{"type": "text", "text": ""}]
+
+
+def test_beta_header_always_includes_prompt_caching():
+    assert beta_header("a", "b").split(",") == ["a", "b", "prompt-caching-2024-07-31"]
+
+
+def test_usage_totals_and_summary():
+    usage = CacheUsage()
+    usage.add_request({'input_tokens': 100, 'cache_creation_input_tokens': 900, 'output_tokens': 50})
+    usage.add_request({'input_tokens': 100, 'cache_read_input_tokens': 900, 'cache_creation_input_tokens': None})
+    assert (usage.requests, usage.total_input_tokens, usage.output_tokens) == (2, 2000, 50)
+    assert usage.hit_ratio == pytest.approx(0.45)
+    assert "900 tokens read" in usage.summary()
+    assert CacheUsage().summary() == ""
+
+
+@pytest.fixture
+def no_response_cache(tmp_path):
+    set_cache(ResponseCache(str(tmp_path / "cache.sqlite"), enabled=False))
+    yield
+    set_cache(None)
+
+
+def test_usage_is_read_from_responses(stub_transport, no_response_cache):
+    usage = {'input_tokens': 12, 'cache_read_input_tokens': 4000, 'cache_creation_input_tokens': 0, 'output_tokens': 7}
+    stub_transport.handlers = [reply(body={'content': [{'type': 'text', 'text': ' Paper '}], 'usage': usage})]
+    handler = APIHandler()
+    headers, data = handler.build_request("key", ([LARGE], "task"))
+    text, stats = handler.generate(None, headers, data)
+    assert text == "Paper"
+    assert (stats.usage.cache_read_input_tokens, stats.usage.input_tokens, stats.output_tokens) == (4000, 12, 7)
+    sent = json.loads(stub_transport.sent[0][0].body)
+    assert sent['messages'][0]['content'][0]['cache_control'] == CACHE_CONTROL
+
+
+def test_usage_is_read_from_streamed_responses(stub_transport, no_response_cache):
+    events = [
+        {'type': 'message_start', 'message': {'usage': {'input_tokens': 12, 'cache_creation_input_tokens': 4000}}},
+        {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Pa'}},
+        {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'per'}},
+        {'type': 'message_delta', 'usage': {'output_tokens': 3}},
+        {'type': 'message_stop'},
+    ]
+    body = "".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events)
+    stub_transport.handlers = [reply(body=body)]
+
+    class Job:
+        def check_cancelled(self):
+            pass
+
+        def report(self, message, data=None):
+            pass
+
+    handler = APIHandler()
+    headers, data = handler.build_request("key", ([LARGE], "task"))
+    text, stats = handler.generate(Job(), headers, data, stream=True)
+    assert text == "Paper"
+    assert (stats.usage.cache_creation_input_tokens, stats.output_tokens) == (4000, 3)
@@ -0,0 +1,56 @@
+# test_retrieval.py
+
+from retrieval import BM25Index
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+
+
+def corpus(count):
+    # Each script has one word of its own, repeated, and filler shared by all of them
+    return {
+        'instructions': [("task.txt", "Write about the topic")],
+        'scripts': [(f"s{i}.txt", f"{WORDS[i % len(WORDS)]}{i} " * 20 + "shared filler text " * 20) for i in range(count)],
+        'internet_sources': [],
+        'internet_search_results': [],
+    }
+
+
+def test_select_keeps_top_passages():
+    collections = corpus(10)
+    index = BM25Index()
+    index.sync(collections)
+    selected = index.select(collections, "gamma2", k=1)
+    assert [name for name, _ in selected['scripts']] == ["s2.txt"]
+    assert selected['instructions'] == collections['instructions']
+
+
+def test_select_does_not_index_on_its_own():
+    collections = corpus(3)
+    index = BM25Index()
+    index.sync(dict(collections, scripts=collections['scripts'][:2]))
+    selected = index.select(collections, "alpha0", k=1)
+    # s2.txt arrived after the last sync, so it is sent whole rather than tokenized here
+    assert [name for name, _ in selected['scripts']] == ["s0.txt", "s2.txt"]
+    assert selected['scripts'][1] is collections['scripts'][2]
+    assert len(index.doc_passages) == 2
+
+
+def test_deleted_documents_are_not_selected_before_the_next_sync():
+    collections = corpus(3)
+    index = BM25Index()
+    index.sync(collections)
+    remaining = dict(collections, scripts=collections['scripts'][1:])
+    selected = index.select(remaining, "alpha0 beta1", k=5)
+    assert [name for name, _ in selected['scripts']] == ["s1.txt"]
+
+
+def test_removed_passages_are_compacted():
+    collections = corpus(40)
+    index = BM25Index()
+    index.sync(collections)
+    remaining = dict(collections, scripts=collections['scripts'][:10])
+    index.sync(remaining)
+    assert index.live_passages == 10
+    assert len(index.passages) - index.live_passages <= len(index.passages) * 0.25
+    assert all(passage_id < len(index.passages) for postings in index.postings.values() for passage_id in postings)
+    assert [name for name, _ in index.select(remaining, "gamma2", k=1)['scripts']] == ["s2.txt"]
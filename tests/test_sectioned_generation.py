@@ -0,0 +1,81 @@
+# test_sectioned_generation.py
+
+import json
+import os
+import threading
+
+import pytest
+
+from checkpoints import CheckpointStore, set_checkpoints
+from utils import APIHandler, StreamStats
+
+OUTLINE = {"title": "T", "chapters": [{"heading": f"Chapter {i}"} for i in range(1, 4)], "bibliography": "all"}
+
+
+class Job:
+    def report(self, message, data=None):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    set_checkpoints(store)
+    yield store
+    set_checkpoints(None)
+
+
+def fake_generate(calls, fail_on=None):
+    lock = threading.Lock()
+
+    def generate(job, headers, data, stream=False):
+        task = data['messages'][0]['content'][-1]['text']
+        with lock:
+            calls.append(task)
+        if fail_on and fail_on in task:
+            raise RuntimeError("overloaded")
+        stats = StreamStats()
+        stats.usage.add_request({'input_tokens': 10, 'cache_read_input_tokens': 90})
+        stats.finish(5)
+        if "plan the paper" in task:
+            return json.dumps(OUTLINE), stats
+        heading = next((chapter['heading'] for chapter in OUTLINE['chapters'] if f'"{chapter["heading"]}"' in task), "Bibliography")
+        return f"# {heading}\nText", stats
+    return generate
+
+
+def test_failed_sectioned_paper_resumes_from_checkpoints(checkpoints, monkeypatch):
+    handler = APIHandler()
+    headers, data = handler.build_request("key", (["Corpus"], "Write the paper."))
+
+    first_calls = []
+    monkeypatch.setattr(handler, 'generate', fake_generate(first_calls, fail_on='"Chapter 2"'))
+    with pytest.raises(RuntimeError):
+        handler.generate_sectioned(Job(), headers, data, "Ada", "Lovelace", "2024-01-01", max_parallel_sections=1)
+
+    second_calls = []
+    monkeypatch.setattr(handler, 'generate', fake_generate(second_calls))
+    paper, stats = handler.generate_sectioned(Job(), headers, data, "Ada", "Lovelace", "2024-01-01", max_parallel_sections=1)
+    # The outline and chapter 1 came from checkpoints; the failed chapter was requested again
+    assert not any("plan the paper" in task or '"Chapter 1"' in task for task in second_calls)
+    assert any('"Chapter 2"' in task for task in second_calls)
+    assert "# Chapter 2" in paper and "# Bibliography" in paper
+    assert stats.usage.requests == 5 and stats.output_tokens == 25
+    # Completed papers leave no checkpoints behind
+    assert os.listdir(checkpoints.directory) == []
+
+
+def test_disabled_checkpoints_repeat_every_call(checkpoints, monkeypatch):
+    checkpoints.enabled = False
+    handler = APIHandler()
+    headers, data = handler.build_request("key", (["Corpus"], "Write the paper."))
+    monkeypatch.setattr(handler, 'generate', fake_generate([], fail_on='"Chapter 2"'))
+    with pytest.raises(RuntimeError):
+        handler.generate_sectioned(Job(), headers, data, "Ada", "Lovelace", "2024-01-01", max_parallel_sections=1)
+    calls = []
+    monkeypatch.setattr(handler, 'generate', fake_generate(calls))
+    handler.generate_sectioned(Job(), headers, data, "Ada", "Lovelace", "2024-01-01", max_parallel_sections=1)
+    assert len(calls) == 5
@@ -0,0 +1,205 @@
+# text_normalize.py
+
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+from token_budget import estimate_tokens
+
+# lxml is installed with python-docx and listed in the README; html.parser is only the fallback for a partial install
+try:
+    import lxml  # noqa: F401  (only needed as BeautifulSoup's parser backend)
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Elements that never hold the article itself; header and footer only count outside of it
+BOILERPLATE_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'button', 'nav', 'aside'}
+PAGE_CHROME_TAGS = {'header', 'footer'}
+CONTENT_TAGS = ['main', 'article']
+BOILERPLATE_ROLES = {'navigation', 'banner', 'contentinfo', 'complementary', 'search', 'dialog', 'alertdialog'}
+# Matched against each id and class name on its own. Words that only ever name page chrome may appear anywhere in
+# a name (cookie-notice, gdpr-modal); generic ones like header or menu must be the whole name, optionally with a
+# site-level prefix, so in-content wrappers such as entry-header or article-footer-notes are kept
+BOILERPLATE_NAME_PARTS = re.compile(r'cookie|consent|gdpr|newsletter|subscribe|advert|popup|skip-link', re.IGNORECASE)
+BOILERPLATE_NAMES = re.compile(
+    r'^(?:(?:site|page|global|main|top|primary|mobile)[-_]?)?'
+    r'(?:header|footer|nav|navbar|navigation|menu|sidebar|banner|breadcrumbs?|social|share|sharing|'
+    r'related|recommended|promo|ads?|modal)$',
+    re.IGNORECASE
+)
+MIN_MAIN_CONTENT_CHARS = 200
+# An element matched only by its id or class is kept when it holds this many paragraphs; it is then a
+# wrapper around the content (e.g. class="has-sidebar"), not chrome
+MAX_BOILERPLATE_PARAGRAPHS = 5
+
+HYPHENATED_BREAK = re.compile(r'(\w)-[ \t]*\n[ \t]*([a-zäöüß])')
+SPACE_RUN = re.compile(r'[ \t\xa0\u2000-\u200b\u3000]+')
+BLANK_LINE_RUN = re.compile(r'\n{3,}')
+DIGIT_RUN = re.compile(r'\d+')
+# Headers and footers are looked for among the first and last lines of each page
+EDGE_LINES = 3
+MIN_PAGES_FOR_REPEATS = 3
+REPEAT_SHARE = 0.5
+
+
+class NormalizationReport:
+    # Bytes and estimated tokens removed by each step, summed over everything normalized so far
+    def __init__(self):
+        self.steps: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, step: str, before: str, after: str):
+        saved_bytes = len(before.encode('utf-8')) - len(after.encode('utf-8'))
+        saved_tokens = estimate_tokens(before) - estimate_tokens(after)
+        with self._lock:
+            totals = self.steps.setdefault(step, {'bytes': 0, 'tokens': 0, 'documents': 0})
+            totals['bytes'] += saved_bytes
+            totals['tokens'] += saved_tokens
+            totals['documents'] += 1
+
+    @property
+    def saved_bytes(self) -> int:
+        return sum(totals['bytes'] for totals in self.steps.values())
+
+    @property
+    def saved_tokens(self) -> int:
+        return sum(totals['tokens'] for totals in self.steps.values())
+
+    def summary(self) -> str:
+        if not self.steps:
+            return "Text cleanup: nothing normalized yet"
+        parts = [f"{step.replace('_', ' ')} {totals['tokens']:,}" for step, totals in self.steps.items()]
+        return f"Text cleanup saved {self.saved_bytes:,} bytes / ~{self.saved_tokens:,} tokens ({', '.join(parts)})"
+
+
+def remove_repeated_lines(pages: List[str]) -> List[str]:
+    # Running headers, footers and page numbers: lines near the top or bottom of a page that recur on at least
+    # half of the pages, compared with digits masked so "Page 3 of 10" matches "Page 4 of 10"
+    if len(pages) < MIN_PAGES_FOR_REPEATS:
+        return pages
+    page_lines = [page.split('\n') for page in pages]
+    counts = Counter()
+    for lines in page_lines:
+        counts.update({line_key(lines[i]) for i in edge_indexes(lines)})
+    threshold = max(MIN_PAGES_FOR_REPEATS, len(pages) * REPEAT_SHARE)
+    repeated = {key for key, count in counts.items() if count >= threshold}
+    if not repeated:
+        return pages
+    cleaned = []
+    for lines in page_lines:
+        dropped = {i for i in edge_indexes(lines) if line_key(lines[i]) in repeated}
+        cleaned.append('\n'.join(line for i, line in enumerate(lines) if i not in dropped))
+    return cleaned
+
+
+def edge_indexes(lines: List[str]) -> List[int]:
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    return content[:EDGE_LINES] + content[EDGE_LINES:][-EDGE_LINES:]
+
+
+def line_key(line: str) -> str:
+    return DIGIT_RUN.sub('#', SPACE_RUN.sub(' ', line).strip().lower())
+
+
+def repair_hyphenation(pages: List[str]) -> List[str]:
+    # "experi-\nment" -> "experiment"; a capital after the break ("Jean-\nPaul") is kept as written
+    return [HYPHENATED_BREAK.sub(r'\1\2', page) for page in pages]
+
+
+def collapse_inner_whitespace(pages: List[str]) -> List[str]:
+    # For plain text, where indentation carries meaning (code, verse): leading whitespace is kept and only runs of
+    # spaces inside a line and runs of blank lines are collapsed
+    cleaned = []
+    for page in pages:
+        page = page.replace('\r\n', '\n').replace('\r', '\n')
+        lines = []
+        for line in page.split('\n'):
+            body = line.lstrip(' \t')
+            indent = line[:len(line) - len(body)]
+            lines.append(indent + SPACE_RUN.sub(' ', body).rstrip() if body.strip() else '')
+        cleaned.append(BLANK_LINE_RUN.sub('\n\n', '\n'.join(lines)).strip('\n'))
+    return cleaned
+
+
+def collapse_whitespace(pages: List[str]) -> List[str]:
+    cleaned = []
+    for page in pages:
+        page = page.replace('\r\n', '\n').replace('\r', '\n')
+        lines = [SPACE_RUN.sub(' ', line).strip() for line in page.split('\n')]
+        cleaned.append(BLANK_LINE_RUN.sub('\n\n', '\n'.join(lines)).strip())
+    return cleaned
+
+
+# Steps run in this order for each kind of source; every step takes and returns the list of pages
+DEFAULT_STEPS: Dict[str, List[Callable[[List[str]], List[str]]]] = {
+    'pdf': [remove_repeated_lines, repair_hyphenation, collapse_whitespace],
+    'html': [collapse_whitespace],
+    'text': [collapse_inner_whitespace],
+}
+
+
+class TextNormalizer:
+    def __init__(self, steps: Optional[Dict[str, List[Callable[[List[str]], List[str]]]]] = None,
+                 main_content: bool = True):
+        self.steps = steps if steps is not None else DEFAULT_STEPS
+        self.main_content = main_content
+        self.report = NormalizationReport()
+
+    @property
+    def normalizer_id(self) -> str:
+        # Part of every extraction cache key, so changing the steps re-extracts instead of serving old text
+        steps = ';'.join(f"{kind}:{','.join(step.__name__ for step in steps)}" for kind, steps in sorted(self.steps.items()))
+        return f"norm/2/{'main' if self.main_content else 'full'}/{steps}"
+
+    def normalize(self, pages: List[str], kind: str = 'text') -> str:
+        for step in self.steps.get(kind, []):
+            before = pages
+            pages = step(pages)
+            self.report.record(step.__name__, '\n'.join(before), '\n'.join(pages))
+        return '\n\n'.join(page for page in pages if page)
+
+    def html_text(self, content) -> str:
+        soup = BeautifulSoup(content, HTML_PARSER)
+        if not self.main_content:
+            return self.normalize([soup.get_text(separator='\n')], 'html')
+        full_text = soup.get_text(separator='\n')
+        main_text = main_content_text(soup)
+        self.report.record('html_main_content', full_text, main_text)
+        return self.normalize([main_text], 'html')
+
+
+def main_content_text(soup: BeautifulSoup) -> str:
+    # Drops navigation, banners and other page chrome, then prefers the <main>/<article> element when it holds
+    # a real amount of text; pages without any of these keep everything that is left
+    for tag in soup.find_all(boilerplate_element):
+        if not tag.decomposed:
+            tag.decompose()
+    for selector in ('main', 'article', '[role=main]'):
+        candidates = soup.select(selector)
+        if candidates:
+            text = '\n'.join(candidate.get_text(separator='\n') for candidate in candidates)
+            if len(text.strip()) >= MIN_MAIN_CONTENT_CHARS:
+                return text
+    body = soup.body or soup
+    return body.get_text(separator='\n')
+
+
+def boilerplate_element(tag) -> bool:
+    name = tag.name
+    if name in BOILERPLATE_TAGS:
+        return True
+    if name in PAGE_CHROME_TAGS:
+        return tag.find_parent(CONTENT_TAGS) is None
+    if name in ('html', 'body') or name in CONTENT_TAGS:
+        return False
+    if tag.get('role') in BOILERPLATE_ROLES or tag.get('aria-hidden') == 'true':
+        return True
+    names = [name for name in [tag.get('id')] + (tag.get('class') or []) if name]
+    if not any(BOILERPLATE_NAME_PARTS.search(name) or BOILERPLATE_NAMES.match(name) for name in names):
+        return False
+    return (tag.find(CONTENT_TAGS) is None
+            and len(tag.find_all('p', limit=MAX_BOILERPLATE_PARAGRAPHS + 1)) <= MAX_BOILERPLATE_PARAGRAPHS)
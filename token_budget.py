@@ -0,0 +1,145 @@
+# token_budget.py
+
+import math
+from typing import Any, Dict, List, Optional
+
+from project_store import LazyDocument, LazyRecord
+
+# Claude averages roughly 3.5 characters per token on English prose; erring low keeps the estimate conservative
+CHARS_PER_TOKEN = 3.5
+# Headers and separators added around each document by the prompt builder
+SEGMENT_OVERHEAD_TOKENS = 25
+TRIM_MARKER = "\n[... trimmed to fit the token budget ...]"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def estimate_item_tokens(item) -> int:
+    # Store-backed items know their size, so no body has to be read to estimate them
+    if isinstance(item, (LazyDocument, LazyRecord)):
+        size = item.size
+    elif isinstance(item, (tuple, list)):
+        size = len(item[1])
+    else:
+        size = len(str(item.get('content', '')))
+    return int(math.ceil(size / CHARS_PER_TOKEN)) + SEGMENT_OVERHEAD_TOKENS
+
+
+def item_name(collection: str, item) -> str:
+    if collection in ('scripts', 'instructions'):
+        return item[0]
+    if collection == 'internet_sources':
+        return item.get('url', 'unknown')
+    return item.get('title', 'Unknown')
+
+
+class BudgetEntry:
+    KEPT = "kept"
+    TRIMMED = "trimmed"
+    DROPPED = "dropped"
+
+    def __init__(self, collection: str, name: str, tokens: int):
+        self.collection = collection
+        self.name = name
+        self.tokens = tokens
+        self.kept_tokens = tokens
+        self.status = BudgetEntry.KEPT
+
+
+class PackResult:
+    def __init__(self, collections: Dict[str, List[Any]], entries: List[BudgetEntry], template_tokens: int, budget: int):
+        self.collections = collections
+        self.entries = entries
+        self.template_tokens = template_tokens
+        self.budget = budget
+
+    @property
+    def total_tokens(self) -> int:
+        return self.template_tokens + sum(entry.kept_tokens for entry in self.entries)
+
+    @property
+    def fits(self) -> bool:
+        return self.total_tokens <= self.budget
+
+    @property
+    def trimmed(self) -> bool:
+        return any(entry.status != BudgetEntry.KEPT for entry in self.entries)
+
+    def totals_by_collection(self) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for entry in self.entries:
+            totals[entry.collection] = totals.get(entry.collection, 0) + entry.kept_tokens
+        return totals
+
+    def summary(self) -> str:
+        lines = [f"Estimated input: {self.total_tokens:,} of {self.budget:,} tokens", f"Prompt template: {self.template_tokens:,}"]
+        for collection, tokens in self.totals_by_collection().items():
+            lines.append(f"{collection.replace('_', ' ').capitalize()}: {tokens:,}")
+        changed = [entry for entry in self.entries if entry.status != BudgetEntry.KEPT]
+        if changed:
+            lines.append("")
+            lines.extend(f"{entry.status.capitalize()}: {entry.name} ({entry.tokens:,} -> {entry.kept_tokens:,})" for entry in changed)
+        return "\n".join(lines)
+
+
+class ContextPacker:
+    # Lowest priority first: these are trimmed before anything further down the list
+    PRIORITY = ('internet_search_results', 'internet_sources', 'scripts', 'instructions')
+    # Instructions define the task and are never cut
+    PROTECTED = ('instructions',)
+
+    def __init__(self, max_input_tokens: int = 190000, min_trimmed_tokens: int = 500):
+        self.max_input_tokens = max_input_tokens
+        self.min_trimmed_tokens = min_trimmed_tokens
+
+    def pack(self, template: str, collections: Dict[str, List[Any]]) -> PackResult:
+        packed = {name: list(items) for name, items in collections.items()}
+        entries_by_collection = {
+            name: [BudgetEntry(name, item_name(name, item), estimate_item_tokens(item)) for item in items]
+            for name, items in packed.items()
+        }
+        entries = [entry for name in collections for entry in entries_by_collection[name]]
+        result = PackResult(packed, entries, estimate_tokens(template), self.max_input_tokens)
+
+        overflow = result.total_tokens - self.max_input_tokens
+        for collection in self.PRIORITY:
+            if overflow <= 0:
+                break
+            if collection in self.PROTECTED or collection not in packed:
+                continue
+            items = packed[collection]
+            collection_entries = entries_by_collection[collection]
+            # Later documents in a list are treated as less important than earlier ones
+            for index in range(len(items) - 1, -1, -1):
+                if overflow <= 0:
+                    break
+                entry = collection_entries[index]
+                remaining = entry.tokens - overflow
+                if remaining >= self.min_trimmed_tokens:
+                    items[index] = self._trim(collection, items[index], remaining)
+                    entry.kept_tokens = estimate_item_tokens(items[index])
+                    entry.status = BudgetEntry.TRIMMED
+                else:
+                    items[index] = None
+                    entry.kept_tokens = 0
+                    entry.status = BudgetEntry.DROPPED
+                overflow = result.total_tokens - self.max_input_tokens
+            packed[collection] = [item for item in items if item is not None]
+        return result
+
+    def _trim(self, collection: str, item, tokens: int):
+        max_chars = int((tokens - SEGMENT_OVERHEAD_TOKENS) * CHARS_PER_TOKEN) - len(TRIM_MARKER)
+        content = item[1] if collection in ('scripts', 'instructions') else str(item.get('content', ''))
+        cut = content[:max_chars]
+        # Prefer ending on a paragraph boundary when one is reasonably close
+        boundary = cut.rfind("\n\n")
+        if boundary > max_chars * 0.8:
+            cut = cut[:boundary]
+        trimmed = cut + TRIM_MARKER
+        if collection in ('scripts', 'instructions'):
+            return (item[0], trimmed)
+        return dict(item, content=trimmed)
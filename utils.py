@@ -1,5 +1,6 @@
 # utils.py
 
+import io
 import json
 import os
 import tkinter as tk
@@ -11,11 +12,41 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
-import PyPDF2
-import re
-from bs4 import BeautifulSoup
+import time
+from jobs import JobCancelled
+from http_client import get_client, iter_sse_events
+from response_cache import get_cache
+from checkpoints import get_checkpoints
+from project_store import ProjectStore
+from pdf_ingest import PDFIngestor
+from extraction_cache import ExtractionCache, hash_file
+from web_fetch import WebFetcher
+from text_normalize import TextNormalizer
+from dedup import NearDuplicateIndex
+from retrieval import RETRIEVABLE_COLLECTIONS
+from prompt_cache import CacheUsage, beta_header, cached_content_blocks
+from sectioned_generation import SectionedGenerator
+from markdown_docx import DocxRenderer
+from docx_writer import get_templates
+from prompt_builder import (SEGMENT_SEPARATOR, format_script_segment, format_instruction_segment,
+                            format_internet_source_segment, format_internet_search_result_segment)
+
+# Bump when read_txt_text changes so cached extractions are not reused
+TEXT_EXTRACTOR_ID = "txt/1"
+# Everything set_document_properties reads; exports with equal values share one template
+FORMATTING_SETTINGS = ('font_name', 'font_size_normal', 'font_size_heading1', 'font_size_heading2', 'font_size_heading3',
+                       'line_spacing', 'margin_top', 'margin_bottom', 'margin_left', 'margin_right')
 
 class FileHandler:
+    def __init__(self, store_path='scolarforge.db'):
+        self.store = ProjectStore(store_path)
+        self.pdf_ingestor = PDFIngestor()
+        self.extraction_cache = ExtractionCache()
+        # Every ingested text goes through the same normalizer, so its report covers files and web pages
+        self.normalizer = TextNormalizer()
+        self.web_fetcher = WebFetcher(normalizer=self.normalizer)
+        self.duplicates = NearDuplicateIndex()
+
     def get_file_paths(self, title):
         file_types = [("PDF files", "*.pdf"), ("Text files", "*.txt"), ("All files", "*.*")]
         return filedialog.askopenfilenames(title=title, filetypes=file_types)
@@ -23,14 +54,66 @@ class FileHandler:
     def upload_script(self, parent, file_path):
         file_name = os.path.basename(file_path)
         text = self.extract_text_from_file(file_path)
-        parent.scripts.append((file_name, text))
-        self.save_script_texts(parent)
+        self.add_script(parent, file_name, text)
 
     def upload_instruction(self, parent, file_path):
         file_name = os.path.basename(file_path)
         text = self.extract_text_from_file(file_path)
-        parent.instructions.append((file_name, text))
-        self.save_instruction_texts(parent)
+        self.add_instruction(parent, file_name, text)
+
+    def add_script(self, parent, name, text):
+        self.add_item(parent, 'scripts', (name, text))
+
+    def add_instruction(self, parent, name, text):
+        self.add_item(parent, 'instructions', (name, text))
+
+    def add_internet_source(self, parent, source):
+        self.add_item(parent, 'internet_sources', source)
+
+    def set_internet_search_results(self, parent, results):
+        parent.internet_search_results = results
+        self.save_internet_search_results(parent)
+        self._corpus_changed(parent, 'internet_search_results')
+
+    def corpus_snapshot(self, parent):
+        # Copies of the corpus lists, so a background job can compare against them while the UI edits the originals
+        return {name: list(getattr(parent, name)) for name in RETRIEVABLE_COLLECTIONS}
+
+    def find_near_duplicate(self, collections, collection, item):
+        # (name, similarity) of a script, source or search result that item nearly repeats, or None. The first call
+        # shingles the whole corpus, so this runs in a background job on a corpus_snapshot.
+        return self.duplicates.find_duplicate(collections, collection, item)
+
+    # Single-row updates: cost does not depend on how large the collection is
+    def add_item(self, parent, collection, item):
+        getattr(parent, collection).append(item)
+        self._store_call("saving", self.store.append, collection, item)
+        self._corpus_changed(parent, collection)
+
+    def move_item(self, parent, collection, index, direction):
+        items = getattr(parent, collection)
+        if not 0 <= index + direction < len(items):
+            return False
+        items[index], items[index + direction] = items[index + direction], items[index]
+        self._store_call("saving", self.store.swap, collection, index, index + direction)
+        return True
+
+    def delete_item(self, parent, collection, index):
+        del getattr(parent, collection)[index]
+        self._store_call("saving", self.store.delete, collection, index)
+        self._corpus_changed(parent, collection)
+
+    @staticmethod
+    def _corpus_changed(parent, collection):
+        # Lets the app re-index right after an upload or delete instead of when the next prompt is built
+        if collection in RETRIEVABLE_COLLECTIONS and hasattr(parent, 'corpus_changed'):
+            parent.corpus_changed()
+
+    def _store_call(self, action, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error {action} project data: {e}")
 
     def extract_text_from_file(self, file_path):
         file_extension = os.path.splitext(file_path)[1].lower()
@@ -41,119 +124,136 @@ class FileHandler:
 
     def extract_text_from_pdf(self, file_path):
         try:
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                return "".join(page.extract_text() for page in reader.pages)
+            return self.read_file_text(file_path)
         except Exception as e:
             messagebox.showerror("Error", f"Error reading PDF file: {e}")
             return ""
 
     def extract_text_from_txt(self, file_path):
+        try:
+            return self.read_file_text(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error reading text file: {e}")
+            return ""
+
+    # The read_* variants raise instead of showing a dialog, so they are safe to call from worker threads
+    def read_file_text(self, file_path):
+        return self.read_files_text([file_path])[0]
+
+    def read_files_text(self, file_paths, progress_callback=None):
+        # Raises the first file's error; read_files reports failures per file instead
+        texts = []
+        for path, (text, error) in zip(file_paths, self.read_files(file_paths, progress_callback)):
+            if error is not None:
+                raise error
+            texts.append(text)
+        return texts
+
+    def read_files(self, file_paths, progress_callback=None):
+        # (text, None) or (None, error) per file, so one unreadable file does not fail the others. Files already
+        # extracted once are served from the content-hash cache; each PDF is normalized and cached as soon as its
+        # last page is extracted, so only one file's pages are held at a time.
+        results = {}
+        file_hashes = {}
+        for path in file_paths:
+            try:
+                file_hashes[path] = hash_file(path)
+            except OSError as e:
+                results[path] = (None, e)
+                continue
+            cached = self.extraction_cache.get(file_hashes[path], self._extractor_for(path))
+            if cached is not None:
+                results[path] = (cached, None)
+
+        # PDF pages from all remaining files are spread over one process pool; text files are read directly
+        pdf_paths = [path for path in file_paths if path not in results and self._is_pdf(path)]
+        for file_index, pages, error in self.pdf_ingestor.iter_files(pdf_paths, progress_callback):
+            path = pdf_paths[file_index]
+            if error is not None:
+                results[path] = (None, error)
+                continue
+            results[path] = (self.normalizer.normalize(pages, 'pdf'), None)
+            self.extraction_cache.put(file_hashes[path], self._extractor_for(path), os.path.basename(path), results[path][0])
+        for path in file_paths:
+            if path not in results:
+                try:
+                    results[path] = (self.normalizer.normalize([self.read_txt_text(path)], 'text'), None)
+                except OSError as e:
+                    results[path] = (None, e)
+                    continue
+                self.extraction_cache.put(file_hashes[path], self._extractor_for(path), os.path.basename(path), results[path][0])
+        return [results[path] for path in file_paths]
+
+    def _is_pdf(self, file_path):
+        return os.path.splitext(file_path)[1].lower() == '.pdf'
+
+    def _extractor_for(self, file_path):
+        extractor = self.pdf_ingestor.extractor_id if self._is_pdf(file_path) else TEXT_EXTRACTOR_ID
+        return f"{extractor}|{self.normalizer.normalizer_id}"
+
+    def read_txt_text(self, file_path):
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read()
         except UnicodeDecodeError:
-            try:
-                with open(file_path, 'r', encoding='latin-1') as f:
-                    return f.read()
-            except Exception as e:
-                messagebox.showerror("Error", f"Error reading text file: {e}")
-                return ""
+            with open(file_path, 'r', encoding='latin-1') as f:
+                return f.read()
 
     def scrape_webpage(self, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            text = soup.get_text(separator='\n')
-            return text.strip()
+            return self.fetch_webpage_text(url)
         except requests.RequestException as e:
             messagebox.showerror("Error", f"Error fetching web page: {e}")
             return None
 
+    def fetch_webpage_text(self, url):
+        # Revalidates pages fetched before, so an unchanged page costs a 304
+        return self.web_fetcher.fetch_text(url)
+
     def save_script_texts(self, parent):
-        self.save_texts(parent.scripts, 'script_texts.json')
+        self.save_texts(parent.scripts, 'scripts')
 
     def save_instruction_texts(self, parent):
-        self.save_texts(parent.instructions, 'instruction_texts.json')
+        self.save_texts(parent.instructions, 'instructions')
 
     def save_internet_sources(self, parent):
-        try:
-            with open('internet_sources.json', 'w') as f:
-                json.dump(parent.internet_sources, f, indent=2)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error saving internet sources: {e}")
+        self.save_texts(parent.internet_sources, 'internet_sources')
 
     def save_internet_search_results(self, parent):
-        try:
-            with open('internet_search_results.json', 'w') as f:
-                json.dump(parent.internet_search_results, f, indent=2)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error saving internet search results: {e}")
+        self.save_texts(parent.internet_search_results, 'internet_search_results')
 
-    def save_texts(self, texts, filename):
-        try:
-            with open(filename, 'w') as f:
-                json.dump(texts, f, indent=2)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error saving texts: {e}")
+    def save_texts(self, texts, collection):
+        # Rewrites a whole collection; prefer add_item/move_item/delete_item for small edits
+        self._store_call("saving", self.store.replace, collection, texts)
 
     def format_scripts(self, scripts):
-        return "\n\n".join([f"Script {i+1} ({name}):\n{content}\n!!!this is the next document!!!" for i, (name, content) in enumerate(scripts)])
+        return SEGMENT_SEPARATOR.join([format_script_segment(i, script) for i, script in enumerate(scripts)])
 
     def format_instructions(self, instructions):
-        return "\n\n".join([f"Instruction {i+1} ({name}):\n{content}\n!!!this is the next document!!!" for i, (name, content) in enumerate(instructions)])
+        return SEGMENT_SEPARATOR.join([format_instruction_segment(i, instruction) for i, instruction in enumerate(instructions)])
 
     def format_internet_sources(self, internet_sources):
-        formatted_sources = []
-        for i, source in enumerate(internet_sources):
-            formatted_sources.append(
-                f"Internet Source {i+1} (URL: {source['url']}, Author: {source['author']}, Date: {source['date']}):\n{source['content']}\n!!!this is the next document!!!"
-            )
-        return "\n\n".join(formatted_sources)
+        return SEGMENT_SEPARATOR.join([format_internet_source_segment(i, source) for i, source in enumerate(internet_sources)])
 
     def format_internet_search_results(self, internet_search_results):
-        formatted_results = []
-        for i, result in enumerate(internet_search_results):
-            formatted_results.append(
-                f"Internet Search Result {i+1} (Title: {result.get('title', 'Unknown')}, URL: {result.get('url', 'unknown')}, Author: {result.get('author', 'Unknown')}, Date Retrieved: {result.get('date_retrieved', 'N/A')}):\n{result.get('content', 'No content available')}\n!!!this is the next document!!!"
-            )
-        return "\n\n".join(formatted_results)
+        return SEGMENT_SEPARATOR.join([format_internet_search_result_segment(i, result) for i, result in enumerate(internet_search_results)])
 
     def load_all_settings(self):
         try:
-            with open('claude_app_settings.json', 'r') as f:
-                settings = json.load(f)
-        except FileNotFoundError:
+            self.store.migrate_from_json()
+            settings = self.store.get_settings()
+            custom_prompts = self.store.get_prompts()
+            if custom_prompts:
+                settings['custom_prompts'] = custom_prompts
+            for collection in ProjectStore.COLLECTIONS:
+                settings[collection] = self.store.load_collection(collection)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error loading project data: {e}")
             settings = {}
-        
-        try:
-            with open('script_texts.json', 'r') as f:
-                settings['scripts'] = json.load(f)
-        except FileNotFoundError:
-            settings['scripts'] = []
-        
-        try:
-            with open('instruction_texts.json', 'r') as f:
-                settings['instructions'] = json.load(f)
-        except FileNotFoundError:
-            settings['instructions'] = []
-        
-        try:
-            with open('internet_sources.json', 'r') as f:
-                settings['internet_sources'] = json.load(f)
-        except FileNotFoundError:
-            settings['internet_sources'] = []
-        
-        try:
-            with open('internet_search_results.json', 'r') as f:
-                settings['internet_search_results'] = json.load(f)
-        except FileNotFoundError:
-            settings['internet_search_results'] = []
-        
         return settings
 
     def save_all_settings(self, parent):
+        # Documents are persisted as they change, so only the small settings rows are written here
         settings = {
             'api_key': parent.api_key,
             'perplexity_api_key': parent.perplexity_api_key,
@@ -170,16 +270,22 @@ class FileHandler:
             'margin_bottom': parent.margin_bottom,
             'margin_left': parent.margin_left,
             'margin_right': parent.margin_right,
-            'system_prompt': parent.system_prompt_text.get(1.0, tk.END).strip(),
-            'custom_prompts': parent.custom_prompts,
-            'scripts': parent.scripts,
-            'instructions': parent.instructions,
-            'internet_sources': parent.internet_sources,
-            'internet_search_results': parent.internet_search_results
+            'stream_output': parent.stream_output,
+            'search_term_count': parent.search_term_count,
+            'max_concurrent_searches': parent.max_concurrent_searches,
+            'search_timeout': parent.search_timeout,
+            'use_response_cache': parent.use_response_cache,
+            'use_checkpoints': parent.use_checkpoints,
+            'max_input_tokens': parent.max_input_tokens,
+            'use_retrieval': parent.use_retrieval,
+            'retrieval_top_k': parent.retrieval_top_k,
+            'generation_mode': parent.generation_mode,
+            'max_parallel_sections': parent.max_parallel_sections,
+            'system_prompt': parent.system_prompt_text.get(1.0, tk.END).strip()
         }
         try:
-            with open('claude_app_settings.json', 'w') as f:
-                json.dump(settings, f)
+            self.store.set_settings(settings)
+            self.store.set_prompts(parent.custom_prompts)
         except Exception as e:
             messagebox.showerror("Error", f"Error saving settings: {e}")
 
@@ -193,7 +299,62 @@ class FileHandler:
 
 
 
+class APIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"API Error {status_code}: {message}")
+        self.status_code = status_code
+
+
+class StreamStats:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.output_tokens = 0
+        self.from_cache = False
+        self.usage = CacheUsage()
+        self.details = []
+
+    def mark_token(self):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def finish(self, output_tokens):
+        self.end_time = time.perf_counter()
+        self.output_tokens = output_tokens or 0
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_time is None or self.end_time is None:
+            return None
+        elapsed = self.end_time - self.first_token_time
+        return self.output_tokens / elapsed if elapsed > 0 else None
+
+    def summary(self):
+        if self.from_cache:
+            return f"Served from response cache in {(self.end_time - self.start_time) * 1000:.0f} ms"
+        lines = []
+        if self.time_to_first_token is not None:
+            lines.append(f"Time to first token: {self.time_to_first_token:.2f} s")
+        if self.tokens_per_second is not None:
+            lines.append(f"Throughput: {self.tokens_per_second:.1f} tokens/s ({self.output_tokens} tokens)")
+        lines.extend(self.details)
+        if self.usage.summary():
+            lines.append(self.usage.summary())
+        return "\n".join(lines)
+
+
 class APIHandler:
+        api_url = "https://api.anthropic.com/v1/messages"
+        # Minimum delay between two repaints of the output box while streaming
+        stream_flush_interval = 0.1
+
         def send_request(self, parent):
             if not parent.instructions:
                 messagebox.showerror("Error", "Please upload instruction files first.")
@@ -210,44 +371,179 @@ class APIHandler:
 
             parent.update_system_prompt()
 
+            # Oversized prompts are rejected here instead of after a slow upload
+            pack = parent.last_pack
+            if not pack.fits:
+                messagebox.showerror("Error", f"The prompt does not fit the token budget even after trimming.\n\n{pack.summary()}")
+                return
+            if pack.trimmed and not messagebox.askyesno("Token Budget", f"Some material was trimmed to fit the token budget.\n\n{pack.summary()}\n\nGenerate anyway?"):
+                return
+
+            sectioned = getattr(parent, 'generation_mode', 'single') == 'sectioned'
+            headers, data = self.build_request(parent.api_key, parent.system_prompt_parts)
+
+            parent.output_text.delete(1.0, tk.END)
+            parent.output_text.insert(tk.END, "Generating response, please wait...")
+
+            stream = getattr(parent, 'stream_output', False)
+            render_state = {'placeholder_cleared': False}
+
+            def on_progress(job, message, text):
+                if text is None:
+                    # Status updates only replace the placeholder; they never mix with generated text
+                    if not render_state['placeholder_cleared'] and message:
+                        parent.output_text.delete(1.0, tk.END)
+                        parent.output_text.insert(tk.END, f"Generating response, please wait...\n{message}")
+                    return
+                if not render_state['placeholder_cleared']:
+                    parent.output_text.delete(1.0, tk.END)
+                    render_state['placeholder_cleared'] = True
+                parent.output_text.insert(tk.END, text)
+                parent.output_text.see(tk.END)
+
+            def on_success(result):
+                response_text, stats = result
+                # Replace the incrementally rendered text so the result matches the non-streaming path exactly
+                parent.output_text.delete(1.0, tk.END)
+                parent.output_text.insert(tk.END, response_text)
+                summary = stats.summary() if stats else ""
+                messagebox.showinfo("Success", f"Paper generated.\n\n{summary}".strip())
+
+            def on_error(error):
+                parent.output_text.delete(1.0, tk.END)
+                if isinstance(error, JobCancelled):
+                    return
+                if isinstance(error, APIError):
+                    messagebox.showerror("Error", str(error))
+                else:
+                    messagebox.showerror("Error", f"Error making API request: {error}")
+
+            if sectioned:
+                return parent.jobs.submit(
+                    "Generate paper (sections)", self.generate_sectioned, headers, data,
+                    parent.first_name, parent.last_name, parent.date, parent.max_parallel_sections,
+                    on_success=on_success, on_error=on_error, on_progress=on_progress
+                )
+            return parent.jobs.submit(
+                "Generate paper", self.generate, headers, data, stream,
+                on_success=on_success, on_error=on_error, on_progress=on_progress
+            )
+
+        def generate_sectioned(self, job, headers, data, first_name, last_name, date, max_parallel_sections=4):
+            # One call plans the outline, then every chapter is its own request, so the paper is not capped by one response.
+            # Every finished call is checkpointed, so a paper that fails at one chapter resumes there when generated again.
+            # A single-pass paper is one call with nothing to resume; the response cache is what saves repeating it.
+            checkpoints = get_checkpoints().begin_run()
+
+            def call(job, section_data):
+                text, stats = self.generate(job, headers, section_data)
+                return [text, stats.usage.__dict__, stats.output_tokens]
+
+            def request(job, content_blocks):
+                section_data = dict(data, messages=[{"role": "user", "content": content_blocks}])
+                text, usage, output_tokens = checkpoints.run('section', section_data, call, job, section_data)
+                stats = StreamStats()
+                stats.usage.__dict__.update(usage)
+                stats.finish(output_tokens)
+                return text, stats
+
+            generator = SectionedGenerator(request, max_parallel_sections)
+            start = time.perf_counter()
+            paper, part_stats = generator.generate(job, data['messages'][0]['content'], first_name, last_name, date)
+            checkpoints.clear()
+            stats = StreamStats()
+            stats.start_time = start
+            output_tokens = 0
+            for part in part_stats:
+                stats.usage.merge(part.usage)
+                output_tokens += part.output_tokens
+            stats.finish(output_tokens)
+            stats.details.append(f"Generated {len(part_stats) - 1} sections in {stats.end_time - start:.1f} s ({output_tokens:,} output tokens)")
+            return paper, stats
+
+        def build_request(self, api_key, system_prompt_parts):
+            # The corpus prefix carries cache breakpoints, so repeat generations on the same material reuse it
+            stable_parts, variable_part = system_prompt_parts
             messages = [
-                {"role": "user", "content": parent.system_prompt}
+                {"role": "user", "content": cached_content_blocks(stable_parts, variable_part)}
             ]
 
-            api_url = "https://api.anthropic.com/v1/messages"
             headers = {
-                "x-api-key": parent.api_key,
+                "x-api-key": api_key,
                 "anthropic-version": "2023-06-01",
                 "content-type": "application/json",
-                "anthropic-beta": "max-tokens-3-5-sonnet-2024-07-15"
+                "anthropic-beta": beta_header("max-tokens-3-5-sonnet-2024-07-15")
             }
             data = {
                 "model": "claude-3-5-sonnet-20240620",
                 "max_tokens": 8192,
                 "messages": messages
             }
-
+            return headers, data
+
+        def generate(self, job, headers, data, stream=False):
+            cache = get_cache()
+            cache_key = cache.request_key(self.api_url, data)
+            stats = StreamStats()
+            cached = cache.get(cache_key)
+            if cached is not None:
+                stats.from_cache = True
+                stats.finish(0)
+                return cached, stats
+
+            if stream:
+                response_text, stats = self.send_streaming_request(job, headers, data)
+            else:
+                response = get_client().post(self.api_url, headers=headers, json=data)
+                if response.status_code != 200:
+                    raise APIError(response.status_code, response.text)
+                result = response.json()
+                content = result['content'][0]['text']
+                stats.usage.update(result.get('usage'))
+                stats.finish(result.get('usage', {}).get('output_tokens'))
+                response_text = content.strip()
+            cache.put(cache_key, response_text)
+            return response_text, stats
+
+        def send_streaming_request(self, job, headers, data):
+            stats = StreamStats()
+            response = get_client().post(self.api_url, headers=headers, json=dict(data, stream=True), stream=True)
+            if response.status_code != 200:
+                raise APIError(response.status_code, response.text)
+
+            chunks = []
+            pending = []
+            last_flush = 0.0
+            output_tokens = 0
             try:
-                parent.output_text.delete(1.0, tk.END)
-                parent.output_text.insert(tk.END, "Generating response, please wait...")
-                parent.update_idletasks()
-
-                response = requests.post(api_url, headers=headers, json=data)
-
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result['content'][0]['text']
-                    response_text = content.strip()
-                    parent.output_text.delete(1.0, tk.END)
-                    parent.output_text.insert(tk.END, response_text)
-                    messagebox.showinfo("Success", "Paper generated.")
-                else:
-                    error_message = response.text
-                    parent.output_text.delete(1.0, tk.END)
-                    messagebox.showerror("Error", f"API Error {response.status_code}: {error_message}")
-            except Exception as e:
-                parent.output_text.delete(1.0, tk.END)
-                messagebox.showerror("Error", f"Error making API request: {e}")
+                for event_type, event in iter_sse_events(response):
+                    job.check_cancelled()
+                    event_type = event.get('type', event_type)
+                    if event_type == 'message_start':
+                        # Input and prompt-cache token counts arrive once, before any content
+                        stats.usage.update(event.get('message', {}).get('usage'))
+                    elif event_type == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+                        text = event['delta']['text']
+                        stats.mark_token()
+                        chunks.append(text)
+                        pending.append(text)
+                    elif event_type == 'message_delta':
+                        output_tokens = event.get('usage', {}).get('output_tokens', output_tokens)
+                    elif event_type == 'error':
+                        raise Exception(f"{event['error'].get('type')}: {event['error'].get('message')}")
+                    elif event_type == 'message_stop':
+                        break
+
+                    now = time.perf_counter()
+                    if pending and now - last_flush >= self.stream_flush_interval:
+                        job.report(f"{len(chunks)} chunks received", "".join(pending))
+                        pending = []
+                        last_flush = now
+            finally:
+                response.close()
+
+            stats.finish(output_tokens)
+            return "".join(chunks).strip(), stats
 
 class DocumentHandler:
     def save_output(self, parent):
@@ -259,15 +555,38 @@ class DocumentHandler:
         save_path = filedialog.asksaveasfilename(title="Save Output as Word File", defaultextension=".docx", filetypes=[("Word Document", "*.docx")])
         if save_path:
             try:
-                document = Document()
-                self.set_document_properties(document, parent)
-                self.process_content(document, output, parent)
-                self.add_page_numbers(document.sections[0])
-                document.save(save_path)
+                self.export_docx(output, save_path, parent)
                 messagebox.showinfo("Success", f"Output saved to {save_path}")
             except Exception as e:
                 messagebox.showerror("Error", f"Error saving Word file: {e}")
 
+    def export_docx(self, content, save_path, parent):
+        # parent only has to carry the formatting attributes, so headless callers can pass a settings object.
+        # The styled empty document comes from a template built once per formatting; the body is streamed into it.
+        template = get_templates().get(self.template_key(parent), lambda: self.build_template(parent))
+        template.write(content, save_path)
+
+    def export_docx_in_memory(self, content, save_path, parent):
+        # Builds the whole document with python-docx; gives the same file as export_docx
+        document = Document()
+        self.set_document_properties(document, parent)
+        self.process_content(document, content, parent)
+        self.add_page_numbers(document.sections[0])
+        document.save(save_path)
+
+    def template_key(self, parent):
+        return tuple(getattr(parent, name) for name in FORMATTING_SETTINGS)
+
+    def build_template(self, parent):
+        document = Document()
+        self.set_document_properties(document, parent)
+        self.add_page_numbers(document.sections[0])
+        # Created up front so numbered lists never have to add a part while the body is streamed
+        document.part.numbering_part
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
+
     def set_document_properties(self, document, parent):
         section = document.sections[0]
         section.page_height = Inches(11)
@@ -300,87 +619,7 @@ class DocumentHandler:
         style.font.name = parent.font_name
 
     def process_content(self, document, content, parent):
-        paragraphs = content.strip().split('\n')
-        i = 0
-        while i < len(paragraphs):
-            para = paragraphs[i].strip()
-            if not para:
-                i += 1
-                continue
-
-            if para == '####TITLE PAGE####':
-                i = self.process_title_page(document, paragraphs, i)
-            elif para.startswith('# '):
-                document.add_paragraph(para[2:].strip(), style='Heading1Custom')
-            elif para.startswith('## '):
-                document.add_paragraph(para[3:].strip(), style='Heading2Custom')
-            elif para.startswith('### '):
-                document.add_paragraph(para[4:].strip(), style='Heading3Custom')
-            elif re.match(r'^\d+\.', para) or para.startswith('- '):
-                p = document.add_paragraph(style='List Bullet')
-                self.add_runs(p, para.lstrip('0123456789.- '))
-            elif para.startswith('|') and para.endswith('|'):
-                i = self.process_table(document, paragraphs, i, parent)
-            else:
-                p = document.add_paragraph(style='Normal')
-                self.add_runs(p, para)
-            i += 1
-
-    def process_title_page(self, document, paragraphs, i):
-        title_page_content = []
-        i += 1
-        while i < len(paragraphs) and paragraphs[i].strip() != '####END TITLE PAGE####':
-            title_page_content.append(paragraphs[i].strip())
-            i += 1
-        for line in title_page_content:
-            if line.startswith('#'):
-                p = document.add_paragraph(line.lstrip('#').strip(), style='TitleStyle')
-            else:
-                p = document.add_paragraph(line, style='Normal')
-            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        document.add_page_break()
-        return i + 1
-
-    def process_table(self, document, paragraphs, i, parent):
-        table_lines = [paragraphs[i]]
-        i += 1
-        while i < len(paragraphs) and paragraphs[i].strip().startswith('|') and paragraphs[i].strip().endswith('|'):
-            table_lines.append(paragraphs[i].strip())
-            i += 1
-        table = self.parse_markdown_table(table_lines)
-        if table:
-            word_table = document.add_table(rows=len(table), cols=len(table[0]))
-            word_table.style = 'Table Grid'
-            for row_idx, row in enumerate(table):
-                for col_idx, cell in enumerate(row):
-                    word_table.cell(row_idx, col_idx).text = cell
-            for row in word_table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        paragraph.style = document.styles['Normal']
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        return i - 1
-
-    def parse_markdown_table(self, table_lines):
-        try:
-            table = [list(filter(None, line.strip('|').split('|'))) for line in table_lines]
-            if len(table) > 1 and all(cell.strip().startswith('-') for cell in table[1]):
-                table.pop(1)
-            return table
-        except Exception:
-            return None
-
-    def add_runs(self, paragraph, text):
-        parts = re.split(r'(\*\*.*?\*\*|\*.*?\*)', text)
-        for part in parts:
-            if part.startswith('**') and part.endswith('**'):
-                run = paragraph.add_run(part[2:-2])
-                run.bold = True
-            elif part.startswith('*') and part.endswith('*'):
-                run = paragraph.add_run(part[1:-1])
-                run.italic = True
-            else:
-                paragraph.add_run(part)
+        DocxRenderer.for_document(document).render(content)
 
     def add_page_numbers(self, section):
         footer = section.footer
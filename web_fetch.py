@@ -0,0 +1,181 @@
+# web_fetch.py
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from http_client import get_client
+from text_normalize import TextNormalizer
+
+# Bump when page text extraction changes so cached texts are fetched again instead of revalidated
+TEXT_EXTRACTOR_ID = "html/2"
+
+
+def parse_url_list(text: str) -> List[str]:
+    # One URL per line; blank lines, '#' comments and repeats are skipped
+    urls = []
+    seen = set()
+    for line in text.splitlines():
+        url = line.strip()
+        if not url or url.startswith('#') or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+
+class CachedPage(NamedTuple):
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class FetchResult(NamedTuple):
+    url: str
+    text: Optional[str] = None
+    # True when the server answered 304 and the stored text was reused
+    revalidated: bool = False
+    error: Optional[Exception] = None
+
+
+class WebCache:
+    # Extracted page texts with the validators needed to revalidate them; only pages that send an ETag or
+    # Last-Modified are stored, since anything else has to be downloaded again anyway
+    def __init__(self, path: str = 'web_cache.sqlite', max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, extractor TEXT NOT NULL, etag TEXT, last_modified TEXT, content TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, url: str, extractor: str) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified FROM pages WHERE url = ? AND extractor = ?", (url, extractor)
+            ).fetchone()
+        return CachedPage(*row) if row else None
+
+    def put(self, url: str, extractor: str, text: str, etag: Optional[str], last_modified: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, extractor, etag, last_modified, content, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, extractor, etag, last_modified, text, len(text.encode('utf-8')), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url: str):
+        with self._lock:
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self._conn.execute("SELECT url, size FROM pages ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WebFetcher:
+    # Fetches pages through the shared HTTP client (keep-alive pools, retries), at most per_host requests to the
+    # same host at once so a long list from one site does not hammer it
+    def __init__(self, cache: Optional[WebCache] = None, max_workers: int = 16, per_host: int = 4,
+                 normalizer: Optional[TextNormalizer] = None):
+        self.cache = cache if cache is not None else WebCache()
+        # Main content only, with whitespace collapsed; the cache key includes the normalizer's steps
+        self.normalizer = normalizer if normalizer is not None else TextNormalizer()
+        self.extractor_id = f"{TEXT_EXTRACTOR_ID}|{self.normalizer.normalizer_id}"
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        self._host_slots_lock = threading.Lock()
+
+    def fetch_text(self, url: str) -> str:
+        return self._fetch(url)[0]
+
+    def fetch(self, url: str) -> FetchResult:
+        try:
+            text, revalidated = self._fetch(url)
+            return FetchResult(url, text, revalidated)
+        except Exception as e:
+            return FetchResult(url, error=e)
+
+    def fetch_many(self, urls: List[str], progress: Optional[Callable[[int, int, FetchResult], None]] = None) -> List[FetchResult]:
+        # Results come back in the order of urls; progress is called from this thread as each one completes,
+        # and an exception it raises (e.g. a cancelled job) abandons the fetches that have not started
+        if not urls:
+            return []
+        results: Dict[str, FetchResult] = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)), thread_name_prefix="fetch") as pool:
+            futures = {pool.submit(self.fetch, url): url for url in urls}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    results[result.url] = result
+                    if progress:
+                        progress(done, len(urls), result)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return [results[url] for url in urls]
+
+    def _fetch(self, url: str) -> Tuple[str, bool]:
+        cached = self.cache.get(url, self.extractor_id)
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        with self._host_slot(url):
+            response = get_client().get(url, headers=headers)
+            try:
+                if response.status_code == 304 and cached is not None:
+                    self.cache.touch(url)
+                    return cached.text, True
+                response.raise_for_status()
+                content = response.content
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+            finally:
+                response.close()
+        # Parsing happens after the host slot is released; it does not touch the network
+        text = self.normalizer.html_text(content)
+        if etag or last_modified:
+            self.cache.put(url, self.extractor_id, text, etag, last_modified)
+        return text, False
+
+    @contextmanager
+    def _host_slot(self, url: str):
+        host = urlsplit(url).netloc.lower()
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.Semaphore(self.per_host)
+        with slot:
+            yield
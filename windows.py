@@ -1,17 +1,25 @@
 # windows.py
 
 import tkinter as tk
-from tkinter import ttk, simpledialog, messagebox
+from tkinter import ttk, simpledialog, messagebox, filedialog
 from datetime import date, datetime
+import os
 from internet_search import InternetSearch
+from jobs import JobCancelled
+from response_cache import get_cache
+from checkpoints import get_checkpoints
+from web_fetch import parse_url_list
 
 class BaseWindow(tk.Toplevel):
+    modal = True
+
     def __init__(self, parent, title):
         super().__init__(parent)
         self.parent = parent
         self.title(title)
         self.geometry("600x400")
-        self.grab_set()
+        if self.modal:
+            self.grab_set()
         self.create_widgets()
 
     def create_widgets(self):
@@ -22,7 +30,12 @@ class BaseWindow(tk.Toplevel):
 class AutomaticInternetSearchWindow(BaseWindow):
     def __init__(self, parent):
         super().__init__(parent, "Automatic Internet Search")
-        self.internet_search = InternetSearch(self.parent.api_key, self.parent.perplexity_api_key)
+        self.internet_search = InternetSearch(
+            self.parent.api_key, self.parent.perplexity_api_key,
+            search_term_count=self.parent.search_term_count,
+            max_concurrent_searches=self.parent.max_concurrent_searches,
+            search_timeout=self.parent.search_timeout
+        )
         self.update_listbox()
 
     def create_widgets(self):
@@ -38,6 +51,8 @@ class AutomaticInternetSearchWindow(BaseWindow):
 
         self.run_button = ttk.Button(buttons_frame, text="Run Search", command=self.run_search)
         self.run_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(buttons_frame, text="Cancel Search", command=self.cancel_search, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="View Selected", command=self.view_selected).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Move Up", command=lambda: self.move_item(-1)).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Move Down", command=lambda: self.move_item(1)).pack(side=tk.LEFT, padx=5)
@@ -50,30 +65,56 @@ class AutomaticInternetSearchWindow(BaseWindow):
             return
 
         self.run_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
         self.progress_var.set("Generating search terms...")
-        self.update_idletasks()
 
-        search_terms = self.internet_search.generate_search_terms(
-            [instr[1] for instr in self.parent.instructions],
-            [script[1] for script in self.parent.scripts]
+        instructions = [instr[1] for instr in self.parent.instructions]
+        scripts = [script[1] for script in self.parent.scripts]
+        self.search_job = self.parent.jobs.submit(
+            "Internet search", self._search_worker, instructions, scripts,
+            on_success=self._on_search_done, on_error=self._on_search_failed, on_progress=self._on_search_progress
         )
 
-        if not search_terms:
-            messagebox.showinfo("Info", "Failed to generate valid search terms. Please check searchterms.json for the raw API response.")
-            self.run_button.config(state=tk.NORMAL)
-            return
+    def _search_worker(self, job, instructions, scripts):
+        results = self.internet_search.run_pipeline(instructions, scripts, job.report)
+        job.check_cancelled()
+        return results
 
-        self.progress_var.set("Performing internet search...")
-        self.update_idletasks()
+    def _on_search_progress(self, job, message, data):
+        if message and self.winfo_exists():
+            self.progress_var.set(message)
 
-        results = self.internet_search.perform_internet_search(search_terms)
+    def _on_search_done(self, results):
+        if results is None:
+            messagebox.showinfo("Info", "Failed to generate valid search terms. Please check searchterms.json for the raw API response.")
+        else:
+            self.parent.file_handler.set_internet_search_results(self.parent, results)
+            self.parent.update_system_prompt()
+            failed = self.internet_search.failed_search_terms
+            if failed:
+                failed_terms = "\n".join(f"- {term}: {error}" for term, error in failed)
+                messagebox.showwarning("Warning", f"{len(failed)} search(es) failed and were skipped:\n{failed_terms}")
+        if self.winfo_exists():
+            self.progress_var.set("Search completed." if results is not None else "")
+            self._reset_search_buttons()
+            self.update_listbox()
 
-        self.parent.internet_search_results = results
-        self.progress_var.set("Search completed.")
+    def _on_search_failed(self, error):
+        if not isinstance(error, JobCancelled):
+            messagebox.showerror("Error", f"Error during internet search: {error}")
+        if self.winfo_exists():
+            self.progress_var.set("Search cancelled." if isinstance(error, JobCancelled) else "Search failed.")
+            self._reset_search_buttons()
+
+    def _reset_search_buttons(self):
         self.run_button.config(state=tk.NORMAL)
-        self.update_listbox()
-        self.parent.update_system_prompt()
-        self.parent.file_handler.save_internet_search_results(self.parent)  # Update this line
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def cancel_search(self):
+        job = getattr(self, 'search_job', None)
+        if job and not job.finished:
+            job.cancel()
+            self.progress_var.set("Cancelling...")
 
     def view_selected(self):
         selection = self.search_listbox.curselection()
@@ -84,9 +125,8 @@ class AutomaticInternetSearchWindow(BaseWindow):
     def delete_selected(self):
         selection = self.search_listbox.curselection()
         if selection:
-            del self.parent.internet_search_results[selection[0]]  # Update this line
+            self.parent.file_handler.delete_item(self.parent, 'internet_search_results', selection[0])
             self.update_listbox()
-            self.parent.file_handler.save_internet_search_results(self.parent)  # Update this line
 
     def update_listbox(self):
         self.search_listbox.delete(0, tk.END)
@@ -101,12 +141,9 @@ class AutomaticInternetSearchWindow(BaseWindow):
         selection = self.search_listbox.curselection()
         if selection:
             index = selection[0]
-            if 0 <= index + direction < len(self.parent.internet_search_results):
-                self.parent.internet_search_results[index], self.parent.internet_search_results[index + direction] = \
-                    self.parent.internet_search_results[index + direction], self.parent.internet_search_results[index]
+            if self.parent.file_handler.move_item(self.parent, 'internet_search_results', index, direction):
                 self.update_listbox()
                 self.search_listbox.select_set(index + direction)
-                self.parent.file_handler.save_internet_search_results(self.parent)
 
     def on_close(self):
         self.parent.update_system_prompt()
@@ -114,6 +151,166 @@ class AutomaticInternetSearchWindow(BaseWindow):
         self.destroy()
 
 
+def ask_add_duplicates(title, duplicates):
+    # duplicates are (label, (name, similarity)) pairs; True when the user wants them added anyway
+    lines = [f"{label} ({similarity:.0%} similar to {name})" for label, (name, similarity) in duplicates[:10]]
+    if len(duplicates) > 10:
+        lines.append(f"... and {len(duplicates) - 10} more")
+    return messagebox.askyesno(title, "These nearly repeat items already in the project:\n\n" + "\n".join(lines)
+                               + "\n\nAdd them anyway?")
+
+
+def submit_upload_job(window, name, file_paths, add_document, collection=None):
+    # With a collection, files that nearly repeat something already in the corpus are listed and only added
+    # when the user confirms
+    app = window.parent
+    file_paths = list(file_paths)
+    corpus = app.file_handler.corpus_snapshot(app) if collection else None
+
+    def worker(job):
+        job.report(f"Extracting {len(file_paths)} file(s)...")
+
+        def progress(done, total):
+            job.report(f"Extracting {len(file_paths)} file(s): page {done}/{total}")
+
+        # Files that cannot be read are listed afterwards; the others are still added
+        documents = []
+        failed = []
+        for file_path, (text, error) in zip(file_paths, app.file_handler.read_files(file_paths, progress)):
+            if error is None:
+                documents.append((os.path.basename(file_path), text))
+            else:
+                failed.append(f"{os.path.basename(file_path)}: {error}")
+        if not collection:
+            return [(document, None) for document in documents], failed
+        job.report("Checking for duplicates...")
+        checked = []
+        for document in documents:
+            duplicate = app.file_handler.find_near_duplicate(corpus, collection, document)
+            if duplicate is None:
+                # Later files in the same upload are compared against this one too
+                corpus[collection].append(document)
+            checked.append((document, duplicate))
+        return checked, failed
+
+    def on_success(result):
+        documents, failed = result
+        duplicates = [(file_name, duplicate) for (file_name, _), duplicate in documents if duplicate]
+        add_duplicates = bool(duplicates) and ask_add_duplicates("Possible Duplicates", duplicates)
+        for (file_name, text), duplicate in documents:
+            if duplicate is None or add_duplicates:
+                add_document(app, file_name, text)
+        if window.winfo_exists():
+            window.update_listbox()
+        if failed:
+            messagebox.showerror("Error", "Error reading file(s):\n\n" + "\n".join(failed))
+
+    def on_error(error):
+        if not isinstance(error, JobCancelled):
+            messagebox.showerror("Error", f"Error reading file: {error}")
+
+    return app.jobs.submit(name, worker, on_success=on_success, on_error=on_error)
+
+
+class JobsWindow(BaseWindow):
+    modal = False
+
+    def __init__(self, parent):
+        super().__init__(parent, "Background Jobs")
+        self.parent.jobs.add_listener(self.update_tree)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.update_tree()
+        self.refresh_elapsed()
+
+    def create_widgets(self):
+        columns = ("name", "status", "elapsed", "message")
+        self.jobs_tree = ttk.Treeview(self, columns=columns, show="headings", height=15)
+        for column, heading, width in [("name", "Job", 180), ("status", "Status", 80), ("elapsed", "Time", 60), ("message", "Progress", 260)]:
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, anchor=tk.W)
+        self.jobs_tree.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+
+        buttons_frame = ttk.Frame(self)
+        buttons_frame.pack(pady=10, fill=tk.X)
+
+        buttons = [
+            ("Cancel Selected", self.cancel_selected),
+            ("Clear Finished", self.clear_finished),
+            ("Close", self.on_close)
+        ]
+
+        for text, command in buttons:
+            ttk.Button(buttons_frame, text=text, command=command).pack(side=tk.LEFT, padx=5)
+
+    def update_tree(self):
+        selection = self.jobs_tree.selection()
+        self.jobs_tree.delete(*self.jobs_tree.get_children())
+        for job in self.parent.jobs.jobs:
+            self.jobs_tree.insert("", tk.END, iid=str(job.job_id), values=(job.name, job.status, f"{job.elapsed:.1f}s", job.message))
+        existing = [iid for iid in selection if self.jobs_tree.exists(iid)]
+        if existing:
+            self.jobs_tree.selection_set(existing)
+
+    def refresh_elapsed(self):
+        if any(not job.finished for job in self.parent.jobs.jobs):
+            self.update_tree()
+        self._refresh_id = self.after(500, self.refresh_elapsed)
+
+    def cancel_selected(self):
+        selected = set(self.jobs_tree.selection())
+        for job in self.parent.jobs.jobs:
+            if str(job.job_id) in selected and not job.finished:
+                job.cancel()
+
+    def clear_finished(self):
+        self.parent.jobs.clear_finished()
+
+    def on_close(self):
+        self.parent.jobs.remove_listener(self.update_tree)
+        self.after_cancel(self._refresh_id)
+        self.destroy()
+
+
+class TokenBudgetWindow(BaseWindow):
+    def __init__(self, parent):
+        super().__init__(parent, "Token Budget")
+        self.geometry("700x520")
+
+    def create_widgets(self):
+        self.parent.update_system_prompt()
+        pack = self.parent.last_pack
+
+        self.summary_var = tk.StringVar(value=f"Estimated input: {pack.total_tokens:,} of {pack.budget:,} tokens (template: {pack.template_tokens:,})")
+        ttk.Label(self, textvariable=self.summary_var).pack(pady=(10, 0))
+        ttk.Label(self, text=self.parent.file_handler.normalizer.report.summary()).pack()
+        ttk.Label(self, text=self.parent.prompt_builder.timings_summary()).pack()
+        ttk.Label(self, text=get_cache().summary()).pack()
+        ttk.Label(self, text=self.parent.file_handler.extraction_cache.summary()).pack()
+
+        columns = ("collection", "name", "tokens", "status")
+        budget_tree = ttk.Treeview(self, columns=columns, show="headings", height=15)
+        for column, heading, width in [("collection", "Type", 140), ("name", "Document", 300), ("tokens", "Tokens", 120), ("status", "Status", 80)]:
+            budget_tree.heading(column, text=heading)
+            budget_tree.column(column, width=width, anchor=tk.W)
+        for entry in pack.entries:
+            tokens = f"{entry.kept_tokens:,}" if entry.kept_tokens == entry.tokens else f"{entry.tokens:,} -> {entry.kept_tokens:,}"
+            budget_tree.insert("", tk.END, values=(entry.collection.replace('_', ' '), entry.name, tokens, entry.status))
+        budget_tree.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+
+        budget_frame = ttk.Frame(self)
+        budget_frame.pack(pady=10)
+        ttk.Label(budget_frame, text="Max input tokens:").pack(side=tk.LEFT, padx=5)
+        self.max_input_tokens_var = tk.IntVar(value=self.parent.max_input_tokens)
+        ttk.Spinbox(budget_frame, from_=1000, to=1000000, increment=1000, textvariable=self.max_input_tokens_var, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(budget_frame, text="Save", command=self.save_budget).pack(side=tk.LEFT, padx=5)
+        ttk.Button(budget_frame, text="Close", command=self.destroy).pack(side=tk.LEFT, padx=5)
+
+    def save_budget(self):
+        self.parent.max_input_tokens = self.max_input_tokens_var.get()
+        self.parent.save_all_settings()
+        self.destroy()
+
+
 class ViewSourceWindow(BaseWindow):
     def __init__(self, parent, source):
         self.source = source  # Set the source attribute before calling super().__init__
@@ -147,7 +344,7 @@ class ViewSourceWindow(BaseWindow):
         ttk.Label(scrollable_frame, text="Content:", font=("TkDefaultFont", 10, "bold")).pack(anchor="w", pady=(10, 0))
         content_text = tk.Text(scrollable_frame, wrap=tk.WORD, width=90, height=20)
         content_text.pack(pady=(0, 10))
-        content_text.insert(tk.END, self.source.get('content', 'No content available'))
+        content_text.insert(tk.END, self.source.get('content') or 'No content available')
         content_text.config(state=tk.DISABLED)
 
         canvas.pack(side="left", fill="both", expand=True)
@@ -158,6 +355,7 @@ class ViewSourceWindow(BaseWindow):
 class SettingsWindow(BaseWindow):
     def __init__(self, parent):
         super().__init__(parent, "Settings")
+        self.geometry("600x720")
 
     def create_widgets(self):
         main_frame = ttk.Frame(self, padding="20")
@@ -185,12 +383,60 @@ class SettingsWindow(BaseWindow):
             
             setattr(self, f"{attr_name}_entry", entry)
 
-        ttk.Button(main_frame, text="Save", command=self.save_settings).grid(row=len(fields), column=0, pady=20)
-        ttk.Button(main_frame, text="Close", command=self.destroy).grid(row=len(fields), column=1, pady=20)
+        self.stream_output_var = tk.BooleanVar(value=self.parent.stream_output)
+        ttk.Checkbutton(main_frame, text="Stream output while generating", variable=self.stream_output_var).grid(row=len(fields), column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        self.use_response_cache_var = tk.BooleanVar(value=self.parent.use_response_cache)
+        ttk.Checkbutton(main_frame, text="Reuse cached API responses for identical requests", variable=self.use_response_cache_var).grid(row=len(fields) + 1, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        self.use_checkpoints_var = tk.BooleanVar(value=self.parent.use_checkpoints)
+        ttk.Checkbutton(main_frame, text="Resume failed searches and sectioned papers from saved progress", variable=self.use_checkpoints_var).grid(row=len(fields) + 2, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        self.use_retrieval_var = tk.BooleanVar(value=self.parent.use_retrieval)
+        ttk.Checkbutton(main_frame, text="Send only the passages most relevant to the instructions", variable=self.use_retrieval_var).grid(row=len(fields) + 3, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        ttk.Label(main_frame, text="Passages to send:").grid(row=len(fields) + 4, column=0, sticky=tk.W, pady=5)
+        self.retrieval_top_k_var = tk.IntVar(value=self.parent.retrieval_top_k)
+        ttk.Spinbox(main_frame, from_=1, to=500, textvariable=self.retrieval_top_k_var, width=10).grid(row=len(fields) + 4, column=1, sticky=tk.W, pady=5)
+
+        self.sectioned_var = tk.BooleanVar(value=self.parent.generation_mode == "sectioned")
+        ttk.Checkbutton(main_frame, text="Write long papers chapter by chapter from an outline", variable=self.sectioned_var).grid(row=len(fields) + 5, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        ttk.Label(main_frame, text="Chapters written in parallel:").grid(row=len(fields) + 6, column=0, sticky=tk.W, pady=5)
+        self.max_parallel_sections_var = tk.IntVar(value=self.parent.max_parallel_sections)
+        ttk.Spinbox(main_frame, from_=1, to=16, textvariable=self.max_parallel_sections_var, width=10).grid(row=len(fields) + 6, column=1, sticky=tk.W, pady=5)
+
+        ttk.Label(main_frame, text="Search terms to generate:").grid(row=len(fields) + 7, column=0, sticky=tk.W, pady=5)
+        self.search_term_count_var = tk.IntVar(value=self.parent.search_term_count)
+        ttk.Spinbox(main_frame, from_=1, to=50, textvariable=self.search_term_count_var, width=10).grid(row=len(fields) + 7, column=1, sticky=tk.W, pady=5)
+
+        ttk.Label(main_frame, text="Searches run in parallel:").grid(row=len(fields) + 8, column=0, sticky=tk.W, pady=5)
+        self.max_concurrent_searches_var = tk.IntVar(value=self.parent.max_concurrent_searches)
+        ttk.Spinbox(main_frame, from_=1, to=16, textvariable=self.max_concurrent_searches_var, width=10).grid(row=len(fields) + 8, column=1, sticky=tk.W, pady=5)
+
+        ttk.Label(main_frame, text="Time limit per search (seconds):").grid(row=len(fields) + 9, column=0, sticky=tk.W, pady=5)
+        self.search_timeout_var = tk.IntVar(value=self.parent.search_timeout)
+        ttk.Spinbox(main_frame, from_=10, to=600, increment=10, textvariable=self.search_timeout_var, width=10).grid(row=len(fields) + 9, column=1, sticky=tk.W, pady=5)
+
+        ttk.Button(main_frame, text="Save", command=self.save_settings).grid(row=len(fields) + 10, column=0, pady=20)
+        ttk.Button(main_frame, text="Close", command=self.destroy).grid(row=len(fields) + 10, column=1, pady=20)
 
     def save_settings(self):
         for attr in ['api_key', 'perplexity_api_key', 'first_name', 'last_name', 'date']:
             setattr(self.parent, attr, getattr(self, f"{attr}_entry").get().strip())
+        self.parent.stream_output = self.stream_output_var.get()
+        self.parent.use_response_cache = self.use_response_cache_var.get()
+        get_cache().enabled = self.parent.use_response_cache
+        self.parent.use_checkpoints = self.use_checkpoints_var.get()
+        get_checkpoints().enabled = self.parent.use_checkpoints
+        self.parent.use_retrieval = self.use_retrieval_var.get()
+        self.parent.refresh_retrieval_index()
+        self.parent.retrieval_top_k = self.retrieval_top_k_var.get()
+        self.parent.generation_mode = "sectioned" if self.sectioned_var.get() else "single"
+        self.parent.max_parallel_sections = self.max_parallel_sections_var.get()
+        self.parent.search_term_count = self.search_term_count_var.get()
+        self.parent.max_concurrent_searches = self.max_concurrent_searches_var.get()
+        self.parent.search_timeout = self.search_timeout_var.get()
         self.parent.save_all_settings()
         self.destroy()
 
@@ -312,9 +558,8 @@ class ScriptsWindow(BaseWindow):
 
     def upload_script(self):
         file_paths = self.parent.file_handler.get_file_paths("Select Script(s) or Paper(s)")
-        for file_path in file_paths:
-            self.parent.file_handler.upload_script(self.parent, file_path)
-        self.update_listbox()
+        if file_paths:
+            submit_upload_job(self, "Upload scripts", file_paths, self.parent.file_handler.add_script, 'scripts')
 
     def add_text(self):
         AddTextWindow(self, "script")
@@ -329,19 +574,15 @@ class ScriptsWindow(BaseWindow):
         selection = self.scripts_listbox.curselection()
         if selection:
             index = selection[0]
-            if 0 <= index + direction < len(self.parent.scripts):
-                self.parent.scripts[index], self.parent.scripts[index + direction] = \
-                    self.parent.scripts[index + direction], self.parent.scripts[index]
+            if self.parent.file_handler.move_item(self.parent, 'scripts', index, direction):
                 self.update_listbox()
                 self.scripts_listbox.select_set(index + direction)
-                self.parent.file_handler.save_script_texts(self.parent)
 
     def delete_selected(self):
         selection = self.scripts_listbox.curselection()
         if selection:
-            del self.parent.scripts[selection[0]]
+            self.parent.file_handler.delete_item(self.parent, 'scripts', selection[0])
             self.update_listbox()
-            self.parent.file_handler.save_script_texts(self.parent)
 
     def update_listbox(self):
         self.scripts_listbox.delete(0, tk.END)
@@ -380,9 +621,8 @@ class InstructionsWindow(BaseWindow):
 
     def upload_instruction(self):
         file_paths = self.parent.file_handler.get_file_paths("Select Instruction File(s)")
-        for file_path in file_paths:
-            self.parent.file_handler.upload_instruction(self.parent, file_path)
-        self.update_listbox()
+        if file_paths:
+            submit_upload_job(self, "Upload instructions", file_paths, self.parent.file_handler.add_instruction)
 
     def add_text(self):
         AddTextWindow(self, "instruction")
@@ -397,19 +637,15 @@ class InstructionsWindow(BaseWindow):
         selection = self.instructions_listbox.curselection()
         if selection:
             index = selection[0]
-            if 0 <= index + direction < len(self.parent.instructions):
-                self.parent.instructions[index], self.parent.instructions[index + direction] = \
-                    self.parent.instructions[index + direction], self.parent.instructions[index]
+            if self.parent.file_handler.move_item(self.parent, 'instructions', index, direction):
                 self.update_listbox()
                 self.instructions_listbox.select_set(index + direction)
-                self.parent.file_handler.save_internet_search_results(self.parent)
 
     def delete_selected(self):
         selection = self.instructions_listbox.curselection()
         if selection:
-            del self.parent.instructions[selection[0]]
+            self.parent.file_handler.delete_item(self.parent, 'instructions', selection[0])
             self.update_listbox()
-            self.parent.file_handler.save_instruction_texts(self.parent)
 
     def update_listbox(self):
         self.instructions_listbox.delete(0, tk.END)
@@ -435,6 +671,7 @@ class InternetSourcesWindow(BaseWindow):
 
         buttons = [
             ("Add Link", self.add_link),
+            ("Bulk Import", self.bulk_import),
             ("Move Up", self.move_up),
             ("Move Down", self.move_down),
             ("Delete Selected", self.delete_selected),
@@ -447,6 +684,9 @@ class InternetSourcesWindow(BaseWindow):
     def add_link(self):
         AddLinkWindow(self)
 
+    def bulk_import(self):
+        BulkImportWindow(self)
+
     def move_up(self):
         self.move_item(-1)
 
@@ -457,23 +697,15 @@ class InternetSourcesWindow(BaseWindow):
         selection = self.internet_listbox.curselection()
         if selection:
             index = selection[0]
-            if 0 <= index + direction < len(self.parent.internet_sources):
-                self.parent.internet_sources[index], self.parent.internet_sources[index + direction] = \
-                    self.parent.internet_sources[index + direction], self.parent.internet_sources[index]
+            if self.parent.file_handler.move_item(self.parent, 'internet_sources', index, direction):
                 self.update_listbox()
                 self.internet_listbox.select_set(index + direction)
-                self.parent.file_handler.save_internet_sources(self.parent)
 
     def delete_selected(self):
         selection = self.internet_listbox.curselection()
         if selection:
-            index = selection[0]
-            if 0 <= index + direction < len(self.parent.internet_sources):
-                self.parent.internet_sources[index], self.parent.internet_sources[index + direction] = \
-                    self.parent.internet_sources[index + direction], self.parent.internet_sources[index]
-                self.update_listbox()
-                self.internet_listbox.select_set(index + direction)
-            self.parent.file_handler.save_internet_sources(self.parent)
+            self.parent.file_handler.delete_item(self.parent, 'internet_sources', selection[0])
+            self.update_listbox()
 
     def update_listbox(self):
         self.internet_listbox.delete(0, tk.END)
@@ -511,7 +743,8 @@ class AddLinkWindow(BaseWindow):
         buttons_frame = ttk.Frame(main_frame)
         buttons_frame.grid(row=3, column=0, columnspan=2, pady=10)
 
-        ttk.Button(buttons_frame, text="OK", command=self.save_link).pack(side=tk.LEFT, padx=5)
+        self.ok_button = ttk.Button(buttons_frame, text="OK", command=self.save_link)
+        self.ok_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Cancel", command=self.destroy).pack(side=tk.LEFT, padx=5)
 
     def save_link(self):
@@ -523,20 +756,167 @@ class AddLinkWindow(BaseWindow):
             messagebox.showerror("Error", "Please fill in all fields.")
             return
 
-        content = self.parent.parent.file_handler.scrape_webpage(url)
-        if content is None:
+        app = self.parent.parent
+        self.ok_button.config(state=tk.DISABLED)
+
+        corpus = app.file_handler.corpus_snapshot(app)
+
+        def worker(job):
+            source = {
+                'url': url,
+                'author': author,
+                'date': date,
+                'content': app.file_handler.fetch_webpage_text(url)
+            }
+            return source, app.file_handler.find_near_duplicate(corpus, 'internet_sources', source)
+
+        def on_success(checked):
+            source, duplicate = checked
+            if duplicate and not messagebox.askyesno(
+                    "Possible Duplicate", f"This page is {duplicate[1]:.0%} similar to {duplicate[0]}. Add it anyway?"):
+                if self.winfo_exists():
+                    self.ok_button.config(state=tk.NORMAL)
+                return
+            app.file_handler.add_internet_source(app, source)
+            if self.parent.winfo_exists():
+                self.parent.update_listbox()
+            if self.winfo_exists():
+                self.destroy()
+
+        def on_error(error):
+            if not isinstance(error, JobCancelled):
+                messagebox.showerror("Error", f"Error fetching web page: {error}")
+            if self.winfo_exists():
+                self.ok_button.config(state=tk.NORMAL)
+
+        app.jobs.submit(f"Fetch {url}", worker, on_success=on_success, on_error=on_error)
+
+class BulkImportWindow(BaseWindow):
+    def __init__(self, parent):
+        super().__init__(parent, "Bulk Import Internet Sources")
+        self.geometry("600x450")
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding="10")
+        main_frame.pack(expand=True, fill=tk.BOTH)
+
+        ttk.Label(main_frame, text="URLs (one per line):").pack(anchor=tk.W)
+        self.urls_text = tk.Text(main_frame, wrap=tk.NONE, width=70, height=12)
+        self.urls_text.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        fields_frame = ttk.Frame(main_frame)
+        fields_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(fields_frame, text="Author:").grid(row=0, column=0, sticky=tk.W, pady=2)
+        self.author_entry = ttk.Entry(fields_frame, width=40)
+        self.author_entry.grid(row=0, column=1, sticky=tk.W, pady=2)
+        ttk.Label(fields_frame, text="Date (YYYY-MM-DD):").grid(row=1, column=0, sticky=tk.W, pady=2)
+        self.date_entry = ttk.Entry(fields_frame, width=20)
+        self.date_entry.grid(row=1, column=1, sticky=tk.W, pady=2)
+        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.pack(anchor=tk.W, pady=5)
+
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.pack(pady=5)
+        ttk.Button(buttons_frame, text="Load File", command=self.load_file).pack(side=tk.LEFT, padx=5)
+        self.import_button = ttk.Button(buttons_frame, text="Import", command=self.start_import)
+        self.import_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT, padx=5)
+        self.job = None
+
+    def load_file(self):
+        path = filedialog.askopenfilename(title="Load URL List", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.urls_text.insert(tk.END, f.read().strip() + "\n")
+            except OSError as e:
+                messagebox.showerror("Error", f"Error reading file: {e}")
+
+    def start_import(self):
+        author = self.author_entry.get().strip()
+        date = self.date_entry.get().strip()
+        app = self.parent.parent
+        # URLs that are already sources are not fetched again
+        existing = {source['url'] for source in app.internet_sources}
+        urls = [url for url in parse_url_list(self.urls_text.get(1.0, tk.END)) if url not in existing]
+
+        if not urls or not author or not date:
+            messagebox.showerror("Error", "Please enter at least one new URL, an author and a date.")
             return
 
-        source = {
-            'url': url,
-            'author': author,
-            'date': date,
-            'content': content
-        }
+        self.import_button.config(state=tk.DISABLED)
+        fetcher = app.file_handler.web_fetcher
+        corpus = app.file_handler.corpus_snapshot(app)
+
+        def worker(job):
+            results = fetcher.fetch_many(urls, lambda done, total, result: job.report(f"{done}/{total} fetched"))
+            job.report("Checking for duplicates...")
+            checked = []
+            for result in results:
+                source = duplicate = None
+                if result.error is None:
+                    source = {'url': result.url, 'author': author, 'date': date, 'content': result.text}
+                    duplicate = app.file_handler.find_near_duplicate(corpus, 'internet_sources', source)
+                    if duplicate is None:
+                        corpus['internet_sources'].append(source)
+                checked.append((result, source, duplicate))
+            return checked
+
+        def on_progress(job, message, data):
+            if self.winfo_exists():
+                self.status_label.config(text=message)
+
+        def on_success(checked):
+            self.job = None
+            results = [result for result, _, _ in checked]
+            flagged = [(result.url, duplicate) for result, _, duplicate in checked if duplicate]
+            add_duplicates = bool(flagged) and ask_add_duplicates("Possible Duplicates", flagged)
+            duplicates = []
+            for result, source, duplicate in checked:
+                if source is None:
+                    continue
+                if duplicate and not add_duplicates:
+                    duplicates.append(f"{result.url} ({duplicate[1]:.0%} similar to {duplicate[0]})")
+                    continue
+                app.file_handler.add_internet_source(app, source)
+            failed = [result for result in results if result.error is not None]
+            unchanged = sum(1 for result in results if result.revalidated)
+            if self.parent.winfo_exists():
+                self.parent.update_listbox()
+            summary = (f"Imported {len(results) - len(failed) - len(duplicates)} of {len(results)} sources "
+                       f"({unchanged} unchanged since last fetch).")
+            if duplicates:
+                summary += "\n\nSkipped as near-duplicates:\n" + "\n".join(duplicates[:10])
+                if len(duplicates) > 10:
+                    summary += f"\n... and {len(duplicates) - 10} more"
+            if failed:
+                summary += "\n\nFailed:\n" + "\n".join(f"{result.url}: {result.error}" for result in failed[:10])
+                if len(failed) > 10:
+                    summary += f"\n... and {len(failed) - 10} more"
+                messagebox.showwarning("Bulk Import", summary)
+            else:
+                messagebox.showinfo("Bulk Import", summary)
+            if self.winfo_exists():
+                self.destroy()
 
-        self.parent.parent.internet_sources.append(source)
-        self.parent.parent.file_handler.save_internet_sources(self.parent.parent)
-        self.parent.update_listbox()
+        def on_error(error):
+            self.job = None
+            if not isinstance(error, JobCancelled):
+                messagebox.showerror("Error", f"Error importing sources: {error}")
+            if self.winfo_exists():
+                self.import_button.config(state=tk.NORMAL)
+                self.status_label.config(text="")
+
+        self.job = app.jobs.submit(
+            f"Import {len(urls)} sources", worker,
+            on_success=on_success, on_error=on_error, on_progress=on_progress
+        )
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
         self.destroy()
 
 class AddTextWindow(BaseWindow):
@@ -565,11 +945,9 @@ class AddTextWindow(BaseWindow):
             return
 
         if self.text_type == "script":
-            self.parent.parent.scripts.append((title, text))
-            self.parent.parent.file_handler.save_script_texts(self.parent.parent)
+            self.parent.parent.file_handler.add_script(self.parent.parent, title, text)
         elif self.text_type == "instruction":
-            self.parent.parent.instructions.append((title, text))
-            self.parent.parent.file_handler.save_instruction_texts(self.parent.parent)
+            self.parent.parent.file_handler.add_instruction(self.parent.parent, title, text)
 
         self.parent.update_listbox()
         self.destroy()